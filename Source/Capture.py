@@ -0,0 +1,49 @@
+import gzip
+import json
+import time
+from threading import Lock
+
+
+class CaptureWriter:
+    """Record feed messages to a gzipped file, for replaying them later
+
+    Each message is written as a JSON array [time, feed name, message] on
+    a line of its own, with the time.time() it was received. Appends to an
+    existing capture; read it back with read_capture().
+
+    """
+
+    def __init__(self, filename, clock=time.time):
+        self.filename = filename
+        self.frames = 0
+        self._clock = clock
+        self._file = gzip.open(filename, "at", encoding="utf-8")
+        self._lock = Lock()
+
+    def record(self, feed, message):
+        if isinstance(message, bytes):
+            message = message.decode("utf-8", "replace")
+        line = json.dumps([round(self._clock(), 3), feed, message], ensure_ascii=False)
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.write(line + "\n")
+            self.frames += 1
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def read_capture(filename):
+    """Yield the (time, feed name, message) tuples of a capture"""
+    with gzip.open(filename, "rt", encoding="utf-8") as capture:
+        try:
+            for line in capture:
+                timestamp, feed, message = json.loads(line)
+                yield timestamp, feed, message
+        except (EOFError, ValueError):
+            # the end of a capture cut short by a crash
+            return
@@ -11,6 +11,8 @@ import logging
 
 from BotpySE import Command, Utilities
 
+import Version
+
 
 class CommandUpdate(Command):
     @staticmethod
@@ -20,5 +22,7 @@ class CommandUpdate(Command):
     def run(self):
         logging.warn("UPDATE")
         subprocess.call(['git', 'pull', 'origin', 'master'])
+        # the version changed, look it up again when rebooting
+        Version.forget()
         self.reply("Updating...")
         Utilities.StopReason.reboot = True
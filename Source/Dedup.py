@@ -0,0 +1,71 @@
+import time
+from collections import OrderedDict
+from hashlib import blake2b
+from threading import Lock
+
+from Metrics import DEDUP_EVICTIONS, DEDUP_HITS
+
+
+def fingerprint(message):
+    """A short digest identifying message"""
+    if isinstance(message, str):
+        message = message.encode("utf-8", "surrogatepass")
+    return blake2b(message, digest_size=16).digest()
+
+
+class DedupCache:
+    """Remember recent messages to recognize repeats of them
+
+    A message counts as a duplicate for ttl seconds after it was first
+    seen. At most maxsize fingerprints are kept; beyond that the oldest
+    are evicted early. hits counts the duplicates, expired and evicted
+    the fingerprints dropped after their ttl and for lack of room.
+
+    """
+
+    def __init__(self, ttl=600, maxsize=10000, name="feed", clock=time.monotonic):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.hits = 0
+        self.expired = 0
+        self.evicted = 0
+        self._clock = clock
+        # fingerprint: expiry time, in order of expiry as the ttl is fixed
+        self._expiry = OrderedDict()
+        self._lock = Lock()
+        self._hits = DEDUP_HITS.labels(name)
+        self._expirations = DEDUP_EVICTIONS.labels(name, "expired")
+        self._evictions = DEDUP_EVICTIONS.labels(name, "full")
+
+    def __len__(self):
+        return len(self._expiry)
+
+    def _expire(self, now):
+        expiry = self._expiry
+        expired = 0
+        while expiry:
+            key, expires = next(iter(expiry.items()))
+            if expires > now:
+                break
+            del expiry[key]
+            expired += 1
+        if expired:
+            self.expired += expired
+            self._expirations.inc(expired)
+
+    def seen(self, message):
+        """Whether message was seen before; remembers it if it wasn't"""
+        key = fingerprint(message)
+        with self._lock:
+            now = self._clock()
+            self._expire(now)
+            if key in self._expiry:
+                self.hits += 1
+                self._hits.inc()
+                return True
+            self._expiry[key] = now + self.ttl
+            if len(self._expiry) > self.maxsize:
+                self._expiry.popitem(last=False)
+                self.evicted += 1
+                self._evictions.inc()
+            return False
@@ -0,0 +1,188 @@
+import json
+import logging
+import time
+from functools import partial
+
+from Dedup import DedupCache
+from Matching import MatchEngine
+from Metrics import DEEPSMOKE_SCORE
+from Sender import send_result
+from WebsocketListener import WebsocketListener
+
+
+# name: Feed subclass
+FEEDS = {}
+
+
+def register(feed_class):
+    """Class decorator adding a Feed to FEEDS under its name"""
+    FEEDS[feed_class.name] = feed_class
+    return feed_class
+
+
+def configure(spec):
+    """Feeds from a comma separated list of their names
+
+    Each name can be followed by =url to listen to the feed at another
+    url, for example "halflife=ws://localhost:8888/,deepsmoke".
+
+    """
+    feeds = []
+    for item in spec.split(","):
+        name, _, url = item.strip().partition("=")
+        if name not in FEEDS:
+            raise ValueError("Unknown feed {0!r}, known feeds are {1}".format(
+                name, ", ".join(FEEDS)))
+        feeds.append(FEEDS[name](url or None))
+    return feeds
+
+
+class Report:
+    """A message to post: to the report rooms, or else the error room"""
+
+    __slots__ = ("text", "error")
+
+    def __init__(self, text, error=False):
+        self.text = text
+        self.error = error
+
+
+class Feed:
+    """A websocket feed of posts to report
+
+    Subclasses declare the name and url of the feed, and turn its messages
+    into a Report with parse(), or None to ignore them. Reports are matched
+    against the tags (unless tag is False) and notifications, and posted
+    with prefix prepended; error reports are posted to the error room as
+    they are. With dedup, repeated messages are dropped before parsing.
+
+    """
+
+    name = None
+    url = None
+    prefix = ""
+    tag = True
+    dedup = True
+
+    def __init__(self, url=None):
+        if url is not None:
+            self.url = url
+
+    def parse(self, message):
+        return Report(message)
+
+
+@register
+class HalflifeFeed(Feed):
+    name = "halflife"
+    url = "ws://ec2-52-208-37-129.eu-west-1.compute.amazonaws.com:8888/"
+
+
+@register
+class DeepSmokeFeed(Feed):
+    """Posts DeepSmoke scores as likely spam
+
+    Posts scoring above report_score are reported, unless they are on one
+    of the excluded sites; others above error_score go to the error room.
+
+    """
+
+    name = "deepsmoke"
+    url = "ws://smokey-deepsmoke2903.cloudapp.net:8888/"
+    prefix = "[ [DeepSmoke](https://git.io/vdlxx) | [PM](https://git.io/vdlx5) ] "
+    tag = False
+    dedup = False
+
+    def __init__(
+        self,
+        url=None,
+        excluded_sites=(
+            "ru.stackoverflow.com", "ja.stackoverflow.com", "rus.stackexchange.com"),
+        report_score=0.9,
+        error_score=0.7,
+    ):
+        super().__init__(url)
+        self.excluded_sites = frozenset(excluded_sites)
+        self.report_score = report_score
+        self.error_score = error_score
+
+    def get_link(self, data):
+        return "https://{0}/q/{1}".format(data["site"], data["question_id"])
+
+    def parse(self, message):
+        data = json.loads(message)
+        ds = data['deepsmoke'][0]
+        score = data['deepsmoke'][1]['score']
+
+        DEEPSMOKE_SCORE.observe(score)
+        logging.debug("Post score: " + str(score))
+
+        text = (
+            "Potential spam because of deepsmoke analysis: [" + data['title'] + "]("
+            + self.get_link(data) + ") on `" + data['site'] + "` with score `"
+            + str(score) + "`")
+        if ds and score > self.report_score and data['site'] not in self.excluded_sites:
+            return Report(text)
+        elif score > self.error_score:
+            return Report(text, error=True)
+        return None
+
+
+class FeedDispatcher:
+    """Listen to feeds, posting their reports to chat
+
+    All feeds share one matching engine and the rooms' send queues: each
+    message is parsed by its feed, matched once for all report rooms, and
+    queued for each of them. With a capture (a CaptureWriter), the raw
+    messages of all feeds are recorded as they arrive.
+
+    """
+
+    def __init__(
+        self, error_room, report_rooms, notifications=None, tags=None, capture=None,
+    ):
+        self.error_room = error_room
+        self.report_rooms = report_rooms
+        self.engine = MatchEngine(tags, notifications)
+        self.capture = capture
+        self._room_ids = [each_room.id for each_room in report_rooms]
+        self.feeds = []
+        self.listeners = []
+        self._dedup = {}
+
+    def add(self, feed):
+        """Listen to a Feed once started"""
+        self.feeds.append(feed)
+        if feed.dedup:
+            # the feed can repeat messages after reconnecting
+            self._dedup[feed.name] = DedupCache(name=feed.name)
+        self.listeners.append(
+            WebsocketListener(feed.url, partial(self.on_message_handler, feed)))
+
+    def dedup(self, feed):
+        """The DedupCache of feed, None without dedup"""
+        return self._dedup.get(feed.name)
+
+    def on_message_handler(self, feed, ws, message):
+        received = time.monotonic()
+        if self.capture is not None:
+            self.capture.record(feed.name, message)
+        dedup = self.dedup(feed)
+        if dedup is not None and dedup.seen(message):
+            return
+        report = feed.parse(message)
+        if report is None:
+            return
+        if report.error:
+            self.error_room.send_message(feed.prefix + report.text, received=received)
+            return
+        result = self.engine.match(report.text, self._room_ids, tag=feed.tag)
+        send_result(result, self.report_rooms, received, feed.prefix)
+
+    def start(self):
+        for listener in self.listeners:
+            listener.start()
+
+    def stop(self):
+        for listener in self.listeners:
+            listener.stop()
@@ -0,0 +1,309 @@
+import json
+import logging
+import os
+import re
+import select
+import subprocess
+import sys
+from threading import Lock
+from time import perf_counter
+
+try:
+    from re import _constants as sre_constants, _parser as sre_parse
+except ImportError:  # pragma: no cover
+    # Python < 3.11
+    import sre_constants
+    import sre_parse
+
+from regex import compile_normalized
+
+
+logger = logging.getLogger(__name__)
+
+_UNBOUNDED = sre_constants.MAXREPEAT
+# atomic groups and possessive repeats are new in Python 3.11
+_ATOMIC_GROUP = getattr(sre_constants, "ATOMIC_GROUP", None)
+_POSSESSIVE_REPEAT = getattr(sre_constants, "POSSESSIVE_REPEAT", None)
+_REPEATS = {sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT, _POSSESSIVE_REPEAT}
+_GROUPS = {sre_constants.SUBPATTERN, _ATOMIC_GROUP}
+# constructs matching a single character
+_SINGLE = {
+    sre_constants.LITERAL,
+    sre_constants.NOT_LITERAL,
+    sre_constants.ANY,
+    sre_constants.IN,
+}
+_REPEATS.discard(None)
+_GROUPS.discard(None)
+
+# how many times an unbounded repeat is counted as repeating, about the
+# length of a long post
+_UNBOUNDED_SPAN = 1000
+# bounded repeats that can repeat this many times count as unbounded
+_LARGE_REPEAT = 100
+# adjacent repeats that can split a text between them in more ways than this
+# are risky: a*a*b, \d{1,999}\d{1,999}x
+_MAX_SPAN = 10000
+
+
+def _scan(items, state):
+    """Walk a parsed pattern, collecting backtracking risk indicators
+
+    Returns (backtracks, span): whether items contain a repeat or an
+    alternation, and roughly in how many ways they can match. state["risky"]
+    is set when such a construct is itself repeated, bounded or not, when
+    adjacent repeats multiply past _MAX_SPAN, when a back-reference or an
+    unknown construct is used, and state["unbounded"] counts the unbounded
+    (or very large) repeats seen.
+
+    """
+    backtracks = False
+    span = run = 1
+    for op, av in items:
+        if op in _REPEATS:
+            low, high, sub = av
+            inner, inner_span = _scan(sub, state)
+            if inner and high > 1:
+                # nested quantifiers or a repeated alternation: (a+)+,
+                # (a|aa)*, and bounded ones too: (.*a){12}, (\w+\s?){1,40}
+                state["risky"] = True
+            if high == _UNBOUNDED or high - low >= _LARGE_REPEAT:
+                state["unbounded"] += 1
+            count = _UNBOUNDED_SPAN if high == _UNBOUNDED else high - low + 1
+            item_backtracks = high != low or inner
+            item_span = count * inner_span
+        elif op is sre_constants.BRANCH:
+            results = [_scan(alternative, state) for alternative in av[1]]
+            item_backtracks = True
+            item_span = sum(alternative_span for _, alternative_span in results)
+        elif op in _GROUPS:
+            item_backtracks, item_span = _scan(
+                av[-1] if op is sre_constants.SUBPATTERN else av, state)
+        elif op is sre_constants.GROUPREF_EXISTS:
+            _, yes, no = av
+            results = [_scan(yes, state)] + ([] if no is None else [_scan(no, state)])
+            item_backtracks = True
+            item_span = sum(branch_span for _, branch_span in results)
+        elif op in (sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+            # zero width, so the repeats around it are still adjacent
+            backtracks = _scan(av[1], state)[0] or backtracks
+            continue
+        elif op is sre_constants.AT:
+            continue
+        elif op in _SINGLE:
+            item_backtracks, item_span = False, 1
+        else:
+            # back-references, and anything this scan doesn't know about
+            state["risky"] = True
+            continue
+
+        backtracks = backtracks or item_backtracks
+        span = min(span * item_span, _MAX_SPAN + 1)
+        if item_backtracks:
+            # nothing fixed in between: the repeats can trade characters
+            run *= item_span
+            if run > _MAX_SPAN:
+                state["risky"] = True
+            run = min(run, _MAX_SPAN + 1)
+        else:
+            run = 1
+    return backtracks, span
+
+
+def is_risky(pattern):
+    """Does the pattern have a shape prone to catastrophic backtracking?
+
+    Nested quantifiers, repeated alternations, back-references, adjacent
+    repeats that can split a text between them in many ways, and three or
+    more unbounded (or very large) quantifiers (polynomial backtracking) all
+    count as risky, as does anything the scan doesn't recognize. Invalid
+    patterns are not risky, they just fail to compile.
+
+    """
+    try:
+        parsed = sre_parse.parse(pattern)
+    except re.error:
+        return False
+    state = {"risky": False, "unbounded": 0}
+    _scan(parsed, state)
+    return state["risky"] or state["unbounded"] >= 3
+
+
+class _Sandbox:
+    """Child process that evaluates patterns on behalf of the bot
+
+    The child runs this module as a script, announcing itself with a ready
+    line, then reading [pattern, post] JSON lines from stdin and answering
+    each with a 1 or 0 line. When it fails to answer in time it is killed,
+    and a fresh child is started on the next search.
+
+    """
+
+    # time allowed for the interpreter of a new child process to start up
+    startup_timeout = 10.0
+
+    def __init__(self):
+        self._process = None
+        self._buffer = b""
+        self._lock = Lock()
+
+    def _start(self):
+        self._process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__)],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+        )
+        self._buffer = b""
+        if self._readline(self.startup_timeout) != b"ready":  # pragma: no cover
+            raise RuntimeError("Regex sandbox process failed to start")
+
+    def _readline(self, timeout):
+        """Read a line from the child, None if it took longer than timeout"""
+        stdout = self._process.stdout.fileno()
+        while b"\n" not in self._buffer:
+            ready, _, _ = select.select([stdout], [], [], timeout)
+            chunk = os.read(stdout, 4096) if ready else b""
+            if not chunk:
+                # out of time, or the child died
+                self.close()
+                return None
+            self._buffer += chunk
+        line, _, self._buffer = self._buffer.partition(b"\n")
+        return line
+
+    def close(self):
+        if self._process is not None:
+            self._process.kill()
+            self._process.wait()
+            self._process = None
+
+    def search(self, pattern, post, timeout):
+        """Search post for pattern in the child process
+
+        Returns None if the child did not answer within timeout seconds.
+
+        """
+        with self._lock:
+            if self._process is None:
+                self._start()
+            self._process.stdin.write(json.dumps([pattern, post]).encode() + b"\n")
+            self._process.stdin.flush()
+            answer = self._readline(timeout)
+            return None if answer is None else answer == b"1"
+
+
+def _serve(stdin, stdout, cache_size=1024):
+    """Sandbox child process main loop"""
+    stdout.write(b"ready\n")
+    stdout.flush()
+    compiled = {}
+    for line in stdin:
+        pattern, post = json.loads(line)
+        search = compiled.get(pattern)
+        if search is None:
+            if len(compiled) >= cache_size:
+                compiled.clear()
+            search = compiled[pattern] = re.compile(pattern).search
+        stdout.write(b"1\n" if search(post) else b"0\n")
+        stdout.flush()
+
+
+class RegexGuard:
+    """Run user-supplied patterns under a per-pattern time budget
+
+    compile() produces search functions for use on the feed thread. Patterns
+    with a shape prone to catastrophic backtracking run in a sandbox child
+    process that is killed when it overruns the budget; all other patterns
+    run in-process and are timed. A pattern that exceeds the budget either
+    way, and again when re-run in the sandbox, is quarantined: it never runs
+    again, and the subscribed callbacks are called with the pattern and a
+    description of the problem so the pattern can be removed and its owners
+    told.
+
+    """
+
+    def __init__(self, budget=0.1):
+        self.budget = budget
+        self.quarantined = set()
+        self._sandbox = _Sandbox()
+        self._subscribers = []
+        self._lock = Lock()
+
+    def subscribe(self, callback):
+        """Call callback(pattern, reason) whenever a pattern is quarantined"""
+        self._subscribers.append(callback)
+
+    def close(self):
+        self._sandbox.close()
+
+    def quarantine(self, pattern, elapsed):
+        with self._lock:
+            if pattern in self.quarantined:
+                return
+            self.quarantined.add(pattern)
+        reason = (
+            f"it ran for over {elapsed * 1000:.0f} ms, "
+            f"the limit is {self.budget * 1000:.0f} ms"
+        )
+        logger.warning(f"Quarantined pattern {pattern!r}: {reason}")
+        for callback in self._subscribers:
+            try:
+                callback(pattern, reason)
+            except Exception:
+                logger.exception(f"Quarantine callback {callback!r} failed")
+
+    def _recheck(self, pattern, post):
+        """Re-run a search that overran the budget in the sandbox
+
+        A garbage collection pause or a busy host can make any search
+        overrun once; only a pattern that overruns again is quarantined.
+        Returns whether the pattern matched, None if it overran again.
+
+        """
+        matched = self._sandbox.search(pattern, post, self.budget)
+        if matched is not None:
+            logger.warning(
+                f"Pattern {pattern!r} overran the time budget once, "
+                "but not when checked again"
+            )
+        return matched
+
+    def compile(self, pattern):
+        """Compile pattern into a guarded search(post) function
+
+        Raises re.error for invalid patterns, like re.compile().
+
+        """
+        search = compile_normalized(pattern).search
+        quarantined = self.quarantined
+
+        if is_risky(pattern):
+
+            def guarded_search(post):
+                if pattern in quarantined:
+                    return False
+                matched = self._sandbox.search(pattern, post, self.budget)
+                if matched is None:
+                    matched = self._recheck(pattern, post)
+                if matched is None:
+                    self.quarantine(pattern, self.budget)
+                    return False
+                return matched
+
+        else:
+
+            def guarded_search(post):
+                if pattern in quarantined:
+                    return None
+                start = perf_counter()
+                match = search(post)
+                elapsed = perf_counter() - start
+                if elapsed > self.budget and self._recheck(pattern, post) is None:
+                    self.quarantine(pattern, elapsed)
+                return match
+
+        return guarded_search
+
+
+if __name__ == "__main__":  # pragma: no cover
+    _serve(sys.stdin.buffer, sys.stdout.buffer)
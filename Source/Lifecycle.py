@@ -0,0 +1,118 @@
+import logging
+import os
+import signal
+import sys
+import time
+from threading import Event, Lock
+
+
+logger = logging.getLogger(__name__)
+
+
+class Lifecycle:
+    """Block until the bot is asked to stop, then shut down in order
+
+    Stop requests come from SIGTERM and SIGINT, and from the bot's stop
+    and reboot commands once attach() routed them here. run() waits for a
+    request without using any CPU, then calls the shutdown steps in the
+    reverse order they were registered, so whatever was started last is
+    stopped first. A reboot re-executes the process after the shutdown.
+
+    """
+
+    def __init__(self):
+        self.reboot = False
+        self._stop = Event()
+        self._steps = []
+
+    def request_stop(self, reboot=False):
+        if reboot:
+            self.reboot = True
+        self._stop.set()
+
+    @property
+    def stopping(self):
+        return self._stop.is_set()
+
+    def on_shutdown(self, callback, *args, **kwargs):
+        """Call callback(*args, **kwargs) when shutting down"""
+        self._steps.append((callback, args, kwargs))
+
+    def handle_signals(self, signals=(signal.SIGTERM, signal.SIGINT)):
+        """Request a stop on the given signals; call from the main thread"""
+        for signum in signals:
+            signal.signal(signum, self._on_signal)
+
+    def _on_signal(self, signum, frame):
+        logger.info(f"Received {signal.Signals(signum).name}, shutting down")
+        self.request_stop()
+
+    def attach(self, bot):
+        """Take over the stop and reboot of a BotpySE bot
+
+        BotpySE stops or reboots the bot from a background thread, where a
+        reboot replaces the process without giving anything else a chance
+        to shut down. Instead, both now request a stop here, and the bot
+        itself is stopped as a shutdown step.
+
+        """
+        self.on_shutdown(bot.stop)
+        bot.stop = self.request_stop
+        bot.reboot = lambda: self.request_stop(reboot=True)
+
+    def wait(self, timeout=None):
+        """Wait for a stop request, returns True when there is one"""
+        return self._stop.wait(timeout)
+
+    def shutdown(self):
+        while self._steps:
+            callback, args, kwargs = self._steps.pop()
+            try:
+                callback(*args, **kwargs)
+            except Exception:
+                logger.exception(f"Shutdown step {callback!r} failed")
+
+    def run(self):
+        """Wait for a stop request, shut down, and reboot if requested"""
+        self.wait()
+        self.shutdown()
+        if self.reboot:
+            logger.info("Rebooting")
+            os.execl(sys.executable, sys.executable, *sys.argv)
+
+
+class StartupTimer:
+    """Time the phases of starting up, for a report to log
+
+    mark(name) ends the phase called name, which started at the previous
+    mark, or at start. Phases running in the background meanwhile are
+    added with their duration by add(name, seconds).
+
+    """
+
+    def __init__(self, start=None, clock=time.monotonic):
+        self._clock = clock
+        self.start = clock() if start is None else start
+        self._last = self.start
+        self.phases = []
+        self.background = []
+        self._lock = Lock()
+
+    def mark(self, name):
+        now = self._clock()
+        self.phases.append((name, now - self._last))
+        self._last = now
+
+    def add(self, name, seconds):
+        with self._lock:
+            self.background.append((name, seconds))
+
+    def report(self):
+        phases = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in self.phases)
+        report = f"Started in {self._last - self.start:.2f}s: {phases}"
+        with self._lock:
+            background = list(self.background)
+        if background:
+            report += "; in the background: " + ", ".join(
+                f"{name} {seconds:.2f}s" for name, seconds in background)
+        return report
@@ -0,0 +1,126 @@
+from bisect import bisect_left
+from time import perf_counter
+
+from Metrics import STAGE_SECONDS
+from regex import Prefilter
+
+
+_TAG_SECONDS = STAGE_SECONDS.labels("tag")
+_NOTIFY_SECONDS = STAGE_SECONDS.labels("notify")
+
+
+class PatternSet:
+    """Immutable set of patterns a store registers with the MatchEngine
+
+    regexes, searches and values are parallel tuples; the value is what a
+    match yields, a tag format for tags, and a {room_id: user_ids} mapping
+    for notifications. mentions maps user ids to their @DisplayName form,
+    for stores that notify users.
+
+    Stores publish a new PatternSet whenever their patterns change.
+
+    """
+
+    __slots__ = ("regexes", "searches", "values", "mentions")
+
+    def __init__(self, regexes=(), searches=(), values=(), mentions=None):
+        self.regexes = regexes
+        self.searches = searches
+        self.values = values
+        self.mentions = mentions if mentions is not None else {}
+
+
+_EMPTY = PatternSet()
+
+
+class MatchResult:
+    """Outcome of matching a post against all pattern sources
+
+    message is the post with its tags prepended, tags the tag formats that
+    matched, and users a {room_id: user_ids} dictionary of who to notify.
+
+    """
+
+    __slots__ = ("message", "tags", "users", "_mentions")
+
+    def __init__(self, message, tags, users, mentions):
+        self.message = message
+        self.tags = tags
+        self.users = users
+        self._mentions = mentions
+
+    def message_for(self, room):
+        """The message to post in room, with its notifications appended"""
+        users = self.users.get(str(room))
+        if not users:
+            return self.message
+        mentions = self._mentions
+        notifications = " ".join([mentions[user] for user in users])
+        return f"{self.message} {notifications}"
+
+
+class MatchEngine:
+    """Match posts against the tag and notification patterns in one pass
+
+    The patterns of both stores share a single literal prefilter, so a post
+    is scanned once for all of them; the prefilter is rebuilt whenever
+    either store publishes new patterns. Notification patterns see the
+    post with its tags, as posted to the rooms.
+
+    """
+
+    def __init__(self, tags=None, notifications=None):
+        self.tags = tags
+        self.notifications = notifications
+        # (tag patterns, notification patterns, combined prefilter)
+        self._state = (None, None, None)
+
+    def _current(self):
+        tag_patterns = _EMPTY if self.tags is None else self.tags.patterns
+        notification_patterns = (
+            _EMPTY if self.notifications is None else self.notifications.patterns
+        )
+        state = self._state
+        if state[0] is not tag_patterns or state[1] is not notification_patterns:
+            prefilter = Prefilter(tag_patterns.regexes + notification_patterns.regexes)
+            # a concurrent rebuild is harmless, the states are equivalent
+            state = self._state = (tag_patterns, notification_patterns, prefilter)
+        return state
+
+    def match(self, post, rooms=(), tag=True):
+        """Match post, notifying users in the given rooms; tags it if tag"""
+        start = perf_counter()
+        tag_patterns, notification_patterns, prefilter = self._current()
+        split = len(tag_patterns.regexes)
+        candidates = prefilter.candidates(post)
+        first_notification = bisect_left(candidates, split)
+
+        searches, values = tag_patterns.searches, tag_patterns.values
+        tags = [
+            values[index]
+            for index in candidates[:first_notification]
+            if searches[index](post)
+        ] if tag else []
+        message = post
+        if tags:
+            message = " ".join(tags) + post
+            # the tags may contain literals notification patterns look for
+            candidates = prefilter.candidates(message)
+            first_notification = bisect_left(candidates, split)
+
+        tagged = perf_counter()
+        _TAG_SECONDS.observe(tagged - start)
+
+        rooms = {str(room) for room in rooms}
+        users = {}
+        searches, values = notification_patterns.searches, notification_patterns.values
+        for index in candidates[first_notification:]:
+            index -= split
+            users_per_room = values[index]
+            if rooms.isdisjoint(users_per_room) or not searches[index](message):
+                continue
+            for room, room_users in users_per_room.items():
+                if room in rooms:
+                    users.setdefault(room, set()).update(room_users)
+        _NOTIFY_SECONDS.observe(perf_counter() - tagged)
+        return MatchResult(message, tags, users, notification_patterns.mentions)
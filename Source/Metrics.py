@@ -0,0 +1,305 @@
+import logging
+import math
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+
+
+logger = logging.getLogger(__name__)
+
+# seconds, from a fast regex match to a throttled chat post
+LATENCY_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value))
+
+
+def _escape(value):
+    return str(value).replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n")
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Registry:
+    """A set of metrics, rendered in the Prometheus text exposition format"""
+
+    def __init__(self):
+        self._metrics = []
+        self._lock = Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if any(each.name == metric.name for each in self._metrics):
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics.append(metric)
+
+    def render(self):
+        """The metrics in the Prometheus text exposition format"""
+        lines = []
+        for metric in list(self._metrics):
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = Lock()
+        if registry is not None:
+            registry.register(self)
+
+    def labels(self, *values):
+        """The metric for the given label values"""
+        values = tuple(str(value) for value in values)
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} has labels {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(values, self._child())
+        return child
+
+    def samples(self):
+        for values, child in sorted(self._children.items()):
+            yield from self._samples(values, child)
+
+    def _samples(self, values, child):
+        labels = _format_labels(self.labelnames, values)
+        yield f"{self.name}{labels} {_format_value(child.value)}"
+
+
+class _Value:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def set(self, value):
+        self.value = value
+
+
+class _FunctionValue:
+    """A value read from function() whenever the metrics are rendered"""
+
+    __slots__ = ("_function",)
+
+    def __init__(self, function):
+        self._function = function
+
+    @property
+    def value(self):
+        return self._function()
+
+
+class _Scalar(_Metric):
+    _child = _Value
+
+    def set_function(self, function, *labelvalues):
+        """Report function() for the label values, called on every render
+
+        For values kept elsewhere, such as the statistics of a cache, which
+        are then only read when the metrics are scraped.
+
+        """
+        values = tuple(str(value) for value in labelvalues)
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} has labels {self.labelnames}")
+        with self._lock:
+            self._children[values] = _FunctionValue(function)
+
+
+class Counter(_Scalar):
+    kind = "counter"
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+
+class Gauge(_Scalar):
+    kind = "gauge"
+
+    def set(self, value):
+        self.labels().set(value)
+
+
+class _Observations:
+    __slots__ = ("buckets", "counts", "count", "sum", "_lock")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = Lock()
+
+    def observe(self, value):
+        # buckets count the observations less than or equal to their bound
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+
+    @contextmanager
+    def time(self):
+        """Observe the seconds spent in the with block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS,
+                 registry=REGISTRY):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _child(self):
+        return _Observations(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+    def _samples(self, values, child):
+        with child._lock:
+            counts, count, total = list(child.counts), child.count, child.sum
+        names = self.labelnames + ("le",)
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+            cumulative += bucket_count
+            labels = _format_labels(names, values + (_format_value(bound),))
+            yield f"{self.name}_bucket{labels} {cumulative}"
+        labels = _format_labels(self.labelnames, values)
+        yield f"{self.name}_sum{labels} {_format_value(total)}"
+        yield f"{self.name}_count{labels} {count}"
+
+
+FEED_MESSAGES = Counter(
+    "pulse_feed_messages_total", "Messages received from a feed", ["feed"])
+FEED_RECONNECTS = Counter(
+    "pulse_feed_reconnects_total", "Reconnections to a feed", ["feed"])
+FEED_DOWNTIME = Counter(
+    "pulse_feed_downtime_seconds_total",
+    "Seconds a feed was disconnected, counted when it reconnects", ["feed"])
+ERRORS = Counter(
+    "pulse_errors_total", "Errors, by where they occurred", ["source"])
+PINGS = Counter(
+    "pulse_pings_total", "Users pinged by notifications", ["room"])
+STAGE_SECONDS = Histogram(
+    "pulse_stage_seconds",
+    "Seconds spent handling a feed message, by stage: receive (all of the "
+    "feed callback), tag, notify, enqueue and send (the chat post)",
+    ["stage"])
+FEED_TO_CHAT_SECONDS = Histogram(
+    "pulse_feed_to_chat_seconds",
+    "Seconds from receiving a feed message until it was posted to chat",
+    ["room"])
+SEND_QUEUE_LENGTH = Gauge(
+    "pulse_send_queue_length", "Messages waiting to be posted to a room", ["room"])
+CHAT_POSTS = Counter(
+    "pulse_chat_posts_total", "Messages posted to a room", ["room"])
+CHAT_THROTTLED = Counter(
+    "pulse_chat_throttled_total", "Posts chat refused for being too fast", ["room"])
+CHAT_DROPPED = Counter(
+    "pulse_chat_dropped_total", "Messages dropped from a full send queue", ["room"])
+DEDUP_HITS = Counter(
+    "pulse_dedup_hits_total", "Duplicate feed messages that were skipped", ["feed"])
+DEDUP_EVICTIONS = Counter(
+    "pulse_dedup_evictions_total",
+    "Fingerprints dropped from the duplicate cache, after their ttl or for lack of room",
+    ["feed", "reason"])
+PATTERN_CACHE_LOOKUPS = Counter(
+    "pulse_pattern_cache_lookups_total",
+    "Lookups in the shared compiled pattern cache, by whether the pattern "
+    "was cached (hit) or compiled (miss)",
+    ["result"])
+PATTERN_CACHE_SIZE = Gauge(
+    "pulse_pattern_cache_size", "Compiled patterns in the shared pattern cache")
+DEEPSMOKE_SCORE = Histogram(
+    "pulse_deepsmoke_score", "DeepSmoke scores of the posts on its feed",
+    buckets=(0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 0.95, 1.0))
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = self.server.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+
+class MetricsServer:
+    """Serve the metrics of a registry at http://host:port/metrics
+
+    Listens on localhost unless told otherwise; port 0 picks a free port.
+
+    """
+
+    def __init__(self, port=0, host="127.0.0.1", registry=REGISTRY):
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._server.registry = registry
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/metrics"
+
+    def start(self):
+        self._thread = Thread(
+            target=self._server.serve_forever, name="metrics", daemon=True)
+        self._thread.start()
+        logger.info(f"Serving metrics at {self.url}")
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
@@ -1,15 +1,17 @@
+import hashlib
 import json
 import logging
+import os
 import re
-from copy import deepcopy
 from functools import wraps
-from textwrap import indent
 from threading import Lock
 
 from BotpySE import Command
-import tabulate
 
-from regex import normalize
+from Matching import PatternSet
+from Pages import PageCache, paginate, parse_listing_arguments, select_page
+from Persistence import atomic_write
+from regex import Prefilter, compile_normalized, normalize
 
 
 logger = logging.getLogger(__name__)
@@ -35,33 +37,451 @@ def _as_inline_code(text):
     return f"`{escaped}`"
 
 
+def _document_hash(text):
+    """Identify a notifications JSON document by its contents"""
+    return hashlib.sha256(text.encode("utf8")).hexdigest()
+
+
+def _compile_search(regex):
+    return compile_normalized(regex).search
+
+
+class _RoomMatcher:
+    """Pre-compiled matcher for all patterns registered for a single room
+
+    Built once whenever the room's pattern set changes, from the compiled
+    search functions per pattern; match() then evaluates the patterns
+    against a post in a single pass, without going through the re module
+    cache, and returns the set of user ids to notify. Patterns whose
+    required literal text doesn't occur in the post are skipped.
+
+    """
+
+    __slots__ = ("_searches", "_prefilter")
+
+    def __init__(self, regexes_for_room, searches):
+        regexes = [regex for regex in regexes_for_room if searches[regex] is not None]
+        self._searches = tuple(
+            (searches[regex], frozenset(regexes_for_room[regex])) for regex in regexes
+        )
+        self._prefilter = Prefilter(regexes)
+
+    def match(self, post):
+        """Return the set of user ids with a pattern matching post"""
+        to_notify = set()
+        searches = self._searches
+        for index in self._prefilter.candidates(post):
+            search, users = searches[index]
+            # no need to run the pattern if all its users are already pinged
+            if not users <= to_notify and search(post):
+                to_notify |= users
+        return to_notify
+
+
+class _FeedMatcher:
+    """Pre-compiled matcher for the distinct patterns across all rooms
+
+    Each pattern is evaluated at most once per post, however many rooms it
+    is registered in, and only when its required literal text occurs in the
+    post. The patterns are also exposed as a PatternSet for the MatchEngine.
+
+    """
+
+    __slots__ = ("patterns", "_prefilter")
+
+    def __init__(self, subscriptions, searches, at_names):
+        regexes = tuple(
+            regex for regex in subscriptions if searches[regex] is not None
+        )
+        self.patterns = PatternSet(
+            regexes,
+            tuple(searches[regex] for regex in regexes),
+            tuple(subscriptions[regex] for regex in regexes),
+            at_names,
+        )
+        self._prefilter = Prefilter(regexes)
+
+    def match(self, post, rooms):
+        """Return a {room_id: user_ids} dictionary for the given rooms"""
+        to_notify = {}
+        searches, values = self.patterns.searches, self.patterns.values
+        for index in self._prefilter.candidates(post):
+            users_per_room = values[index]
+            if rooms.isdisjoint(users_per_room) or not searches[index](post):
+                continue
+            for room, users in users_per_room.items():
+                if room in rooms:
+                    to_notify.setdefault(room, set()).update(users)
+        return to_notify
+
+
+class _Snapshot:
+    """Immutable, versioned view of the notifications state
+
+    Writers publish a new snapshot under the lock after every change;
+    readers take a reference to the current snapshot and use it without
+    locking or copying. Nothing reachable from a published snapshot is
+    ever mutated, unchanged rooms and users are shared between successive
+    snapshots.
+
+    """
+
+    __slots__ = (
+        "version",
+        "rooms",
+        "matchers",
+        "subscriptions",
+        "feed_matcher",
+        "users",
+        "at_names",
+        "by_user",
+    )
+
+    def __init__(
+        self,
+        version,
+        rooms,
+        matchers,
+        subscriptions,
+        feed_matcher,
+        users,
+        at_names,
+        by_user,
+    ):
+        self.version = version
+        # room_id -> {regex: (user_id, ...)}
+        self.rooms = rooms
+        # room_id -> _RoomMatcher
+        self.matchers = matchers
+        # regex -> {room_id: frozenset(user_ids)}
+        self.subscriptions = subscriptions
+        # _FeedMatcher for the patterns in subscriptions
+        self.feed_matcher = feed_matcher
+        # user_id -> username
+        self.users = users
+        # user_id -> @DisplayName notification form
+        self.at_names = at_names
+        # user_id -> ((room_id, regex), ...)
+        self.by_user = by_user
+
+
 class Notifications:
-    def __init__(self, rooms, filename="./notifications.json"):
+    """Notification patterns per room, with the users to notify
+
+    The notifications attribute maps room ids to {regex: {user_id: None}}
+    dictionaries (used as ordered sets), with a reverse index of the
+    (room_id, regex) subscriptions per user id.
+
+    State is persisted as a [notifications, users] JSON document in filename,
+    plus an append-only journal of changes made since that document was
+    last written (filename + ".journal"). Each change appends a single line
+    to the journal; the journal is replayed on startup and compacted back
+    into the JSON document every compact_every changes, by the background
+    thread of the persistence service when one is given.
+
+    The journal starts with a ["document", hash] header line, the hash of
+    the document its entries apply to. Entries written against a different
+    document were already folded into it by a later compaction, and are not
+    replayed; with Redunda syncing the two files separately, a standby can
+    receive a newer document than its journal.
+
+    When a RegexGuard is given, patterns are run under its time budget, and
+    quarantine() removes patterns it has quarantined.
+
+    """
+
+    def __init__(
+        self,
+        rooms,
+        filename="./notifications.json",
+        compact_every=100,
+        persistence=None,
+        guard=None,
+    ):
         self.filename = filename
+        self.journal_filename = f"{filename}.journal"
+        self._compacting_filename = f"{filename}.journal.compacting"
+        self.compact_every = compact_every
+        self._persistence = persistence
+        self.guard = guard
+        self._compile = _compile_search if guard is None else guard.compile
+        # regex -> compiled search function, None for invalid patterns
+        self._searches = {}
         self._lock = Lock()
+        self._compact_lock = Lock()
+        self._journal_entries = 0
+        # the pages rendered by the listing commands, for the current version
+        self.pages = PageCache()
         try:
             with open(filename, "r", encoding="utf8") as notifications_file:
-                self.notifications, self.users = json.load(notifications_file)
+                document = notifications_file.read()
         except FileNotFoundError:
-            self.notifications = {}
-            self.users = {}
-
+            notifications, self.users = {}, {}
+            self._document = None
+        else:
+            notifications, self.users = json.loads(document)
+            self._document = _document_hash(document)
+
+        # users may have been listed multiple times for a pattern in the
+        # past, converting to dictionaries drops the duplicates.
+        self.notifications = {
+            room: {regex: dict.fromkeys(users) for regex, users in regexes.items()}
+            for room, regexes in notifications.items()
+        }
         for room in rooms:
             room = str(room)
             if room not in self.notifications:
                 self.notifications[room] = {}
 
-    def _save(self, filename=None):
-        """Write out the notifications data.
+        self._by_user = {}
+        for room, regexes in self.notifications.items():
+            for regex, users in regexes.items():
+                for user in users:
+                    self._by_user.setdefault(user, {})[room, regex] = None
+
+        self._replay_journal()
+
+        rooms, subscriptions = {}, {}
+        for room, regexes in self.notifications.items():
+            rooms[room] = {regex: tuple(users) for regex, users in regexes.items()}
+            for regex, users in regexes.items():
+                self._search_for(regex)
+                subscriptions.setdefault(regex, {})[room] = frozenset(users)
+        at_names = {user: _at_notification(name) for user, name in self.users.items()}
+        self._snapshot = _Snapshot(
+            0,
+            rooms,
+            {
+                room: _RoomMatcher(regexes, self._searches)
+                for room, regexes in rooms.items()
+            },
+            subscriptions,
+            _FeedMatcher(subscriptions, self._searches, at_names),
+            dict(self.users),
+            at_names,
+            {user: tuple(entries) for user, entries in self._by_user.items()},
+        )
+
+    @property
+    def patterns(self):
+        """The current patterns across all rooms, for a MatchEngine"""
+        return self._snapshot.feed_matcher.patterns
+
+    @property
+    def version(self):
+        """Version number of the current state, incremented on every change"""
+        return self._snapshot.version
+
+    def _search_for(self, regex):
+        """Compiled search function for regex, None if it is invalid
+
+        Each distinct pattern is compiled once and shared between rooms.
+
+        Not thread-safe, caller must hold lock when in a thread.
+
+        """
+        try:
+            return self._searches[regex]
+        except KeyError:
+            pass
+        try:
+            search = self._compile(regex)
+        except re.error as err:
+            logger.warning(f"Ignoring invalid notification pattern {regex!r}: {err}")
+            search = None
+        self._searches[regex] = search
+        return search
+
+    def _publish(self, room, user):
+        """Publish a new snapshot after a change for user in room
+
+        Only the changed room, pattern and user entries are rebuilt,
+        everything else is shared with the previous snapshot.
+
+        Not thread-safe, caller must hold lock when in a thread.
+
+        """
+        previous = self._snapshot
+        regexes = {
+            regex: tuple(users) for regex, users in self.notifications[room].items()
+        }
+        previous_regexes = previous.rooms[room]
+        subscriptions = dict(previous.subscriptions)
+        for regex in previous_regexes.keys() | regexes.keys():
+            users = regexes.get(regex)
+            if users == previous_regexes.get(regex):
+                continue
+            users_per_room = dict(subscriptions.get(regex, ()))
+            if users:
+                self._search_for(regex)
+                users_per_room[room] = frozenset(users)
+            else:
+                del users_per_room[room]
+            if users_per_room:
+                subscriptions[regex] = users_per_room
+            else:
+                # no longer used anywhere
+                del subscriptions[regex], self._searches[regex]
+
+        rooms = {**previous.rooms, room: regexes}
+        matchers = {**previous.matchers, room: _RoomMatcher(regexes, self._searches)}
+        by_user = {**previous.by_user, user: tuple(self._by_user.get(user, ()))}
+        users, at_names = previous.users, previous.at_names
+        if users.get(user) != self.users[user]:
+            name = self.users[user]
+            users = {**users, user: name}
+            at_names = {**at_names, user: _at_notification(name)}
+        feed_matcher = _FeedMatcher(subscriptions, self._searches, at_names)
+        self._snapshot = _Snapshot(
+            previous.version + 1,
+            rooms,
+            matchers,
+            subscriptions,
+            feed_matcher,
+            users,
+            at_names,
+            by_user,
+        )
+
+    def _replay_journal(self):
+        """Apply changes recorded in the journal since the last compaction
+
+        A journal set aside by an interrupted compaction is replayed first.
+        A partially written last line (from a crash mid-append) is ignored.
+        Entries written against another document than the current one are
+        skipped, unless they follow entries that were replayed: a crash
+        between writing the compacted document and removing the set-aside
+        journal then loses nothing, and replays nothing already in the
+        document.
+
+        """
+        entries = 0
+        # whether the entries so far applied to the current document
+        replayed = False
+        for filename in (self._compacting_filename, self.journal_filename):
+            try:
+                with open(filename, "r", encoding="utf8") as journal:
+                    lines = list(enumerate(journal, 1))
+            except FileNotFoundError:
+                continue
+
+            # journals from before the header was introduced are replayed
+            replay, stale = True, 0
+            for lineno, line in lines:
+                try:
+                    operation, *args = json.loads(line)
+                except ValueError:
+                    logger.warning(f"Ignoring corrupt journal entry {filename}:{lineno}")
+                    continue
+                if operation == "document":
+                    replay = replayed or args[0] == self._document
+                    replayed = replay
+                    continue
+                entries += 1
+                if not replay:
+                    stale += 1
+                elif operation == "add":
+                    self._add(*args)
+                elif operation == "remove":
+                    self._remove(*args)
+                else:
+                    logger.warning(f"Ignoring unknown journal operation {operation!r}")
+            if stale:
+                logger.warning(
+                    f"Ignoring {stale} entries in {filename} from before the "
+                    "last compaction"
+                )
+
+        self._journal_entries = entries
+        # make sure the journal exists, even when empty, starting with the
+        # document it applies to
+        with open(self.journal_filename, "a", encoding="utf8") as journal:
+            if not journal.tell():
+                journal.write(json.dumps(["document", self._document]) + "\n")
+        self.compact()
+
+    def _log(self, *operation):
+        """Append a change to the journal
+
+        Not thread-safe, caller must hold lock when in a thread.
+
+        """
+        with open(self.journal_filename, "a", encoding="utf8") as journal:
+            journal.write(json.dumps(operation) + "\n")
+        self._journal_entries += 1
+
+    def _maybe_compact(self):
+        """Compact the journal once it has grown past compact_every entries
+
+        With a persistence service the compaction is left to its background
+        thread, otherwise it happens right away. Must be called without
+        holding the lock.
+
+        """
+        if self._journal_entries < self.compact_every:
+            return
+        if self._persistence is None:
+            self.compact()
+        else:
+            self._persistence.schedule(self.filename, self.compact)
+
+    def compact(self):
+        """Fold the journal into the notifications JSON document
+
+        The state is serialised and the journal set aside while holding the
+        lock; the (atomic) write of the document happens after releasing it.
 
-        Not thread-safe, when called from a thread caller is
-        expected to obtain the lock.
+        """
+        with self._compact_lock:
+            with self._lock:
+                if not self._journal_entries:
+                    return
+                notifications = {
+                    room: {regex: list(users) for regex, users in regexes.items()}
+                    for room, regexes in self.notifications.items()
+                }
+                data = json.dumps([notifications, self.users])
+                document = _document_hash(data)
+                if not os.path.exists(self._compacting_filename):
+                    os.replace(self.journal_filename, self._compacting_filename)
+                else:
+                    # left over from a failed compaction, keep those entries
+                    with open(self.journal_filename, "r", encoding="utf8") as journal:
+                        entries = journal.read()
+                    with open(
+                        self._compacting_filename, "a", encoding="utf8"
+                    ) as set_aside:
+                        set_aside.write(entries)
+                with open(self.journal_filename, "w", encoding="utf8") as journal:
+                    journal.write(json.dumps(["document", document]) + "\n")
+                self._journal_entries = 0
+
+            atomic_write(self.filename, data)
+            self._document = document
+            os.remove(self._compacting_filename)
+
+    def _add(self, room, regex, user, user_name):
+        """Helper function for add and journal replay
+
+        Not thread-safe, caller must hold lock when in a thread.
 
         """
-        if filename is None:  # pragma: no cover
-            filename = self.filename
-        with open(filename, "w", encoding="utf8") as notifications_file:
-            json.dump([self.notifications, self.users], notifications_file)
+        if room not in self.notifications:
+            return False
+
+        regexes_for_room = self.notifications[room]
+        # make sure we have a dictionary to for users to notify when their
+        # regex matches
+        users_for_regex = regexes_for_room.setdefault(regex, {})
+
+        # only add a user if not already listed
+        if user in users_for_regex:
+            return False
+
+        users_for_regex[user] = None
+        self._by_user.setdefault(user, {})[room, regex] = None
+        self.users[user] = user_name
+        return True
 
     def add(self, room, regex, user, user_name):
         """Add the regex pattern to the room notifications for the given user
@@ -72,22 +492,14 @@ class Notifications:
         """
         room, user = str(room), str(user)
         with self._lock:
-            if room not in self.notifications:
+            if not self._add(room, regex, user, user_name):
                 return False
 
-            regexes_for_room = self.notifications[room]
-            # make sure we have a dictionary to for users to notify when their
-            # regex matches
-            users_for_regex = regexes_for_room.setdefault(regex, [])
+            self._publish(room, user)
+            self._log("add", room, regex, user, user_name)
 
-            # only add a user if not already listed
-            if user in users_for_regex:
-                return False
-
-            users_for_regex.append(user)
-            self.users[user] = user_name
-            self._save()
-            return True
+        self._maybe_compact()
+        return True
 
     def list(self, room=None, user=None):
         """Generate all notification entries
@@ -102,33 +514,41 @@ class Notifications:
             room = str(room)
         if user is not None:
             user = str(user)
-        with self._lock:
-            # minimise locking time by creating a copy to iterate over
-            notifications = deepcopy(self.notifications)
+        # the snapshot is immutable, no locking or copying required
+        snapshot = self._snapshot
+        names = snapshot.users
 
-        for room_id, regexes in notifications.items():
+        if user is not None:
+            # only the user's own entries need to be visited
+            name = names.get(user)
+            for room_id, regex in snapshot.by_user.get(user, ()):
+                if room is None or room == room_id:
+                    yield room_id, regex, user, name
+            return
+
+        for room_id, regexes in snapshot.rooms.items():
             if not (room is None or room == room_id):
                 continue
             for regex, users in regexes.items():
-                if user is None:
-                    for user_id in users:
-                        yield room_id, regex, user_id, self.users[user_id]
-                elif user in users:
-                    yield room_id, regex, user, self.users[user]
+                for user_id in users:
+                    yield room_id, regex, user_id, names[user_id]
 
     def _remove(self, room, regex, user):
-        """Helper function for remove_matching to remove matched patterns
+        """Helper function for remove_matching and journal replay
 
         Not thread-safe, caller must hold lock when in a thread.
 
         """
-        regexes_for_room = self.notifications[room]
-        users_for_regex = regexes_for_room[regex]
+        regexes_for_room = self.notifications.get(room, {})
+        users_for_regex = regexes_for_room.get(regex)
+        if users_for_regex is None or user not in users_for_regex:
+            return
 
-        # users may have been added multiple times in the past, so make sure
-        # we remove them all.
-        while user in users_for_regex:
-            users_for_regex.remove(user)
+        del users_for_regex[user]
+        subscriptions = self._by_user[user]
+        del subscriptions[room, regex]
+        if not subscriptions:
+            del self._by_user[user]
 
         if not users_for_regex:
             # remove regex from room when there are no users left to notify
@@ -144,48 +564,101 @@ class Notifications:
 
         """
         room, user = str(room), str(user)
-        as_pattern = re.compile(expr, re.I)
+        as_pattern = compile_normalized(expr, re.I)
 
         to_remove = []
 
         with self._lock:
-            regexes_for_room = self.notifications.get(room, {})
-            for regex, users_for_regex in regexes_for_room.items():
+            # only the user's own subscriptions need to be checked
+            for room_id, regex in self._by_user.get(user, ()):
                 # check for exact match or pattern match
-                if regex == expr or as_pattern.search(regex):
-                    if user in users_for_regex:
-                        to_remove.append(regex)
+                if room_id == room and (regex == expr or as_pattern.search(regex)):
+                    to_remove.append(regex)
 
             # remove regexes after matching, to avoid mutating-while-iterating
             for regex in to_remove:
                 self._remove(room, regex, user)
+                self._log("remove", room, regex, user)
 
             if to_remove:
-                self._save()
+                self._publish(room, user)
 
+        self._maybe_compact()
         return to_remove
 
-    def filter_post(self, room, post):
-        """Check a post against the patterns registered for a room"""
-        room = str(room)
-        to_notify = set()
+    def quarantine(self, pattern, reason):
+        """Remove a pattern, for all users in all rooms
 
+        Used for patterns quarantined by the regex guard. Returns a list of
+        (room_id, message) tuples, with a message for each room the pattern
+        was removed from that tells the users affected why.
+
+        """
+        messages = []
         with self._lock:
-            # minimise locking time by creating pre-processed copies
-            regexes_for_room = self.notifications.get(room, {})
-            regexes = {p: set(u) for p, u in regexes_for_room.items()}
-            at_names = {u: _at_notification(n) for u, n in self.users.items()}
+            for room, regexes_for_room in self.notifications.items():
+                users = list(regexes_for_room.get(pattern, ()))
+                if not users:
+                    continue
+                for user in users:
+                    self._remove(room, pattern, user)
+                    self._log("remove", room, pattern, user)
+                    self._publish(room, user)
+                at_names = self._snapshot.at_names
+                mentions = " ".join([at_names[user] for user in users])
+                messages.append(
+                    (
+                        room,
+                        f"{mentions} your notification pattern "
+                        f"{_as_inline_code(pattern)} has been disabled: {reason}",
+                    )
+                )
+
+        self._maybe_compact()
+        return messages
 
-        for regex, users_for_regex in regexes.items():
-            if re.search(regex, post):
-                to_notify.update(users_for_regex)
+    def filter_post(self, room, post):
+        """Check a post against the patterns registered for a room"""
+        room = str(room)
+        # a single reference read; the snapshot is never mutated
+        snapshot = self._snapshot
+        matcher = snapshot.matchers.get(room)
+        if matcher is None:
+            return post
 
+        to_notify = matcher.match(post)
         if not to_notify:
             return post
 
+        at_names = snapshot.at_names
         notifications = " ".join([at_names[user] for user in to_notify])
         return f"{post} {notifications}"
 
+    def filter_post_many(self, rooms, post):
+        """Check a post against the patterns registered for several rooms
+
+        Each distinct pattern is evaluated once, however many of the rooms
+        it is registered in. Returns a list with the post for each room, in
+        the same order as rooms.
+
+        """
+        rooms = [str(room) for room in rooms]
+        snapshot = self._snapshot
+        to_notify = snapshot.feed_matcher.match(post, set(rooms))
+        if not to_notify:
+            return [post] * len(rooms)
+
+        at_names = snapshot.at_names
+        messages = []
+        for room in rooms:
+            users = to_notify.get(room)
+            if users:
+                notifications = " ".join([at_names[user] for user in users])
+                messages.append(f"{post} {notifications}")
+            else:
+                messages.append(post)
+        return messages
+
 
 def _handle_exceptions(f):
     """Handle any exceptions in a Command.run method, and log and report"""
@@ -236,31 +709,64 @@ class NotificationsCommandBase(Command):
 class CommandNotifications(NotificationsCommandBase):
     @staticmethod
     def usage():
-        return ["notifications", "all notifications"]
+        # [by <user>] [<text in the pattern>] [page <n>]
+        return ["notifications ...", "all notifications ..."]
 
     def run(self):
         room = str(self.message.room.id)
         logger.info(f"NOTIFICATIONS by {self.message.user.id} in {room}")
-        entries = [[u, p] for _, p, _, u in self.notifications.list(room=room)]
-        table = tabulate.tabulate(entries, headers=["User", "Regex"], tablefmt="orgtbl")
-        self.post(indent(table, "    "), False)
+        try:
+            user, text, page = parse_listing_arguments(self.arguments)
+        except ValueError as err:
+            self.reply(str(err))
+            return
+
+        def render():
+            entries = [
+                [u, p]
+                for _, p, _, u in self.notifications.list(room=room)
+                if (user is None or user in u.lower())
+                and (text is None or text in p.lower())
+            ]
+            return paginate(entries, ["User", "Regex"])
+
+        pages = self.notifications.pages.get(
+            self.notifications.version, ("notifications", room, user, text), render
+        )
+        self.post(select_page(pages, page), False)
 
 
 class CommandMyNotifications(NotificationsCommandBase):
     @staticmethod
     def usage():
-        return ["my notifications"]
+        # [<text in the pattern>] [page <n>]
+        return ["my notifications ..."]
 
     def run(self):
         room = str(self.message.room.id)
         user_id = self.message.user.id
         user_name = self.message.user.name
         logger.info(f"MY NOTIFICATIONS by {user_id} in {room}")
-        entries = [[p] for _, p, *_ in self.notifications.list(room=room, user=user_id)]
-        table = tabulate.tabulate(
-            entries, headers=[f"{user_name}\nRegex"], tablefmt="orgtbl"
+        try:
+            _, text, page = parse_listing_arguments(self.arguments, users=False)
+        except ValueError as err:
+            self.reply(str(err))
+            return
+
+        def render():
+            entries = [
+                [p]
+                for _, p, *_ in self.notifications.list(room=room, user=user_id)
+                if text is None or text in p.lower()
+            ]
+            return paginate(entries, [f"{user_name}\nRegex"])
+
+        pages = self.notifications.pages.get(
+            self.notifications.version,
+            ("my notifications", room, str(user_id), user_name, text),
+            render,
         )
-        self.post(indent(table, "    "), False)
+        self.post(select_page(pages, page), False)
 
 
 class CommandNotify(NotificationsCommandBase):
@@ -278,11 +784,19 @@ class CommandNotify(NotificationsCommandBase):
         markedup = _as_inline_code(pattern)
         logger.info(f"NOTIFY {user_id} in {room} for {pattern}")
         try:
-            re.compile(pattern)
+            compile_normalized(pattern)
         except re.error as err:
             self.reply(f"Could not add notification {markedup}: {err}")
             return
 
+        guard = self.notifications.guard
+        if guard is not None and pattern in guard.quarantined:
+            self.reply(
+                f"Could not add notification {markedup}: "
+                "the pattern is quarantined for running too slowly"
+            )
+            return
+
         if self.notifications.add(room, pattern, user_id, user_name):
             self.reply(f"Added notification for {user_name} for {markedup}")
         else:
@@ -304,7 +818,7 @@ class CommandUnnotify(NotificationsCommandBase):
         markedup = _as_inline_code(pattern)
         logger.info(f"UNNOTIFY {pattern} for {user_id} in {room}")
         try:
-            re.compile(pattern)
+            compile_normalized(pattern)
         except re.error as err:
             self.reply(f"Could not remove notification {markedup}: {err}")
             return
@@ -0,0 +1,185 @@
+from collections import OrderedDict
+from threading import Lock
+
+from Sender import MAX_MESSAGE_LENGTH
+
+
+# room left on each page for the "page N of M" footer
+_FOOTER_LENGTH = 40
+
+
+def _wrap(text, width):
+    """Split text into pieces of at most width characters
+
+    Pieces don't start or end with whitespace where that can be helped, as
+    tabulate strips it from the cells.
+
+    """
+    pieces = []
+    while len(text) > width:
+        end = width
+        while end > 1 and (text[end - 1].isspace() or text[end].isspace()):
+            end -= 1
+        pieces.append(text[:end])
+        text = text[end:]
+    pieces.append(text)
+    return pieces
+
+
+def _render(rows, headers, width):
+    """Render rows as an orgtbl table of lines at most width characters wide
+
+    Cells too wide for that are wrapped onto continuation lines, with the
+    other cells of those lines left empty. Returns the header lines, and
+    the lines of each row.
+
+    """
+    # slow to import, and only needed here
+    import tabulate
+
+    rows = [[str(cell) for cell in row] for row in rows]
+    widths = [
+        max([len(line) for line in str(header).splitlines()]
+            + [len(row[column]) for row in rows])
+        for column, header in enumerate(headers)]
+    # "| " + " | ".join(cells) + " |"
+    cell_width = max(widths, default=0)
+    while cell_width > 1 and sum(
+            min(width_, cell_width) for width_ in widths) + 3 * len(widths) + 1 > width:
+        cell_width -= 1
+
+    lines_per_row, wrapped = [], []
+    for row in rows:
+        pieces = [_wrap(cell, cell_width) for cell in row]
+        height = max(len(cell_pieces) for cell_pieces in pieces)
+        lines_per_row.append(height)
+        for line in range(height):
+            wrapped.append([
+                cell_pieces[line] if line < len(cell_pieces) else ""
+                for cell_pieces in pieces])
+
+    lines = tabulate.tabulate(
+        wrapped, headers=headers, tablefmt="orgtbl", disable_numparse=True
+    ).splitlines()
+    # the header ends with the |---+---| line under it
+    header_length = next(
+        (index + 1 for index, line in enumerate(lines) if line.startswith("|-")),
+        0)
+    header, lines = lines[:header_length], lines[header_length:]
+    row_lines = []
+    for height in lines_per_row:
+        row_lines.append(lines[:height])
+        lines = lines[height:]
+    return header, row_lines
+
+
+def paginate(rows, headers, limit=MAX_MESSAGE_LENGTH, prefix="    "):
+    """Render rows as orgtbl table pages of at most limit characters
+
+    Every page repeats the table header and is indented by prefix, for chat
+    to show it in a fixed width font. Long cells are wrapped onto extra
+    lines, so that a page has room for the header and a line of a row;
+    rows are kept on one page unless they don't fit on a page by
+    themselves. Tables with more than one page end each page with a "page
+    N of M" line.
+
+    """
+    header_length = max(len(str(header).splitlines()) for header in headers) + 1
+    width = (limit - _FOOTER_LENGTH) // (header_length + 1) - len(prefix) - 1
+    header, row_lines = _render(rows, headers, width)
+    header = [prefix + line for line in header]
+
+    pages, page, size = [], [], 0
+    room = limit - _FOOTER_LENGTH - sum(len(line) + 1 for line in header)
+    for lines in row_lines:
+        lines = [prefix + line for line in lines]
+        row_size = sum(len(line) + 1 for line in lines)
+        if page and size + row_size > room:
+            pages.append(page)
+            page, size = [], 0
+        for line in lines:
+            # only rows longer than a page are split across pages
+            if page and size + len(line) + 1 > room:
+                pages.append(page)
+                page, size = [], 0
+            page.append(line)
+            size += len(line) + 1
+    if page or not pages:
+        pages.append(page)
+
+    if len(pages) == 1:
+        return ["\n".join(header + pages[0])]
+    return [
+        "\n".join(header + page + [f"{prefix}page {number} of {len(pages)}"])
+        for number, page in enumerate(pages, 1)]
+
+
+class PageCache:
+    """The pages listing commands rendered for the current version of a store
+
+    Pages are cached under a key naming what was listed, such as the room
+    and the filters. Whenever the version of the store changes, all pages
+    rendered for the previous version are dropped.
+
+    """
+
+    def __init__(self, maxsize=64):
+        self.maxsize = maxsize
+        self._version = None
+        self._pages = OrderedDict()
+        self._lock = Lock()
+        self.hits = self.misses = 0
+
+    def get(self, version, key, render):
+        """The pages for key, calling render() for them if not cached"""
+        with self._lock:
+            if version != self._version:
+                self._pages.clear()
+                self._version = version
+            pages = self._pages.get(key)
+            if pages is not None:
+                self._pages.move_to_end(key)
+                self.hits += 1
+                return pages
+            self.misses += 1
+
+        # render outside the lock; at worst the same pages are rendered twice
+        pages = render()
+        with self._lock:
+            if version == self._version:
+                self._pages[key] = pages
+                while len(self._pages) > self.maxsize:
+                    self._pages.popitem(last=False)
+        return pages
+
+
+def parse_listing_arguments(arguments, users=True):
+    """Parse the [by <user>] [<text>] [page <n>] arguments of a listing
+
+    Returns (user, text, page); user and text are lowercased, or None when
+    not given, and page counts from 1. With users False, there is no by
+    <user> argument. Raises ValueError for a page that isn't a positive
+    number.
+
+    """
+    arguments = [argument.lower() for argument in arguments]
+    page = 1
+    if len(arguments) >= 2 and arguments[-2] == "page":
+        if not arguments[-1].isdigit() or int(arguments[-1]) < 1:
+            raise ValueError(f"{arguments[-1]!r} is not a page number")
+        page = int(arguments[-1])
+        del arguments[-2:]
+    user = None
+    if users and len(arguments) >= 2 and arguments[0] == "by":
+        user = arguments[1]
+        del arguments[:2]
+    text = " ".join(arguments) or None
+    return user, text, page
+
+
+def select_page(pages, page):
+    """The text to post for a page number, from the pages of a listing"""
+    if page > len(pages):
+        return f"There {'is' if len(pages) == 1 else 'are'} only {len(pages)} " \
+            f"page{'' if len(pages) == 1 else 's'}"
+    return pages[page - 1]
@@ -0,0 +1,89 @@
+import logging
+import os
+import tempfile
+from threading import Event, Lock, Thread
+
+
+logger = logging.getLogger(__name__)
+
+
+def atomic_write(filename, data):
+    """Replace filename with data, never leaving a partially written file
+
+    The data is written to a temporary file in the same directory, which is
+    fsync-ed and then renamed over the original.
+
+    """
+    filename = os.fspath(filename)
+    directory, basename = os.path.split(filename)
+    fd, tmpname = tempfile.mkstemp(
+        prefix=f".{basename}.", suffix=".tmp", dir=directory or "."
+    )
+    try:
+        with os.fdopen(fd, "w", encoding="utf8") as tmpfile:
+            tmpfile.write(data)
+            tmpfile.flush()
+            os.fsync(tmpfile.fileno())
+        os.replace(tmpname, filename)
+    except BaseException:
+        try:
+            os.unlink(tmpname)
+        except OSError:  # pragma: no cover
+            pass
+        raise
+
+
+class Persistence:
+    """Debounced background writer for bot state files
+
+    Stores call schedule() whenever their state changed, with a callable
+    that writes it out. Writes are coalesced per name, and run every
+    interval seconds from a background thread, taking disk latency off the
+    command threads. stop() (or an explicit flush()) writes out anything
+    still pending.
+
+    """
+
+    def __init__(self, interval=5.0):
+        self.interval = interval
+        self._pending = {}
+        self._lock = Lock()
+        self._flush_lock = Lock()
+        self._stopped = Event()
+        self._thread = None
+
+    def schedule(self, name, write):
+        """Mark name as dirty, to be written out by calling write()"""
+        with self._lock:
+            self._pending[name] = write
+
+    def flush(self):
+        """Write out all pending state now"""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            for name, write in pending.items():
+                try:
+                    write()
+                except Exception:
+                    logger.exception(f"Failed to write {name}, will retry")
+                    with self._lock:
+                        # unless it was re-scheduled in the meantime
+                        self._pending.setdefault(name, write)
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.flush()
+
+    def start(self):
+        self._stopped.clear()
+        self._thread = Thread(target=self._run, name="persistence", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the background thread and flush any pending writes"""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
@@ -1,20 +1,30 @@
 import os
-import subprocess
 import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event
 
 import BotpySE as bp
-import chatexchange as ce
 
-from HalflifeListener import *
-from DeepSmokeListener import *
-from CommandUpdate import *
+from Capture import CaptureWriter
+from Feeds import FeedDispatcher, configure
+from CommandUpdate import CommandUpdate
 from Notifications import Notifications, NotificationsCommandBase
-from Tagging import *
-from commands import *
+from Persistence import Persistence
+from Guard import RegexGuard
+from Lifecycle import Lifecycle, StartupTimer
+from Metrics import MetricsServer
+from Sender import RoomSender
+from Tagging import CommandAddTag, CommandListTags, CommandRemoveTag, TagManager
+from Version import current_hash
+from commands import default_commands
 
 
 class Pulse:
-    def __init__ (self, nick, email, password, rooms):
+    def __init__ (self, nick, email, password, rooms, timer=None):
+        # a StartupTimer started with the process, to include the imports
+        timer = StartupTimer() if timer is None else timer
+
         commands = default_commands
         commands.extend([
             CommandUpdate,
@@ -24,32 +34,55 @@ class Pulse:
             CommandRemoveTag
             ])
 
-        version_hash = self._get_current_hash()
+        version_hash = current_hash()
+        timer.mark("version")
 
         self._bot_header = r'\[[PulseMonitor]' \
             '(https://github.com/Charcoal-SE/PulseMonitor) ' + \
                 version_hash + r'\]'
 
-        bot = bp.Bot(nick, commands, rooms, [], "stackexchange.com", email, password)
-        bot.add_alias("Halflife")
+        # shut down on SIGTERM/SIGINT and on the stop and reboot commands,
+        # stopping everything in the reverse order it was started
+        lifecycle = Lifecycle()
+        lifecycle.handle_signals()
 
-        try:
-            with open(bot._storage_prefix + 'redunda_key.txt', 'r') as file_handle:
-                key = file_handle.readlines()[0].rstrip('\n')
-            bot.set_redunda_key(key)
-
-            bot.add_file_to_sync({"name": bot._storage_prefix + 'tags.json',
-                "ispickle": False, "at_home": False})
-            bot.add_file_to_sync({"name": bot._storage_prefix + 'notifications.json',
-                "ispickle": False, "at_home": False})
-            bot.redunda_init(bot_version=version_hash)
-            bot.set_redunda_default_callbacks()
-            bot.set_redunda_status(True)
+        if 'PulseMetricsPort' in os.environ:
+            metrics = MetricsServer(int(os.environ['PulseMetricsPort']))
+            metrics.start()
+            lifecycle.on_shutdown(metrics.stop)
 
+        # where BotpySE keeps the bot's files
+        storage_prefix = os.path.expanduser("~") + "/." + nick.lower() + "/"
+        try:
+            with open(storage_prefix + 'redunda_key.txt', 'r') as file_handle:
+                redunda_key = file_handle.readlines()[0].rstrip('\n')
         except IOError as ioerr:
+            redunda_key = None
             logging.error(str(ioerr))
             logging.warn("Bot is not integrated with Redunda.")
 
+        # load the tags and notifications while logging in to chat; with
+        # Redunda, once it downloaded them
+        files_ready = Event()
+        if redunda_key is None:
+            files_ready.set()
+        with ThreadPoolExecutor(1, thread_name_prefix="startup") as executor:
+            state = executor.submit(
+                self._load_state, storage_prefix, rooms, files_ready, timer)
+            try:
+                bot = bp.Bot(nick, commands, rooms, [], "stackexchange.com", email, password)
+                timer.mark("login")
+                bot.add_alias("Halflife")
+                if redunda_key is not None:
+                    self._redunda_init(bot, redunda_key, version_hash)
+                    timer.mark("redunda")
+            finally:
+                files_ready.set()
+            persistence, guard, notifications, tags = state.result()
+        timer.mark("state")
+        lifecycle.on_shutdown(persistence.stop)
+        lifecycle.on_shutdown(guard.close)
+
         bot.set_startup_message(self._bot_header +
             " started on " + bot._location + ".")
         bot.set_standby_message(self._bot_header +
@@ -57,30 +90,83 @@ class Pulse:
         bot.set_failover_message(self._bot_header +
             " running on " + bot._location + " received failover.")
 
-        notifications = Notifications(
-            rooms, bot._storage_prefix + 'notifications.json')
-        tags = TagManager(bot._storage_prefix + 'tags.json')
         bot._command_manager.notifications = notifications
         bot._command_manager.tags = tags
 
         bot.start()
+        lifecycle.attach(bot)
         bot.add_privilege_type(1, "owner")
         bot.set_room_owner_privs_max()
+        timer.mark("join rooms")
+
+        # the listeners post through per-room queues, never waiting for chat
+        roomlist = [RoomSender(room) for room in bot._rooms]
+        for sender in roomlist:
+            sender.start()
+            lifecycle.on_shutdown(sender.stop, timeout=10)
+
+        def on_quarantine(pattern, reason):
+            rooms_by_id = {str(room.id): room for room in roomlist}
+            for room_id, message in notifications.quarantine(pattern, reason):
+                if room_id in rooms_by_id:
+                    rooms_by_id[room_id].send_message(message)
+            for message in tags.quarantine(pattern, reason):
+                roomlist[0].send_message(message)
+        guard.subscribe(on_quarantine)
+
+        # record the feeds for benchmarks/replay.py
+        capture = None
+        if 'PulseCapture' in os.environ:
+            capture = CaptureWriter(os.environ['PulseCapture'])
+            lifecycle.on_shutdown(capture.close)
+
+        # PulseFeeds is a comma separated list of the feeds to listen to,
+        # each optionally with =url to listen to it elsewhere
+        feeds = FeedDispatcher(roomlist[0], roomlist, notifications, tags, capture)
+        for feed in configure(os.environ.get('PulseFeeds', 'halflife')):
+            feeds.add(feed)
+
+        feeds.start()
+        lifecycle.on_shutdown(feeds.stop)
+        timer.mark("feeds")
+        logging.info(timer.report())
+
+        lifecycle.run()
+
+    def _redunda_init(self, bot, key, version_hash):
+        try:
+            bot.set_redunda_key(key)
 
-        roomlist = bot._rooms
-        halflife = HalflifeListener(
-            roomlist[0], roomlist, notifications, bot._command_manager.tags)
-        #deep_smoke = DeepSmokeListener(roomlist[0], roomlist, notifications)
-
-        halflife.start()
-        #deep_smoke.start()
-
-        while bot.is_alive:
-            pass
+            bot.add_file_to_sync({"name": bot._storage_prefix + 'tags.json',
+                "ispickle": False, "at_home": False})
+            bot.add_file_to_sync({"name": bot._storage_prefix + 'notifications.json',
+                "ispickle": False, "at_home": False})
+            # the journal's header says which notifications.json it belongs
+            # to, so a journal older than the document is ignored
+            bot.add_file_to_sync({"name": bot._storage_prefix + 'notifications.json.journal',
+                "ispickle": False, "at_home": False})
+            bot.redunda_init(bot_version=version_hash)
+            bot.set_redunda_default_callbacks()
+            bot.set_redunda_status(True)
 
-        halflife.stop()
-        #deep_smoke.stop()
+        except IOError as ioerr:
+            logging.error(str(ioerr))
+            logging.warn("Bot is not integrated with Redunda.")
 
-    def _get_current_hash(self):
-        return subprocess.run(['git', 'log', '-n', '1', '--pretty=format:"%H"'],
-            stdout=subprocess.PIPE).stdout.decode('utf-8')[1:7]
+    def _load_state(self, storage_prefix, rooms, files_ready, timer):
+        """Start persistence and the regex guard, then load the stores"""
+        start = time.monotonic()
+        persistence = Persistence(
+            float(os.environ.get('PulseFlushInterval', 5)))
+        persistence.start()
+        guard = RegexGuard()
+        timer.add("guard", time.monotonic() - start)
+
+        files_ready.wait()
+        start = time.monotonic()
+        notifications = Notifications(
+            rooms, storage_prefix + 'notifications.json',
+            persistence=persistence, guard=guard)
+        tags = TagManager(storage_prefix + 'tags.json', persistence, guard)
+        timer.add("load state", time.monotonic() - start)
+        return persistence, guard, notifications, tags
@@ -0,0 +1,259 @@
+import logging
+import re
+import time
+from collections import deque
+from threading import Condition, Thread
+
+import requests
+
+from Metrics import (
+    CHAT_DROPPED, CHAT_POSTS, CHAT_THROTTLED, ERRORS, FEED_TO_CHAT_SECONDS, PINGS,
+    SEND_QUEUE_LENGTH, STAGE_SECONDS)
+
+
+logger = logging.getLogger(__name__)
+
+# chat refuses longer messages
+MAX_MESSAGE_LENGTH = 500
+
+TOO_FAST = re.compile(r"You can perform this action again in (\d+) seconds?")
+
+
+_ENQUEUE_SECONDS = STAGE_SECONDS.labels("enqueue")
+_SEND_SECONDS = STAGE_SECONDS.labels("send")
+_SEND_ERRORS = ERRORS.labels("send")
+
+
+class Throttled(Exception):
+    """Chat refused a message because messages were sent too quickly"""
+
+    def __init__(self, wait):
+        super().__init__(f"Throttled, try again in {wait} seconds")
+        self.wait = wait
+
+
+class Transient(Exception):
+    """Posting failed in a way that may well work when retried: a network
+    error, or a server error on chat's side"""
+
+
+def _chat_send(room, text):
+    """Post text to a chatexchange room, bypassing the client's queue
+
+    The one place relying on chatexchange internals: the room's client has
+    a browser (_br) that can post straight away.
+
+    """
+    return room._client._br.send_message(room.id, text)
+
+
+def post_message(room, text):
+    """Post text to a chat room now
+
+    Raises Throttled when chat asks to wait before posting again, and
+    Transient for network errors and 5xx responses. Unlike
+    room.send_message(), this doesn't go through the chatexchange client's
+    request queue, which is shared by all rooms.
+
+    """
+    try:
+        response = _chat_send(room, text)
+    except requests.HTTPError as err:
+        status = None if err.response is None else err.response.status_code
+        # chat answers 409 Conflict when throttling
+        if status == 409:
+            response = err.response
+        elif status is not None and status >= 500:
+            raise Transient(err) from err
+        else:
+            raise
+    except requests.RequestException as err:
+        raise Transient(err) from err
+    too_fast = TOO_FAST.search(response.text)
+    if too_fast:
+        raise Throttled(int(too_fast[1]))
+
+
+def send_result(result, rooms, received=None, prefix=""):
+    """Send the message of a MatchResult to each of the RoomSenders"""
+    with _ENQUEUE_SECONDS.time():
+        for room in rooms:
+            pinged = result.users.get(str(room.id))
+            if pinged:
+                PINGS.labels(room.id).inc(len(pinged))
+            room.send_message(prefix + result.message_for(room.id), received=received)
+
+
+class RoomSender:
+    """Bounded, rate-aware outbound message queue for a chat room
+
+    send_message() only queues the message, a worker thread posts them to
+    the room, so the feed threads never wait for chat and a slow room
+    doesn't hold up the others. When the queue is full the oldest message
+    is dropped. Stands in for the room in the listeners.
+
+    Posts are spaced interval seconds apart. The interval shrinks towards
+    min_interval after every post, and doubles (up to max_interval) when
+    chat throttles us. Transient failures are retried up to retries times,
+    waiting retry_delay seconds and doubling that each time, before the
+    message is given up on. With coalesce, messages that queued up in the
+    meantime are merged into a single multi-line message, as long as that
+    stays within the chat message length limit.
+
+    The time from received (a time.monotonic() timestamp, by default when
+    the message was queued) until the message was posted is recorded in
+    the feed to chat latency metric.
+
+    """
+
+    def __init__(
+        self,
+        room,
+        post=post_message,
+        maxsize=100,
+        coalesce=True,
+        interval=2.0,
+        min_interval=1.0,
+        max_interval=60.0,
+        retries=4,
+        retry_delay=1.0,
+        sleep=time.sleep,
+    ):
+        self.room = room
+        self.maxsize = maxsize
+        self.coalesce = coalesce
+        self.interval = interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.dropped = 0
+        self.posts = 0
+        self.lines = 0
+        self.throttled = 0
+        self._post = post
+        self._sleep = sleep
+        self._next_post = 0.0
+        self._pending = deque()
+        self._ready = Condition()
+        self._stopping = False
+        self._thread = None
+        room_id = self.id
+        self._queue_length = SEND_QUEUE_LENGTH.labels(room_id)
+        self._feed_to_chat = FEED_TO_CHAT_SECONDS.labels(room_id)
+        self._posts = CHAT_POSTS.labels(room_id)
+        self._throttled = CHAT_THROTTLED.labels(room_id)
+        self._dropped = CHAT_DROPPED.labels(room_id)
+
+    @property
+    def id(self):
+        return self.room.id
+
+    def send_message(self, text, length_check=True, received=None):
+        if length_check and len(text) > MAX_MESSAGE_LENGTH:
+            logger.warning(
+                f"Not sending message to room {self.id}, "
+                f"it is longer than {MAX_MESSAGE_LENGTH} characters"
+            )
+            return
+        if received is None:
+            received = time.monotonic()
+        with self._ready:
+            if len(self._pending) >= self.maxsize:
+                self._pending.popleft()
+                self.dropped += 1
+                self._dropped.inc()
+                logger.warning(f"Send queue for room {self.id} is full, dropped a message")
+            self._pending.append((text, received))
+            self._queue_length.set(len(self._pending))
+            self._ready.notify()
+
+    def __len__(self):
+        return len(self._pending)
+
+    def _next_message(self):
+        """Take the next message to post off the queue; hold the lock"""
+        text, received = self._pending.popleft()
+        lines, times = [text], [received]
+        length = len(text)
+        if self.coalesce:
+            while self._pending:
+                length += 1 + len(self._pending[0][0])
+                if length > MAX_MESSAGE_LENGTH:
+                    break
+                text, received = self._pending.popleft()
+                lines.append(text)
+                times.append(received)
+        self._queue_length.set(len(self._pending))
+        return "\n".join(lines), times
+
+    def _deliver(self, text):
+        """Post text, retrying for as long as chat throttles us, and a few
+        times after transient failures"""
+        attempt = 0
+        while True:
+            try:
+                self._post(self.room, text)
+            except Transient as error:
+                if attempt >= self.retries:
+                    raise
+                delay = self.retry_delay * 2 ** attempt
+                attempt += 1
+                logger.warning(
+                    f"Failed to send message to room {self.id}, "
+                    f"retrying in {delay:g} seconds: {error}")
+                self._sleep(delay)
+                continue
+            except Throttled as throttled:
+                self.throttled += 1
+                self._throttled.inc()
+                self.interval = min(self.max_interval, self.interval * 2)
+                logger.info(
+                    f"Throttled in room {self.id}, waiting {throttled.wait} seconds")
+                self._sleep(throttled.wait)
+                continue
+            self.interval = max(self.min_interval, self.interval * 0.9)
+            return
+
+    def _run(self):
+        while True:
+            with self._ready:
+                while not self._pending and not self._stopping:
+                    self._ready.wait()
+                if not self._pending:
+                    return
+            # pace the posts; more messages may queue up meanwhile
+            delay = self._next_post - time.monotonic()
+            if delay > 0:
+                self._sleep(delay)
+            with self._ready:
+                text, times = self._next_message()
+            try:
+                with _SEND_SECONDS.time():
+                    self._deliver(text)
+            except Exception:
+                _SEND_ERRORS.inc()
+                logger.exception(f"Failed to send message to room {self.id}")
+            else:
+                self.posts += 1
+                self.lines += len(times)
+                self._posts.inc()
+                posted = time.monotonic()
+                for received in times:
+                    self._feed_to_chat.observe(posted - received)
+            self._next_post = time.monotonic() + self.interval
+
+    def start(self):
+        self._stopping = False
+        self._thread = Thread(
+            target=self._run, name=f"sender-{self.id}", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """Send the queued messages, then stop the worker thread"""
+        with self._ready:
+            self._stopping = True
+            self._ready.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
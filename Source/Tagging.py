@@ -1,90 +1,292 @@
-import jsonpickle
-import tabulate
+import json
+import logging
+from threading import Lock
+
 import BotpySE as bp
 
+from Matching import PatternSet
+from Notifications import _at_notification
+from Pages import PageCache, paginate, parse_listing_arguments, select_page
+from Persistence import atomic_write
+
 # Our own little re wrapper libraryo
 import regex as re
 
 
+logger = logging.getLogger(__name__)
+
+# tags.json holds {"version": TAGS_VERSION, "tags": [[name, regex, user_id,
+# user_name], ...]}; older files are a jsonpickle encoded list of Tags
+TAGS_VERSION = 1
+
+
 class Tag:
+    __slots__ = ("name", "regex", "_pattern", "user_id", "user_name", "format")
+
     def __init__(self, name, regex, user_id, user_name):
-        normalized_regex = re.compile(regex).pattern
+        self._pattern = re.compile(regex)
 
         self.name = name
-        self.regex = normalized_regex
+        self.regex = self._pattern.pattern
         self.user_id = user_id
         self.user_name = user_name
 
         self.format = "[tag:" + self.name + "]"
 
+    @classmethod
+    def restore(cls, name, regex, user_id, user_name):
+        """Recreate a saved tag; its (normalized) regex is compiled lazily"""
+        tag = cls.__new__(cls)
+        tag._pattern = None
+        tag.name = name
+        tag.regex = regex
+        tag.user_id = user_id
+        tag.user_name = user_name
+        tag.format = "[tag:" + name + "]"
+        return tag
+
+    @property
+    def pattern(self):
+        if self._pattern is None:
+            self._pattern = re.compile_normalized(self.regex)
+        return self._pattern
+
+
+def _compile_search(regex):
+    return re.compile_normalized(regex).search
+
+
+def _lazy_search(compile, regex):
+    """Search function that only compiles regex when first called"""
+    search = None
+
+    def lazy_search(post):
+        nonlocal search
+        if search is None:
+            search = compile(regex)
+        return search(post)
+
+    return lazy_search
+
+
+def _load_tags(filename):
+    """Read the saved tags, and whether the file is in an older format"""
+    try:
+        with open(filename, 'r', encoding='utf8') as file_handle:
+            saved = json.load(file_handle)
+    except FileNotFoundError:
+        return [], False
+
+    if isinstance(saved, list):
+        # jsonpickle encoded Tag objects, with their attributes either
+        # inline or as a py/state dictionary
+        states = [tag.get("py/state", tag) for tag in saved]
+        return [
+            (state["name"], state["regex"], state["user_id"], state["user_name"])
+            for state in states], True
+
+    if saved.get("version") != TAGS_VERSION:
+        raise ValueError("Unsupported tags file version {0!r} in {1}".format(
+            saved.get("version"), filename))
+    return saved["tags"], False
+
+
+class _TagSnapshot:
+    """Immutable view of the tags, for lock-free reads
+
+    searches holds the search function for each tag, in the same order as
+    tags. A new snapshot replaces the old one whenever the tags change.
+    """
+
+    __slots__ = ("version", "tags", "searches", "prefilter", "patterns")
+
+    def __init__(self, version, tags, searches):
+        regexes = tuple(tag.regex for tag in tags)
+        self.version = version
+        self.tags = tags
+        self.searches = searches
+        self.prefilter = re.Prefilter(regexes)
+        # the tags as registered with the MatchEngine
+        self.patterns = PatternSet(
+            regexes, searches, tuple(tag.format for tag in tags))
+
 
 class TagManager:
-    def __init__(self, filename='./tags.json'):
-        self.tags = list()
+    def __init__(self, filename='./tags.json', persistence=None, guard=None):
         self.filename = filename
-
-        try:
-            with open(filename, 'r') as file_handle:
-                tags = jsonpickle.decode(file_handle.read())
-            self.tags = tags
-        except FileNotFoundError:
-            pass
+        self._persistence = persistence
+        # with a RegexGuard, tag patterns are run under its time budget
+        self.guard = guard
+        self._compile = _compile_search if guard is None else guard.compile
+        # regex -> search function
+        self._searches = dict()
+        self._lock = Lock()
+        self._write_lock = Lock()
+        # all tags in the order they were added, and indexed by name
+        self._tags = dict()
+        self._by_name = dict()
+        self._snapshot = _TagSnapshot(0, (), ())
+        # the pages rendered by listtags, for the current version
+        self.pages = PageCache()
+
+        saved, migrate = _load_tags(filename)
+        with self._lock:
+            for fields in saved:
+                tag = Tag.restore(*fields)
+                self._insert(tag)
+                # saved patterns are known to be valid, and many never get
+                # past the prefilter; compile them on first use
+                if tag.regex not in self._searches:
+                    self._searches[tag.regex] = _lazy_search(
+                        self._compile, tag.regex)
+            self._publish()
+        if migrate:
+            self._write()
+            logger.info("Converted {0} to version {1} of the tags format".format(
+                filename, TAGS_VERSION))
+
+    @property
+    def tags(self):
+        return self._snapshot.tags
+
+    @property
+    def patterns(self):
+        """The current tag patterns, for a MatchEngine"""
+        return self._snapshot.patterns
+
+    @property
+    def version(self):
+        """Incremented whenever the tags change"""
+        return self._snapshot.version
+
+    def _insert(self, tag):
+        self._tags[tag] = None
+        self._by_name.setdefault(tag.name, []).append(tag)
+
+    def _discard(self, tag):
+        del self._tags[tag]
+        named = self._by_name[tag.name]
+        named.remove(tag)
+        if not named:
+            del self._by_name[tag.name]
+
+    def _search(self, tag):
+        search = self._searches.get(tag.regex)
+        if search is None:
+            if self.guard is None:
+                search = tag.pattern.search
+            else:
+                search = self.guard.compile(tag.regex)
+            self._searches[tag.regex] = search
+        return search
+
+    def _publish(self):
+        """Swap in a snapshot of the current tags; call with the lock held"""
+        tags = tuple(self._tags)
+        searches = tuple(self._search(tag) for tag in tags)
+        used = {tag.regex for tag in tags}
+        for regex in self._searches.keys() - used:
+            del self._searches[regex]
+        self._snapshot = _TagSnapshot(self._snapshot.version + 1, tags, searches)
 
     def add(self, tag):
-        self.tags.append(tag)
+        with self._lock:
+            self._insert(tag)
+            self._publish()
         self.save()
         return tag
 
     def remove(self, name):
-        for tag in self.tags:
-            if tag.name == name:
-                self.tags.remove(tag)
-                self.save()
-                return True
-        return False
+        with self._lock:
+            named = self._by_name.get(name)
+            if not named:
+                return False
+            self._discard(named[0])
+            self._publish()
+        self.save()
+        return True
+
+    def _remove_where(self, predicate):
+        with self._lock:
+            removed = [tag for tag in self._tags if predicate(tag)]
+            for tag in removed:
+                self._discard(tag)
+            if removed:
+                self._publish()
+        if removed:
+            self.save()
+        return removed
 
     def remove_matching(self, expr):
         r = re.compile(expr)
-        remove = []
-        for tag in self.tags:
-            if r.search(tag.regex):
-                remove.append(tag)
-        for tag in remove:
-            self.tags.remove(tag)
-        self.save()
-        return remove
+        return self._remove_where(lambda tag: r.search(tag.regex))
+
+    def quarantine(self, pattern, reason):
+        """Remove the tags using a pattern quarantined by the regex guard
+
+        Returns messages telling the owners of the removed tags why.
+        """
+        removed = self._remove_where(lambda tag: tag.regex == pattern)
+        return ["{0} {1} for regex `{2}` has been disabled: {3}".format(
+            _at_notification(tag.user_name), tag.format, tag.regex, reason)
+            for tag in removed]
 
     def filter_post(self, post):
-        tags = list()
-        for tag in self.tags:
-            if re.search(tag.regex, post):
-                tags.append(tag.format)
-        return " ".join(tags) + post
+        # a single reference read; the snapshot is never mutated. Only tags
+        # whose required literal text is in the post can match.
+        snapshot = self._snapshot
+        tags, searches = snapshot.tags, snapshot.searches
+        formats = [tags[index].format
+                   for index in snapshot.prefilter.candidates(post)
+                   if searches[index](post)]
+        return " ".join(formats) + post
 
     def list(self):
-        for tag in self.tags:
-            yield tag
+        yield from self._snapshot.tags
 
     def save(self):
-        encoded = jsonpickle.encode(self.tags)
-        with open(self.filename, "w") as file_handle:
-            file_handle.write(encoded)
+        if self._persistence is None:
+            self._write()
+        else:
+            self._persistence.schedule(self.filename, self._write)
+
+    def _write(self):
+        # serialized, so an older snapshot can't overwrite a newer one
+        with self._write_lock:
+            tags = [[tag.name, tag.regex, tag.user_id, tag.user_name]
+                    for tag in self._snapshot.tags]
+            atomic_write(self.filename, json.dumps(
+                {"version": TAGS_VERSION, "tags": tags}))
 
 
 class CommandListTags(bp.Command):
     @staticmethod
     def usage():
-        return ["listtags", "list tags", "tags", "all tags"]
+        # [by <user>] [<text in the name or regex>] [page <n>]
+        return ["listtags ...", "list tags ...", "tags ...", "all tags ..."]
 
     def run(self):
-        tag_list = list()
-        for tag in self.command_manager.tags.list():
-            tag_list.append([tag.name, tag.regex, tag.user_name])
+        tags = self.command_manager.tags
+        try:
+            user, text, page = parse_listing_arguments(self.arguments)
+        except ValueError as err:
+            self.reply(str(err))
+            return
+
+        def render():
+            tag_list = list()
+            for tag in tags.list():
+                if user is not None and user not in tag.user_name.lower():
+                    continue
+                if text is not None and text not in tag.name.lower() \
+                        and text not in tag.regex.lower():
+                    continue
+                tag_list.append([tag.name, tag.regex, tag.user_name])
 
-        table = tabulate.tabulate(
-            tag_list, headers=["Name", "Regex", "Added By"], tablefmt="orgtbl")
+            return paginate(tag_list, ["Name", "Regex", "Added By"])
 
-        self.post("    " + re.sub('\n', '\n    ', table), False)
+        pages = tags.pages.get(tags.version, (user, text), render)
+        self.post(select_page(pages, page), False)
 
 
 class CommandAddTag(bp.Command):
@@ -112,6 +314,12 @@ class CommandAddTag(bp.Command):
 
         regex = ' '.join(self.arguments[1:])
 
+        guard = self.command_manager.tags.guard
+        if guard is not None and re.normalize(regex) in guard.quarantined:
+            self.reply("Could not add tag for regex {0}: the pattern is "
+                "quarantined for running too slowly".format(regex))
+            return
+
         try:
             newtag = self.command_manager.tags.add(
                 Tag(tag_name, regex, user_id, user_name))
@@ -0,0 +1,65 @@
+import logging
+import os
+import subprocess
+
+
+logger = logging.getLogger(__name__)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# the commit the bot runs, written when the image is built; read only
+VERSION_FILE = os.path.join(ROOT, "version.txt")
+
+# root -> commit, as git reported it to this process
+_git_hashes = {}
+
+
+def _git_hash(root):
+    try:
+        result = subprocess.run(
+            ['git', '-C', root, 'rev-parse', 'HEAD'],
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    except OSError:
+        return None
+    if result.returncode != 0:
+        return None
+    return result.stdout.decode('utf-8').strip()
+
+
+def current_hash(filename=VERSION_FILE, root=ROOT, length=6):
+    """The abbreviated hash of the running commit
+
+    Read from filename if the build wrote it there; otherwise asks git,
+    once per process: a checkout changing the code also needs a restart
+    to run it.
+
+    """
+    try:
+        with open(filename, 'r', encoding='ascii') as version_file:
+            commit = version_file.read().strip()
+        if commit:
+            return commit[:length]
+    except (OSError, ValueError):
+        pass
+
+    commit = _git_hashes.get(root)
+    if commit is None:
+        commit = _git_hash(root)
+        if commit is None:
+            logger.warning("Could not determine the version of the bot")
+            return ""
+        _git_hashes[root] = commit
+    return commit[:length]
+
+
+def forget(filename=VERSION_FILE):
+    """Drop what is known about the version, after the code was updated
+
+    The build's version file no longer describes the updated code either.
+
+    """
+    _git_hashes.clear()
+    try:
+        os.remove(filename)
+    except FileNotFoundError:
+        pass
@@ -6,42 +6,188 @@
 # This file is licensed under the MIT License.
 #
 
-import threading
+import asyncio
+import inspect
 import logging
+import random
+import threading
+import time
+
+import websockets
+
+from Metrics import (
+    ERRORS, FEED_DOWNTIME, FEED_MESSAGES, FEED_RECONNECTS, STAGE_SECONDS)
+
+
+class _FeedLoop:
+    """Event loop shared by all websocket listeners, in a single thread"""
 
-import websocket
+    def __init__(self):
+        self._loop = None
+        self._lock = threading.Lock()
+
+    def submit(self, coroutine):
+        """Run coroutine on the loop, returning a concurrent Future"""
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(
+                    target=self._loop.run_forever, name="websockets",
+                    daemon=True).start()
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop)
+
+
+_feeds = _FeedLoop()
 
 
 class WebsocketListener:
-    def __init__(self, websocket_link, on_message_callback, notifications=None):
+    """Feed the messages from a websocket to a callback
+
+    All listeners share one event loop thread. The callback is called as
+    on_message_callback(ws, message) on that thread, and may be a
+    coroutine function; it should hand off anything slow.
+
+    The connection is kept alive with pings, and re-established whenever
+    it drops, or when no message arrived for quiet_timeout seconds, after
+    an exponential backoff with jitter (min_backoff up to max_backoff
+    seconds). reconnects counts the reconnections, downtime adds up the
+    seconds spent disconnected; both are exported as metrics too.
+
+    """
+
+    def __init__(
+        self,
+        websocket_link,
+        on_message_callback,
+        notifications=None,
+        ping_interval=20,
+        ping_timeout=20,
+        quiet_timeout=600,
+        min_backoff=1,
+        max_backoff=60,
+    ):
         self.websocket_link = websocket_link
         self.on_message_callback = on_message_callback
         self.notifications = notifications
+        self.ping_interval = ping_interval
+        self.ping_timeout = ping_timeout
+        self.quiet_timeout = quiet_timeout
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
         self.closed = True
+        self.ws = None
+        self.reconnects = 0
+        self.downtime = 0.0
+        # time.monotonic() when the connection was lost, None when connected
+        self.down_since = None
+        self._task = None
+        self._messages = FEED_MESSAGES.labels(websocket_link)
+        self._reconnects = FEED_RECONNECTS.labels(websocket_link)
+        self._downtime = FEED_DOWNTIME.labels(websocket_link)
+        self._errors = ERRORS.labels("websocket")
+        self._receive_seconds = STAGE_SECONDS.labels("receive")
 
     def on_error(self, ws, error):
+        self._errors.inc()
         logging.error("A websocket error occurred on websocket '{0}':".format(
             self.websocket_link))
         logging.error(error)
 
     def on_close(self, ws):
         self.closed = True
-        print( "The websocket with link '{0}' was closed.".format(
+        logging.info("The websocket with link '{0}' was closed.".format(
             self.websocket_link))
 
+    async def _dispatch(self, ws, message):
+        self._messages.inc()
+        start = time.perf_counter()
+        try:
+            result = self.on_message_callback(ws, message)
+            if inspect.isawaitable(result):
+                await result
+        except Exception as error:
+            self.on_error(ws, error)
+        self._receive_seconds.observe(time.perf_counter() - start)
+
+    def _backoff(self, attempt):
+        """Seconds to wait before reconnection attempt (counting from 0)"""
+        delay = min(self.max_backoff, self.min_backoff * 2 ** attempt)
+        return random.uniform(delay / 2, delay)
+
+    def _connected(self):
+        self.closed = False
+        if self.down_since is not None:
+            down = time.monotonic() - self.down_since
+            self.reconnects += 1
+            self._reconnects.inc()
+            self.downtime += down
+            self._downtime.inc(down)
+            self.down_since = None
+            logging.info("Reconnected to websocket '{0}' after {1:.1f} seconds".format(
+                self.websocket_link, down))
+
+    async def _receive(self, ws):
+        """Dispatch messages until the connection drops or goes quiet"""
+        while True:
+            try:
+                message = await asyncio.wait_for(ws.recv(), self.quiet_timeout)
+            except asyncio.TimeoutError:
+                logging.warning(
+                    "No messages on websocket '{0}' for {1} seconds, "
+                    "reconnecting".format(self.websocket_link, self.quiet_timeout))
+                return
+            await self._dispatch(ws, message)
+
+    async def _run(self):
+        attempt = 0
+        while True:
+            ws = None
+            try:
+                async with websockets.connect(
+                        self.websocket_link,
+                        ping_interval=self.ping_interval,
+                        ping_timeout=self.ping_timeout) as ws:
+                    self.ws = ws
+                    self._connected()
+                    attempt = 0
+                    await self._receive(ws)
+            except websockets.exceptions.ConnectionClosedOK:
+                pass
+            except (OSError, asyncio.TimeoutError,
+                    websockets.exceptions.WebSocketException) as error:
+                # a TimeoutError is an opening handshake that took too long
+                self.on_error(ws, error)
+            except asyncio.CancelledError:
+                # an Exception before Python 3.8; stop() cancels the task
+                raise
+            except Exception:
+                # anything else must not end the task, and with it the feed
+                self._errors.inc()
+                logging.exception(
+                    "Unexpected error on websocket '{0}', reconnecting".format(
+                        self.websocket_link))
+            finally:
+                self.on_close(ws)
+                if self.down_since is None:
+                    self.down_since = time.monotonic()
+            await asyncio.sleep(self._backoff(attempt))
+            attempt += 1
+
+    async def _start(self):
+        self._task = asyncio.ensure_future(self._run())
+
+    async def _stop(self):
+        task, self._task = self._task, None
+        # before Python 3.12, wait_for() can swallow a cancellation
+        while task is not None and not task.done():
+            task.cancel()
+            await asyncio.wait([task], timeout=0.1)
+
     def start(self):
         self.closed = False
-        websocket.enableTrace(True)
-        ws = websocket.WebSocketApp(
-            self.websocket_link,
-            on_error=self.on_error,
-            on_close=self.on_close,
-            on_message=self.on_message_callback)
-        ws_thread = threading.Thread(target = ws.run_forever)
-        ws_thread.start()
-        self.ws = ws
-        self.ws_thread = ws_thread
-
-    def stop(self):
+        _feeds.submit(self._start()).result()
+
+    def stop(self, timeout=None):
+        """Close the websocket, waiting up to timeout seconds for it"""
+        _feeds.submit(self._stop()).result(timeout)
         self.closed = True
-        self.ws.keep_running = False
@@ -1,6 +1,16 @@
-from re import compile, search, match, sub, I, error
+from re import compile, search, match, sub, escape, I, error
+from functools import lru_cache
 from html import unescape
 
+from Metrics import PATTERN_CACHE_LOOKUPS, PATTERN_CACHE_SIZE
+
+try:
+    from re import _constants as _sre_constants, _parser as _sre_parse
+except ImportError:  # pragma: no cover
+    # Python < 3.11
+    import sre_constants as _sre_constants
+    import sre_parse as _sre_parse
+
 
 _re_compile = compile
 
@@ -9,5 +19,155 @@ def normalize(regex):
         regex = regex[6:-7]
     return unescape(regex)
 
+# the shared pattern cache; always called as _cached_compile(regex, flags),
+# as lru_cache keys calls with and without the default flags apart
+_cached_compile = lru_cache(maxsize=4096)(_re_compile)
+
+def compile_normalized(regex, flags=0):
+    """Compile an already normalized regex, through the shared pattern cache
+
+    The cache is process wide and evicts the least recently used patterns,
+    so patterns used by several rooms, tags and commands are compiled once.
+    Invalid patterns are not cached, and raise re.error every time.
+
+    """
+    return _cached_compile(regex, flags)
+
 def compile(regex, flags=0):
-    return _re_compile(normalize(regex), flags)
+    return _cached_compile(normalize(regex), flags)
+
+def cache_info():
+    """Hits, misses and size of the shared pattern cache"""
+    return _cached_compile.cache_info()
+
+# read when the metrics are scraped, rather than counted on every lookup
+PATTERN_CACHE_LOOKUPS.set_function(lambda: cache_info().hits, "hit")
+PATTERN_CACHE_LOOKUPS.set_function(lambda: cache_info().misses, "miss")
+PATTERN_CACHE_SIZE.set_function(lambda: cache_info().currsize)
+
+
+# Longer required literals are truncated, any prefix is required too
+_MAX_LITERAL = 32
+# Under IGNORECASE, re also matches these letters to non-ASCII characters
+# that don't casefold to the same letter (i and dotless i, s and long s).
+_UNSAFE_IGNORECASE = frozenset("iIsS")
+
+
+def _literal_runs(items, ignorecase, runs):
+    """Collect runs of literal characters every match of items contains"""
+    run = []
+    for op, av in items:
+        if op is _sre_constants.LITERAL:
+            char = chr(av)
+            if not ignorecase or (char.isascii() and char not in _UNSAFE_IGNORECASE):
+                run.append(char)
+                continue
+        runs.append("".join(run))
+        run = []
+        if op is _sre_constants.SUBPATTERN:
+            _, add_flags, del_flags, sub = av
+            sub_ignorecase = (ignorecase or add_flags & I) and not del_flags & I
+            _literal_runs(sub, sub_ignorecase, runs)
+        elif op in (_sre_constants.MAX_REPEAT, _sre_constants.MIN_REPEAT):
+            low, _, sub = av
+            if low:
+                _literal_runs(sub, ignorecase, runs)
+    runs.append("".join(run))
+
+
+@lru_cache(maxsize=4096)
+def required_literal(regex):
+    """Casefolded literal text that any text regex matches must contain
+
+    Returns the longest such run of literal characters, or an empty string
+    if the pattern has no required literal text (or is invalid). The check
+    is conservative: the casefolded form of every text the pattern matches
+    contains the returned literal.
+
+    """
+    try:
+        parsed = _sre_parse.parse(regex)
+    except error:
+        return ""
+    state = getattr(parsed, "state", None) or parsed.pattern
+    runs = []
+    _literal_runs(parsed, bool(state.flags & I), runs)
+    return max(runs, key=len)[:_MAX_LITERAL].casefold()
+
+
+def _trie_pattern(node):
+    """Regex for the optional continuations below a trie node"""
+    branches = [escape(char) + _trie_pattern(child) for char, child in node.items()]
+    if not branches:
+        return ""
+    return "(?:" + "|".join(branches) + ")?"
+
+
+class LiteralScanner:
+    """Find which of a set of literals occur in a text, in a single pass
+
+    The literals are compiled into one trie-shaped regex inside a lookahead,
+    so the scan runs in the re engine. At each position the lookahead
+    captures the longest trie path present; every literal found at that
+    position is a prefix of that path.
+
+    """
+
+    def __init__(self, literals):
+        self._literals = frozenset(literals)
+        trie = {}
+        for literal in self._literals:
+            node = trie
+            for char in literal:
+                node = node.setdefault(char, {})
+        branches = [escape(char) + _trie_pattern(child) for char, child in trie.items()]
+        self._finditer = _re_compile(
+            "(?=(" + "|".join(branches) + "))"
+        ).finditer if branches else None
+
+    def scan(self, text):
+        """Return the set of literals contained in text"""
+        found = set()
+        if self._finditer is None:
+            return found
+        literals = self._literals
+        for path in {match[1] for match in self._finditer(text)}:
+            found.update(
+                path[:end] for end in range(1, len(path) + 1) if path[:end] in literals
+            )
+        return found
+
+
+class Prefilter:
+    """Select the patterns in a sequence that could match a text
+
+    Each pattern's required literal is extracted up front; candidates()
+    then scans the (casefolded) text once and only returns the positions
+    of patterns whose literal was found, plus those without a literal.
+
+    """
+
+    __slots__ = ("_always", "_by_literal", "_scanner")
+
+    def __init__(self, patterns):
+        self._always = []
+        self._by_literal = {}
+        for index, pattern in enumerate(patterns):
+            literal = required_literal(pattern)
+            if literal:
+                self._by_literal.setdefault(literal, []).append(index)
+            else:
+                self._always.append(index)
+        self._scanner = LiteralScanner(self._by_literal)
+
+    def candidates(self, text):
+        """Sorted positions of the patterns that could match text"""
+        found = self._scanner.scan(text.casefold())
+        if not found:
+            return self._always
+        by_literal = self._by_literal
+        indices = list(self._always)
+        for literal in found:
+            indices += by_literal[literal]
+        indices.sort()
+        return indices
@@ -1,8 +1,15 @@
+from Lifecycle import StartupTimer
+
+# time the startup from the beginning, imports included
+timer = StartupTimer()
+
 import os
 import getpass
 import logging
 
-from Pulse import *
+from Pulse import Pulse
+
+timer.mark("imports")
 
 
 if 'PulseEmail' in os.environ:
@@ -15,5 +22,7 @@ if 'PulsePass' in os.environ:
 else:
     password = getpass.getpass("Password: ")
 
+timer.mark("credentials")
+
 logging.basicConfig(format='%(asctime)s:%(module)s:%(message)s', level=logging.INFO)
-Pulse("PulseMonitor", email, password, rooms=[65945])
+Pulse("PulseMonitor", email, password, rooms=[65945], timer=timer)
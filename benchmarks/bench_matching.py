@@ -0,0 +1,292 @@
+"""Microbenchmarks for the pattern matching hot paths
+
+Synthetic workloads of rooms, users and patterns of varying complexity are
+generated from a fixed seed, and the notification and tag operations run
+against them on a stream of messages. Per-call latencies are collected,
+and throughput and p50/p99 latency reported as JSON, keyed by workload and
+operation so that two reports can be compared.
+
+Run standalone:
+
+    python benchmarks/bench_matching.py --output report.json
+    python benchmarks/bench_matching.py --compare report.json
+
+The tests run it with reduced workloads, see tests/test_benchmarks.py.
+
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import string
+import subprocess
+import sys
+import tempfile
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from statistics import mean
+from time import perf_counter_ns
+
+_source = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Source")
+if _source not in sys.path:
+    sys.path.insert(0, _source)
+
+from Notifications import Notifications  # noqa: E402
+from percentiles import percentile  # noqa: E402
+from Persistence import Persistence  # noqa: E402
+from Tagging import Tag, TagManager  # noqa: E402
+
+
+REPORT_VERSION = 1
+
+
+@dataclass(frozen=True)
+class Workload:
+    name: str
+    rooms: int
+    users: int
+    # subscriptions, spread over the rooms and users
+    patterns: int
+    tags: int
+    # "literal", "mixed" or "complex"
+    complexity: str
+    # fraction of messages that contain text some pattern matches
+    hit_rate: float
+    message_words: tuple = (5, 40)
+    messages: int = 2000
+    # patterns added and then removed again
+    changes: int = 200
+
+
+WORKLOADS = [
+    Workload("small-literal", rooms=2, users=20, patterns=50, tags=10,
+             complexity="literal", hit_rate=0.1),
+    Workload("medium-mixed", rooms=5, users=200, patterns=500, tags=50,
+             complexity="mixed", hit_rate=0.2),
+    Workload("large-complex", rooms=10, users=1000, patterns=3000, tags=200,
+             complexity="complex", hit_rate=0.3, message_words=(5, 120)),
+]
+
+
+def _patterns(rng, words, complexity):
+    """Generate (pattern, sample text it matches) pairs
+
+    The sample is empty for patterns without a required word.
+
+    """
+    def word():
+        return rng.choice(words)
+
+    simple = [
+        lambda w: (w, w),
+    ]
+    mixed = simple + [
+        lambda w: (f"(?i){w}", w.upper()),
+        lambda w: (rf"{w}\d+", f"{w}42"),
+        lambda w: (rf"\b{w}\b", w),
+        lambda w: (rf"{w}\s+{w}", f"{w} {w}"),
+        lambda w: (rf"[23]/3 {w}", f"2/3 {w}"),
+    ]
+    complex_ = mixed + [
+        lambda w: (f"(?:{w}|{word()}|{word()})", w),
+        lambda w: (f"{w}.{{0,30}}{word()}", ""),
+        lambda w: (rf"(?i){w}(?:\W+\w+){{0,3}}\W+end", f"{w} a b end"),
+        lambda w: (r"^[A-Z][a-z]+ \d{3,}", ""),
+        lambda w: (r"\b[A-Z]{4,}\b", ""),
+    ]
+    generators = {"literal": simple, "mixed": mixed, "complex": complex_}[complexity]
+    while True:
+        yield rng.choice(generators)(word())
+
+
+def _build(workload, directory, seed):
+    """Create the stores and message stream for a workload"""
+    rng = random.Random(seed)
+    words = sorted({
+        "".join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 9)))
+        for _ in range(3000)
+    })
+    rooms = [str(1000 + n) for n in range(workload.rooms)]
+    users = {str(n): f"User {n}" for n in range(workload.users)}
+
+    generate = _patterns(rng, words, workload.complexity)
+    notifications, samples = {room: {} for room in rooms}, []
+    for _ in range(workload.patterns):
+        pattern, sample = next(generate)
+        room, user = rng.choice(rooms), rng.choice(list(users))
+        notifications[room].setdefault(pattern, []).append(user)
+        if sample:
+            samples.append(sample)
+
+    filename = os.path.join(directory, f"{workload.name}.notifications.json")
+    with open(filename, "w", encoding="utf8") as notifications_file:
+        json.dump([notifications, users], notifications_file)
+    # writes are only scheduled, the flusher is never started
+    persistence = Persistence(interval=3600)
+    store = Notifications(rooms, filename, persistence=persistence)
+
+    tags = TagManager(
+        os.path.join(directory, f"{workload.name}.tags.json"), persistence)
+    for n in range(workload.tags):
+        pattern, sample = next(generate)
+        tags.add(Tag(f"tag{n}", pattern, "0", "User 0"))
+        if sample:
+            samples.append(sample)
+
+    messages = []
+    low, high = workload.message_words
+    for _ in range(workload.messages):
+        text = rng.choices(words, k=rng.randint(low, high))
+        if samples and rng.random() < workload.hit_rate:
+            text.insert(rng.randrange(len(text) + 1), rng.choice(samples))
+        messages.append(" ".join(text))
+
+    new_patterns = [next(generate)[0] for _ in range(workload.changes)]
+    return rng, rooms, list(users), store, tags, messages, new_patterns
+
+
+def _measure(function, calls, warmup=20):
+    """Call function(*args) for each args in calls, returning statistics"""
+    for args in calls[:warmup]:
+        function(*args)
+    timings = []
+    for args in calls:
+        start = perf_counter_ns()
+        function(*args)
+        timings.append(perf_counter_ns() - start)
+    p50, p99 = percentile(timings, 50), percentile(timings, 99)
+    return {
+        "calls": len(timings),
+        "ops_per_sec": round(len(timings) / (sum(timings) / 1e9), 1),
+        "mean_us": round(mean(timings) / 1000, 2),
+        "p50_us": round(p50 / 1000, 2),
+        "p99_us": round(p99 / 1000, 2),
+    }
+
+
+def run_workload(workload, directory, seed=0):
+    """Run the benchmarks for a single workload"""
+    rng, rooms, users, store, tags, messages, new_patterns = _build(
+        workload, directory, seed)
+
+    def consume(generator):
+        for _ in generator:
+            pass
+
+    results = {}
+    results["notifications.filter_post"] = _measure(
+        store.filter_post, [(rng.choice(rooms), message) for message in messages])
+    results["notifications.filter_post_many"] = _measure(
+        store.filter_post_many, [(rooms, message) for message in messages])
+    results["notifications.list_room"] = _measure(
+        lambda room: consume(store.list(room)),
+        [(rng.choice(rooms),) for _ in range(200)])
+    results["notifications.list_user"] = _measure(
+        lambda room, user: consume(store.list(room, user)),
+        [(rng.choice(rooms), rng.choice(users)) for _ in range(2000)])
+
+    added = [
+        (rng.choice(rooms), pattern, f"new{n}", f"New User {n}")
+        for n, pattern in enumerate(new_patterns)
+    ]
+    results["notifications.add"] = _measure(store.add, added, warmup=0)
+    results["notifications.remove_matching"] = _measure(
+        store.remove_matching,
+        [(room, pattern, user) for room, pattern, user, _ in added],
+        warmup=0)
+
+    results["tags.filter_post"] = _measure(
+        tags.filter_post, [(message,) for message in messages])
+    return results
+
+
+def _commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(workloads=WORKLOADS, seed=0):
+    """Run the benchmarks, returning the report as a dictionary"""
+    report = {
+        "version": REPORT_VERSION,
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": _commit(),
+        "python": f"{platform.python_implementation()} {platform.python_version()}",
+        "platform": platform.platform(),
+        "seed": seed,
+        "workloads": {workload.name: asdict(workload) for workload in workloads},
+        "results": {},
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        for workload in workloads:
+            for operation, stats in run_workload(workload, directory, seed).items():
+                report["results"][f"{workload.name}/{operation}"] = stats
+    return report
+
+
+def quick(workloads=WORKLOADS):
+    """Smaller variants of the workloads, for a fast smoke run"""
+    return [
+        Workload(**{
+            **asdict(workload),
+            "patterns": min(workload.patterns, 200),
+            "messages": 200,
+            "changes": 20,
+        })
+        for workload in workloads
+    ]
+
+
+def compare(baseline, report):
+    """Format a table of p50 latency and throughput changes"""
+    lines = [
+        f"{'benchmark':<48} {'p50 us':>10} {'was':>10} {'ops/s':>12} {'speedup':>8}"
+    ]
+    for key, stats in report["results"].items():
+        old = baseline["results"].get(key)
+        if old is None:
+            continue
+        lines.append(
+            f"{key:<48} {stats['p50_us']:>10.2f} {old['p50_us']:>10.2f} "
+            f"{stats['ops_per_sec']:>12.1f} "
+            f"{stats['ops_per_sec'] / old['ops_per_sec']:>7.2f}x"
+        )
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", "-o", help="write the JSON report to this file")
+    parser.add_argument("--compare", metavar="BASELINE",
+                        help="compare against an earlier JSON report")
+    parser.add_argument("--quick", action="store_true", help="run smaller workloads")
+    parser.add_argument("--workload", action="append", choices=[w.name for w in WORKLOADS],
+                        help="only run the named workload (repeatable)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    workloads = [w for w in WORKLOADS if not args.workload or w.name in args.workload]
+    if args.quick:
+        workloads = quick(workloads)
+    report = run(workloads, args.seed)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf8") as report_file:
+            report_file.write(output + "\n")
+    elif not args.compare:
+        print(output)
+    if args.compare:
+        with open(args.compare, encoding="utf8") as baseline_file:
+            print(compare(json.load(baseline_file), report))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Load test for the chat sender under burst traffic
+
+A burst of feed lines is sent to a few rooms through RoomSenders posting
+to a local FakeChat, once posting every line on its own and once
+coalescing queued lines; the number of posts, throttling responses and
+the time until the last line was delivered are reported as JSON.
+
+Run standalone:
+
+    python benchmarks/bench_sender.py --lines 200 --output report.json
+
+The tests run it with a small burst, see tests/test_benchmarks.py.
+
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+_source = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Source")
+if _source not in sys.path:
+    sys.path.insert(0, _source)
+
+from fake_chat import FakeChat  # noqa: E402
+from Sender import RoomSender  # noqa: E402
+
+
+def _line(room, n):
+    return (
+        f"[ [Halflife](https://github.com/Charcoal-SE/halflife) ] "
+        f"Burst line {n} for room {room}: post score 3/3 on stackoverflow.com "
+        f"https://stackoverflow.com/q/{1000000 + n}"
+    )
+
+
+def run_burst(lines=100, rooms=2, coalesce=True, chat_interval=0.1, burst=3):
+    """Send lines messages to each room at once, return the statistics"""
+    chat = FakeChat(interval=chat_interval, burst=burst)
+    chat.start()
+    senders = [
+        RoomSender(
+            chat.room(room), maxsize=lines, coalesce=coalesce,
+            interval=chat_interval, min_interval=chat_interval)
+        for room in range(1, rooms + 1)
+    ]
+    try:
+        start = time.monotonic()
+        for sender in senders:
+            sender.start()
+        for n in range(lines):
+            for sender in senders:
+                sender.send_message(_line(sender.id, n))
+        for sender in senders:
+            sender.stop()
+        elapsed = time.monotonic() - start
+    finally:
+        chat.stop()
+
+    delivered = [
+        line for _, text, _ in chat.messages for line in text.split("\n")
+    ]
+    return {
+        "lines": lines * rooms,
+        "delivered": len(delivered),
+        "posts": len(chat.messages),
+        "throttled": chat.throttled,
+        "seconds": round(elapsed, 3),
+        "lines_per_sec": round(len(delivered) / elapsed, 1),
+    }
+
+
+def run(lines=100, rooms=2, chat_interval=0.1, burst=3):
+    return {
+        "lines_per_room": lines,
+        "rooms": rooms,
+        "chat_interval": chat_interval,
+        "chat_burst": burst,
+        "results": {
+            mode: run_burst(lines, rooms, mode == "coalesced", chat_interval, burst)
+            for mode in ("single", "coalesced")
+        },
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lines", type=int, default=100, help="lines per room")
+    parser.add_argument("--rooms", type=int, default=2)
+    parser.add_argument("--chat-interval", type=float, default=0.1,
+                        help="seconds between posts the fake chat allows")
+    parser.add_argument("--output", "-o", help="write the JSON report to this file")
+    args = parser.parse_args(argv)
+
+    output = json.dumps(run(args.lines, args.rooms, args.chat_interval), indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf8") as report_file:
+            report_file.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Local stand-in for the chat message endpoint, for load tests
+
+FakeChat serves POST /chats/<room_id>/messages/new with a text form field,
+like chat.stackexchange.com, and records the messages. Each room accepts a
+burst of messages in quick succession, then one every interval seconds;
+posting faster is refused with the 409 "You can perform this action again
+in N seconds" response chat uses for throttling.
+
+FakeChat.room(room_id) is a stand-in for a chatexchange room posting to
+it, for a RoomSender to post to with Sender.post_message: like the
+chatexchange client, refused posts raise requests.HTTPError, and the
+sender handles the throttling as it does for chat.
+
+"""
+import math
+import re
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from types import SimpleNamespace
+
+import requests
+
+
+_MESSAGES_NEW = re.compile(r"^/chats/(\d+)/messages/new$")
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        match = _MESSAGES_NEW.match(self.path)
+        if match is None:
+            self.send_error(404)
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        form = urllib.parse.parse_qs(self.rfile.read(length).decode("utf8"))
+        status, body = self.server.chat.receive(int(match[1]), form.get("text", [""])[0])
+        body = body.encode("utf8")
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeChat:
+    def __init__(self, interval=0.5, burst=3, host="127.0.0.1", port=0):
+        self.interval = interval
+        self.burst = burst
+        # (room_id, text, time received)
+        self.messages = []
+        self.throttled = 0
+        self._buckets = {}
+        self._lock = threading.Lock()
+        # requests are handled one at a time on the server thread, so the
+        # soak test's thread count only sees the pipeline's threads
+        self._server = HTTPServer((host, port), _Handler)
+        self._server.chat = self
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def receive(self, room_id, text):
+        """Accept or throttle a message, returning the status and body"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.get(room_id, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) / self.interval)
+            if tokens < 1:
+                self._buckets[room_id] = (tokens, now)
+                self.throttled += 1
+                wait = math.ceil((1 - tokens) * self.interval)
+                return 409, f"You can perform this action again in {wait} seconds."
+            self._buckets[room_id] = (tokens - 1, now)
+            self.messages.append((room_id, text, now))
+            return 200, f'{{"id": {len(self.messages)}, "time": {int(time.time())}}}'
+
+    def take(self):
+        """Return the messages received so far, and forget them"""
+        with self._lock:
+            messages, self.messages = self.messages, []
+        return messages
+
+    def send_message(self, room_id, text):
+        """Post text to room_id, like the browser of a chatexchange client"""
+        response = requests.post(
+            f"{self.url}/chats/{room_id}/messages/new", data={"text": text})
+        response.raise_for_status()
+        return response
+
+    def room(self, room_id):
+        """A chatexchange room stand-in, whose client posts to this chat"""
+        return SimpleNamespace(id=room_id, _client=SimpleNamespace(_br=self))
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="fake-chat", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
@@ -0,0 +1,103 @@
+"""Local stand-in for the Halflife websocket feed, for load tests
+
+FakeFeed serves a websocket at FakeFeed.url which sends every client a
+stream of synthetic reports: rate messages per second, plus a burst of
+burst_size messages at once every burst_every seconds. Each message
+carries its sequence number and the time.monotonic() it was sent at, so
+a test in the same process can work out the latency of its posts with
+sent_at().
+
+"""
+import asyncio
+import math
+import re
+import threading
+import time
+
+import websockets
+
+
+_SENT_AT = re.compile(r" t=(\d+\.\d+)")
+
+
+def report(seq, now):
+    """A synthetic Halflife report"""
+    return (
+        f"[ [Halflife](https://github.com/Charcoal-SE/halflife) ] "
+        f"Post {seq}: score {seq % 4}/3 on stackoverflow.com "
+        f"https://stackoverflow.com/q/{1000000 + seq} t={now:.6f}"
+    )
+
+
+def sent_at(line):
+    """The time.monotonic() a line of a report was sent at, or None"""
+    match = _SENT_AT.search(line)
+    return float(match[1]) if match else None
+
+
+class FakeFeed:
+    def __init__(self, rate=10.0, burst_every=None, burst_size=0, make_message=report,
+                 host="127.0.0.1", port=0):
+        self.rate = rate
+        self.burst_every = burst_every
+        self.burst_size = burst_size
+        self.make_message = make_message
+        self.sent = 0
+        self.connections = 0
+        self._host = host
+        self._port = port
+        self._loop = asyncio.new_event_loop()
+        self._thread = None
+        self._server = None
+
+    @property
+    def url(self):
+        host, port = self._server.sockets[0].getsockname()[:2]
+        return f"ws://{host}:{port}/"
+
+    async def _send(self, ws):
+        await ws.send(self.make_message(self.sent, time.monotonic()))
+        self.sent += 1
+
+    async def _handler(self, ws, path=None):
+        self.connections += 1
+        now = time.monotonic()
+        interval = 1 / self.rate if self.rate else math.inf
+        next_send = now if self.rate else math.inf
+        next_burst = now + self.burst_every if self.burst_every else math.inf
+        try:
+            if next_send == next_burst == math.inf:
+                await ws.wait_closed()
+                return
+            while True:
+                now = time.monotonic()
+                if now >= next_burst:
+                    for _ in range(self.burst_size):
+                        await self._send(ws)
+                    next_burst += self.burst_every
+                if now >= next_send:
+                    await self._send(ws)
+                    # keeps to the rate, catching up after a slow send
+                    next_send += interval
+                await asyncio.sleep(max(0, min(next_send, next_burst) - time.monotonic()))
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+    async def _serve(self):
+        self._server = await websockets.serve(self._handler, self._host, self._port)
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._loop.run_forever, name="fake-feed", daemon=True)
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._serve(), self._loop).result()
+
+    def stop(self):
+        async def close():
+            self._server.close()
+            await self._server.wait_closed()
+
+        asyncio.run_coroutine_threadsafe(close(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
@@ -0,0 +1,19 @@
+"""Percentiles for the benchmark reports
+
+statistics.quantiles() would do, but needs Python 3.8.
+
+"""
+
+
+def percentile(values, percent):
+    """The percent-th percentile of values
+
+    Interpolates between the two nearest of the sorted values, the same as
+    statistics.quantiles(values, n=100, method="inclusive")[percent - 1].
+
+    """
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * percent / 100
+    low = int(position)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (position - low)
@@ -0,0 +1,232 @@
+"""Replay a feed capture through the feed pipeline, for load tests
+
+Feeds a capture recorded with PulseCapture (see Source/Capture.py) into
+FeedDispatcher.on_message_handler, as the websocket listeners would, at
+the recorded pace, N times as fast, or as fast as possible. The reports go
+to in-memory rooms instead of chat, directly or through RoomSenders.
+Reports the throughput, the percentiles of the latency from receiving a
+message until its report was posted, and how the posts differ from those
+of an earlier replay.
+
+    python benchmarks/replay.py capture.gz --speed 0 --tags tags.json \\
+        --notifications notifications.json --save-posts before.jsonl
+    python benchmarks/replay.py capture.gz --speed 0 --tags tags.json \\
+        --notifications notifications.json --diff before.jsonl
+
+"""
+import argparse
+import difflib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from collections import deque
+from threading import Lock
+from types import SimpleNamespace
+
+_source = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Source")
+if _source not in sys.path:
+    sys.path.insert(0, _source)
+
+from Capture import read_capture  # noqa: E402
+from Feeds import FEEDS, FeedDispatcher  # noqa: E402
+from Notifications import Notifications  # noqa: E402
+from percentiles import percentile  # noqa: E402
+from Sender import MAX_MESSAGE_LENGTH, RoomSender  # noqa: E402
+from Tagging import TagManager  # noqa: E402
+
+
+class FakeRooms:
+    """In-memory chat rooms, recording every posted line and its latency"""
+
+    def __init__(self, room_ids):
+        self.room_ids = list(room_ids)
+        # (room_id, line)
+        self.posts = []
+        self.latencies = []
+        # received times of the lines queued per room, in order
+        self._received = {room_id: deque() for room_id in self.room_ids}
+        self._lock = Lock()
+
+    def queued(self, room_id, text, received):
+        if len(text) <= MAX_MESSAGE_LENGTH:
+            self._received[room_id].append(received)
+
+    def post(self, room, text):
+        """Record a post; the post function of a RoomSender"""
+        now = time.monotonic()
+        with self._lock:
+            for line in text.split("\n"):
+                received = self._received[room.id].popleft()
+                self.posts.append((room.id, line))
+                self.latencies.append(now - received)
+
+
+class _Room:
+    """Stands in for a RoomSender, noting when each message was queued"""
+
+    def __init__(self, room_id, rooms, sender=None):
+        self.id = room_id
+        self._rooms = rooms
+        self._sender = sender
+
+    def send_message(self, text, length_check=True, received=None):
+        received = time.monotonic() if received is None else received
+        self._rooms.queued(self.id, text, received)
+        if self._sender is not None:
+            self._sender.send_message(text, length_check, received)
+        elif not length_check or len(text) <= MAX_MESSAGE_LENGTH:
+            self._rooms.post(self, text)
+
+
+def _stores(directory, tags=None, notifications=None, room_ids=()):
+    """Load copies of the tags and notifications, so replays don't change them"""
+    stores = []
+    for filename, name in ((tags, "tags.json"), (notifications, "notifications.json")):
+        copy = os.path.join(directory, name)
+        if filename is not None:
+            shutil.copy(filename, copy)
+            # with the notification changes not compacted into the file yet
+            if os.path.exists(filename + ".journal"):
+                shutil.copy(filename + ".journal", copy + ".journal")
+        stores.append(copy)
+    return TagManager(stores[0]), Notifications(list(room_ids), stores[1])
+
+
+def replay(capture, speed=0.0, rooms=(1,), tags=None, notifications=None,
+           sender=False, coalesce=True):
+    """Replay a capture, return the FakeRooms and the seconds it took
+
+    speed is the factor to speed up the recorded pace by, 0 for as fast
+    as possible. With sender, the rooms are fed through RoomSenders.
+
+    """
+    fake_rooms = FakeRooms(rooms)
+    senders = []
+    if sender:
+        senders = [
+            RoomSender(
+                SimpleNamespace(id=room_id), fake_rooms.post, maxsize=10 ** 9,
+                coalesce=coalesce, interval=0, min_interval=0)
+            for room_id in rooms
+        ]
+    room_list = [
+        _Room(room_id, fake_rooms, senders[n] if senders else None)
+        for n, room_id in enumerate(rooms)
+    ]
+    with tempfile.TemporaryDirectory() as directory:
+        tag_store, notification_store = _stores(directory, tags, notifications, rooms)
+        dispatcher = FeedDispatcher(
+            room_list[0], room_list, notification_store, tag_store)
+        feeds = {}
+        for each in senders:
+            each.start()
+        start = time.monotonic()
+        first = None
+        for timestamp, name, message in read_capture(capture):
+            feed = feeds.get(name)
+            if feed is None:
+                feed = feeds[name] = FEEDS[name]()
+                dispatcher.add(feed)
+            if speed:
+                if first is None:
+                    first = timestamp
+                delay = start + (timestamp - first) / speed - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            dispatcher.on_message_handler(feed, None, message)
+        for each in senders:
+            each.stop()
+        elapsed = time.monotonic() - start
+    return fake_rooms, elapsed
+
+
+def _milliseconds(seconds):
+    return round(seconds * 1000, 3)
+
+
+def _by_room(posts):
+    """The posts as lines, room by room; the order across rooms may vary"""
+    return [
+        f"{room}\t{line}" for room, line in sorted(posts, key=lambda post: str(post[0]))
+    ]
+
+
+def report(fake_rooms, elapsed, frames, expected=None, context=10):
+    """The statistics of a replay, with a diff against the expected posts"""
+    latencies = fake_rooms.latencies
+    result = {
+        "frames": frames,
+        "posts": len(fake_rooms.posts),
+        "seconds": round(elapsed, 3),
+        "frames_per_sec": round(frames / elapsed, 1) if elapsed else None,
+    }
+    if len(latencies) >= 2:
+        result["latency_ms"] = {
+            "p50": _milliseconds(percentile(latencies, 50)),
+            "p90": _milliseconds(percentile(latencies, 90)),
+            "p99": _milliseconds(percentile(latencies, 99)),
+            "max": _milliseconds(max(latencies)),
+        }
+    if expected is not None:
+        actual, expected = _by_room(fake_rooms.posts), _by_room(expected)
+        diff = list(difflib.unified_diff(
+            expected, actual, "expected", "replayed", n=0, lineterm=""))
+        changes = [line for line in diff if line[:1] in "+-" and line[:3] not in ("+++", "---")]
+        result["diff"] = {
+            "added": sum(1 for line in changes if line.startswith("+")),
+            "removed": sum(1 for line in changes if line.startswith("-")),
+            "sample": diff[:context * 2],
+        }
+    return result
+
+
+def _read_posts(filename):
+    with open(filename, encoding="utf8") as posts:
+        return [tuple(json.loads(line)) for line in posts]
+
+
+def _write_posts(filename, posts):
+    with open(filename, "w", encoding="utf8") as output:
+        for post in posts:
+            output.write(json.dumps(post, ensure_ascii=False) + "\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("capture", help="capture file recorded with PulseCapture")
+    parser.add_argument("--speed", type=float, default=0.0,
+                        help="1 for the recorded pace, N for N times as fast, "
+                        "0 (default) for as fast as possible")
+    parser.add_argument("--rooms", type=int, nargs="+", default=[1], help="room IDs")
+    parser.add_argument("--tags", help="tags.json to match with")
+    parser.add_argument("--notifications", help="notifications.json to match with")
+    parser.add_argument("--sender", action="store_true",
+                        help="post through RoomSenders rather than directly")
+    parser.add_argument("--no-coalesce", action="store_true",
+                        help="with --sender, post each line on its own")
+    parser.add_argument("--save-posts", help="write the posts to this file")
+    parser.add_argument("--diff", help="compare the posts to those saved earlier")
+    parser.add_argument("--output", "-o", help="write the JSON report to this file")
+    args = parser.parse_args(argv)
+
+    frames = sum(1 for _ in read_capture(args.capture))
+    fake_rooms, elapsed = replay(
+        args.capture, args.speed, args.rooms, args.tags, args.notifications,
+        args.sender, not args.no_coalesce)
+    if args.save_posts:
+        _write_posts(args.save_posts, fake_rooms.posts)
+    expected = _read_posts(args.diff) if args.diff else None
+
+    output = json.dumps(report(fake_rooms, elapsed, frames, expected), indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf8") as report_file:
+            report_file.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
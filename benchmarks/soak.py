@@ -0,0 +1,194 @@
+"""Soak test of the feed to chat pipeline over the network
+
+Runs the pipeline Pulse sets up, except for logging in to chat: a
+FeedDispatcher listening to a local FakeFeed over a real websocket,
+matching against tags and notifications kept with Persistence, and
+posting through RoomSenders to a local FakeChat that throttles like chat.
+Every few seconds it samples the memory use, the number of threads and
+the feed to chat latency; the report shows how they drift over the run.
+
+    python benchmarks/soak.py --hours 4 --rate 5 --burst-every 60 \\
+        --burst-size 100 --output soak.json
+
+Stop it early with Ctrl-C; the report covers the samples taken so far.
+
+"""
+import argparse
+import json
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+_source = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Source")
+if _source not in sys.path:
+    sys.path.insert(0, _source)
+
+from fake_chat import FakeChat  # noqa: E402
+from fake_feed import FakeFeed, sent_at  # noqa: E402
+from Feeds import FeedDispatcher, HalflifeFeed  # noqa: E402
+from Lifecycle import Lifecycle  # noqa: E402
+from Notifications import Notifications  # noqa: E402
+from percentiles import percentile  # noqa: E402
+from Persistence import Persistence  # noqa: E402
+from Sender import RoomSender  # noqa: E402
+from Tagging import Tag, TagManager  # noqa: E402
+
+
+def rss_kb():
+    """The resident memory of this process in kB, or its peak without /proc"""
+    try:
+        with open("/proc/self/status", encoding="ascii") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _milliseconds(seconds):
+    return round(seconds * 1000, 1)
+
+
+def _latencies(messages):
+    return [
+        received - sent
+        for _, text, received in messages
+        for sent in map(sent_at, text.split("\n"))
+        if sent is not None
+    ]
+
+
+def _sample(start, chat, feed, senders, lines_so_far):
+    latencies = _latencies(chat.take())
+    sample = {
+        "seconds": round(time.monotonic() - start, 1),
+        "rss_kb": rss_kb(),
+        "threads": threading.active_count(),
+        "sent": feed.sent,
+        "posted": lines_so_far + len(latencies),
+        "queued": sum(len(sender) for sender in senders),
+    }
+    if len(latencies) >= 2:
+        sample["latency_ms"] = {
+            "p50": _milliseconds(percentile(latencies, 50)),
+            "p99": _milliseconds(percentile(latencies, 99)),
+        }
+    return sample
+
+
+def _drift(samples, warmup):
+    """How the samples after warmup seconds changed from first to last"""
+    settled = [sample for sample in samples if sample["seconds"] >= warmup] or samples
+    first, last = settled[0], settled[-1]
+    drift = {
+        "rss_kb": last["rss_kb"] - first["rss_kb"],
+        "threads": last["threads"] - first["threads"],
+    }
+    with_latency = [sample for sample in settled if "latency_ms" in sample]
+    if with_latency:
+        drift["latency_p99_ms"] = round(
+            with_latency[-1]["latency_ms"]["p99"] - with_latency[0]["latency_ms"]["p99"], 1)
+    return drift
+
+
+def soak(seconds=60.0, rate=5.0, burst_every=None, burst_size=0, rooms=2,
+         sample_every=10.0, chat_interval=0.2, chat_burst=3, warmup=None,
+         lifecycle=None):
+    """Run the pipeline for seconds, return the report"""
+    lifecycle = Lifecycle() if lifecycle is None else lifecycle
+    samples = []
+    with tempfile.TemporaryDirectory() as directory:
+        persistence = Persistence(5)
+        persistence.start()
+        lifecycle.on_shutdown(persistence.stop)
+        tags = TagManager(os.path.join(directory, "tags.json"), persistence)
+        tags.add(Tag("threshold", r"[23]/3", 13, "Graham Chapman"))
+        room_ids = list(range(1, rooms + 1))
+        notifications = Notifications(
+            room_ids, os.path.join(directory, "notifications.json"),
+            persistence=persistence)
+        notifications.add(room_ids[0], r"score 3/3", 13, "Graham Chapman")
+
+        chat = FakeChat(interval=chat_interval, burst=chat_burst)
+        chat.start()
+        lifecycle.on_shutdown(chat.stop)
+        feed = FakeFeed(rate, burst_every, burst_size)
+        feed.start()
+        lifecycle.on_shutdown(feed.stop)
+        senders = [
+            RoomSender(
+                chat.room(room_id), maxsize=1000,
+                interval=chat_interval, min_interval=chat_interval)
+            for room_id in room_ids
+        ]
+        for sender in senders:
+            sender.start()
+            lifecycle.on_shutdown(sender.stop, timeout=10)
+        dispatcher = FeedDispatcher(senders[0], senders, notifications, tags)
+        dispatcher.add(HalflifeFeed(feed.url))
+        dispatcher.start()
+        lifecycle.on_shutdown(dispatcher.stop)
+
+        start = time.monotonic()
+        posted = 0
+        try:
+            while True:
+                stopped = lifecycle.wait(
+                    max(0, min(sample_every, start + seconds - time.monotonic())))
+                samples.append(_sample(start, chat, feed, senders, posted))
+                posted = samples[-1]["posted"]
+                if stopped or time.monotonic() - start >= seconds:
+                    break
+        finally:
+            lifecycle.shutdown()
+
+    warmup = min(60.0, seconds / 4) if warmup is None else warmup
+    return {
+        "rate": rate,
+        "burst_every": burst_every,
+        "burst_size": burst_size,
+        "rooms": rooms,
+        "chat_interval": chat_interval,
+        "reconnects": sum(listener.reconnects for listener in dispatcher.listeners),
+        "throttled": chat.throttled,
+        "drift": _drift(samples, warmup),
+        "samples": samples,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--hours", type=float, default=None)
+    parser.add_argument("--seconds", type=float, default=60.0)
+    parser.add_argument("--rate", type=float, default=5.0, help="feed messages per second")
+    parser.add_argument("--burst-every", type=float, default=None,
+                        help="seconds between bursts of feed messages")
+    parser.add_argument("--burst-size", type=int, default=0, help="messages per burst")
+    parser.add_argument("--rooms", type=int, default=2)
+    parser.add_argument("--sample-every", type=float, default=10.0, help="seconds")
+    parser.add_argument("--chat-interval", type=float, default=0.2,
+                        help="seconds between posts the fake chat allows")
+    parser.add_argument("--output", "-o", help="write the JSON report to this file")
+    args = parser.parse_args(argv)
+
+    lifecycle = Lifecycle()
+    lifecycle.handle_signals()
+    seconds = args.hours * 3600 if args.hours is not None else args.seconds
+    result = soak(
+        seconds, args.rate, args.burst_every, args.burst_size, args.rooms,
+        args.sample_every, args.chat_interval, lifecycle=lifecycle)
+    output = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf8") as report_file:
+            report_file.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+import json
+import os
+import sys
+
+import pytest
+
+# the benchmarks import each other as scripts do, from their own directory
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+
+def test_report(tmp_path):
+    from bench_matching import compare, quick, run
+
+    report = run(quick(), seed=1)
+    path = tmp_path / "report.json"
+    path.write_text(json.dumps(report))
+    report = json.loads(path.read_text())
+
+    operations = {key.split("/", 1)[1] for key in report["results"]}
+    assert operations == {
+        "notifications.filter_post",
+        "notifications.filter_post_many",
+        "notifications.list_room",
+        "notifications.list_user",
+        "notifications.add",
+        "notifications.remove_matching",
+        "tags.filter_post",
+    }
+    for stats in report["results"].values():
+        assert 0 < stats["p50_us"] <= stats["p99_us"]
+    assert compare(report, report).count("1.00x") == len(report["results"])
+
+
+def test_percentile():
+    from percentiles import percentile
+
+    assert percentile([3, 1, 2], 50) == 2
+    assert percentile([1, 2, 3, 4], 50) == 2.5
+    assert percentile(range(101), 99) == 99
+    assert percentile([5], 99) == 5
+
+
+def test_burst():
+    from bench_sender import run
+
+    report = run(lines=20, rooms=2, chat_interval=0.02)
+    single, coalesced = report["results"]["single"], report["results"]["coalesced"]
+    assert single["delivered"] == coalesced["delivered"] == 40
+    assert coalesced["posts"] < single["posts"]
+
+
+def test_fake_chat_throttles():
+    from fake_chat import FakeChat
+    from Sender import Throttled, post_message
+
+    chat = FakeChat(interval=2, burst=1)
+    chat.start()
+    try:
+        post_message(chat.room(7), "first")
+        # refused like chat does, and turned into Throttled by the sender
+        with pytest.raises(Throttled) as raised:
+            post_message(chat.room(7), "second")
+    finally:
+        chat.stop()
+    assert raised.value.wait == 2
+    assert [text for _, text, _ in chat.messages] == ["first"]
+    assert chat.throttled == 1
+
+
+def test_replay(tmp_path):
+    from Capture import CaptureWriter
+    from Tagging import Tag, TagManager
+    from replay import _read_posts, _write_posts, replay, report
+
+    tags = TagManager(str(tmp_path / "tags.json"))
+    tags.add(Tag("threshold", r"[23]/3", 13, "Graham Chapman"))
+    capture = CaptureWriter(str(tmp_path / "capture.gz"), clock=iter(range(100)).__next__)
+    for n in range(50):
+        capture.record("halflife", f"post {n} {n % 4}/3")
+    # repeated after a reconnect
+    capture.record("halflife", "post 0 0/3")
+    capture.close()
+
+    before, _ = replay(capture.filename, rooms=[1, 2], tags=tags.filename)
+    assert len(before.posts) == 100
+    assert ("1", "[tag:threshold]post 2 2/3") in [(str(r), p) for r, p in before.posts]
+    _write_posts(tmp_path / "posts.jsonl", before.posts)
+
+    tags.remove("threshold")
+    after, elapsed = replay(capture.filename, rooms=[1, 2], tags=tags.filename, sender=True)
+    result = report(after, elapsed, 51, _read_posts(tmp_path / "posts.jsonl"))
+    assert result["posts"] == 100
+    assert set(result["latency_ms"]) == {"p50", "p90", "p99", "max"}
+    # the 24 posts matching [23]/3 lost their tag in both rooms
+    assert result["diff"]["added"] == result["diff"]["removed"] == 48
+
+    # at the recorded pace of a message per second, sped up 1000 times
+    _, elapsed = replay(capture.filename, speed=1000)
+    assert 0.05 <= elapsed < 5
+
+
+def test_soak():
+    from soak import soak
+
+    result = soak(
+        seconds=2, rate=50, burst_every=1, burst_size=20, sample_every=0.5,
+        chat_interval=0.05, warmup=0)
+    samples = result["samples"]
+    assert len(samples) >= 4
+    assert samples[-1]["sent"] >= 100
+    # what was sent was matched and posted to both rooms, or is still queued
+    assert samples[-1]["posted"] + samples[-1]["queued"] >= 2 * samples[-1]["sent"] - 10
+    assert result["reconnects"] == 0
+    # threads other tests left behind may finish meanwhile, but none leak
+    assert result["drift"]["threads"] <= 0
+    assert "latency_p99_ms" in result["drift"]
@@ -0,0 +1,60 @@
+import gzip
+from types import SimpleNamespace
+
+
+class TestCapture:
+    def test_record(self, tmp_path):
+        from Capture import CaptureWriter, read_capture
+
+        filename = tmp_path / "capture.gz"
+        capture = CaptureWriter(filename, clock=lambda: 1700000000.12345)
+        capture.record("halflife", "post")
+        capture.record("deepsmoke", b'{"score": 1}')
+        capture.close()
+        # appends to an existing capture
+        capture = CaptureWriter(filename, clock=lambda: 1700000001.0)
+        capture.record("halflife", "café")
+        capture.close()
+        capture.record("halflife", "after closing")
+
+        assert list(read_capture(filename)) == [
+            (1700000000.123, "halflife", "post"),
+            (1700000000.123, "deepsmoke", '{"score": 1}'),
+            (1700000001.0, "halflife", "café"),
+        ]
+        assert capture.frames == 1
+
+    def test_truncated(self, tmp_path):
+        from Capture import CaptureWriter, read_capture
+
+        filename = tmp_path / "capture.gz"
+        capture = CaptureWriter(filename, clock=lambda: 0)
+        for n in range(100):
+            capture.record("halflife", f"post {n}")
+        capture.close()
+        data = filename.read_bytes()
+        filename.write_bytes(data[:len(data) - 20])
+
+        frames = list(read_capture(filename))
+        assert frames == [(0, "halflife", f"post {n}") for n in range(len(frames))]
+
+    def test_dispatcher(self, tmp_path):
+        from Capture import CaptureWriter, read_capture
+        from Feeds import FeedDispatcher, HalflifeFeed
+
+        sent = []
+        room = SimpleNamespace(
+            id=17, send_message=lambda message, received=None: sent.append(message))
+        capture = CaptureWriter(tmp_path / "capture.gz", clock=lambda: 0)
+        dispatcher = FeedDispatcher(room, [room], capture=capture)
+        feed = HalflifeFeed()
+        dispatcher.add(feed)
+        for message in ("post", "post"):
+            dispatcher.on_message_handler(feed, None, message)
+        capture.close()
+
+        # the duplicate is recorded, though not posted
+        assert sent == ["post"]
+        assert [message for _, _, message in read_capture(capture.filename)] == [
+            "post", "post"]
+        assert gzip.open(capture.filename, "rt").read() == '[0, "halflife", "post"]\n' * 2
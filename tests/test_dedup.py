@@ -0,0 +1,59 @@
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestDedupCache:
+    def test_seen(self):
+        from Dedup import DedupCache
+
+        dedup = DedupCache(name="test")
+        assert not dedup.seen("report")
+        assert dedup.seen("report")
+        assert not dedup.seen("other report")
+        assert dedup.hits == 1
+        assert len(dedup) == 2
+
+    def test_ttl(self):
+        from Dedup import DedupCache
+
+        clock = _Clock()
+        dedup = DedupCache(ttl=10, name="test", clock=clock)
+        dedup.seen("first")
+        clock.now = 5
+        dedup.seen("second")
+        clock.now = 10
+        # expired, so no longer a duplicate
+        assert not dedup.seen("first")
+        assert dedup.seen("second")
+        assert dedup.expired == 1
+        clock.now = 100
+        dedup.seen("third")
+        assert len(dedup) == 1
+        assert dedup.expired == 3
+
+    def test_maxsize(self):
+        from Dedup import DedupCache
+        from Metrics import DEDUP_EVICTIONS
+
+        evictions = DEDUP_EVICTIONS.labels("maxsize", "full")
+        before = evictions.value
+        dedup = DedupCache(maxsize=3, name="maxsize")
+        for n in range(5):
+            dedup.seen(f"report {n}")
+
+        assert len(dedup) == 3
+        assert dedup.evicted == 2
+        assert evictions.value == before + 2
+        assert not dedup.seen("report 0")
+        assert dedup.seen("report 4")
+
+    def test_fingerprint(self):
+        from Dedup import fingerprint
+
+        assert fingerprint("report") == fingerprint(b"report")
+        assert fingerprint("report") != fingerprint("report ")
+        assert len(fingerprint("x" * 10000)) == 16
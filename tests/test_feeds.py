@@ -0,0 +1,125 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+
+def _room(room_id, sent):
+    return SimpleNamespace(
+        id=room_id,
+        send_message=lambda message, received=None: sent.append((room_id, message)))
+
+
+def _deepsmoke(ds=True, score=0.95, site="stackoverflow.com"):
+    return json.dumps({
+        "deepsmoke": [ds, {"score": score}],
+        "site": site,
+        "question_id": 1,
+        "title": "Buy now",
+    })
+
+
+class TestFeedDispatcher:
+    @pytest.fixture(autouse=True)
+    def setup_stores(self, tmp_path):
+        from Feeds import FeedDispatcher
+        from Notifications import Notifications
+        from Tagging import Tag, TagManager
+
+        self.notifications = Notifications([17, 42], tmp_path / "notifications.json")
+        self.tags = TagManager(str(tmp_path / "tags.json"))
+        self.tags.add(Tag("threshold", r"[23]/3", 13, "Graham Chapman"))
+        self.notifications.add(17, r"2/3|Buy", 13, "Graham Chapman")
+        self.sent = []
+        self.errors = []
+        self.dispatcher = FeedDispatcher(
+            _room(17, self.errors), [_room(17, self.sent), _room(42, self.sent)],
+            self.notifications, self.tags)
+
+    def test_halflife(self):
+        from Feeds import HalflifeFeed
+
+        feed = HalflifeFeed()
+        self.dispatcher.add(feed)
+        self.dispatcher.on_message_handler(feed, None, "2/3")
+        assert self.sent == [
+            (17, "[tag:threshold]2/3 @GrahamChapman"),
+            (42, "[tag:threshold]2/3"),
+        ]
+
+        # a repeated report is neither matched nor posted again
+        self.dispatcher.on_message_handler(feed, None, "2/3")
+        assert len(self.sent) == 2
+        assert self.dispatcher.dedup(feed).hits == 1
+
+    def test_deepsmoke(self):
+        from Feeds import DeepSmokeFeed
+
+        feed = DeepSmokeFeed()
+        self.dispatcher.add(feed)
+        assert self.dispatcher.dedup(feed) is None
+        self.dispatcher.on_message_handler(feed, None, _deepsmoke())
+        report = (
+            "[ [DeepSmoke](https://git.io/vdlxx) | [PM](https://git.io/vdlx5) ] "
+            "Potential spam because of deepsmoke analysis: "
+            "[Buy now](https://stackoverflow.com/q/1) on `stackoverflow.com` with score `0.95`")
+        assert self.sent == [(17, report + " @GrahamChapman"), (42, report)]
+
+        self.sent.clear()
+        for message in (
+                _deepsmoke(site="ru.stackoverflow.com"), _deepsmoke(ds=False),
+                _deepsmoke(score=0.8)):
+            self.dispatcher.on_message_handler(feed, None, message)
+        self.dispatcher.on_message_handler(feed, None, _deepsmoke(score=0.5))
+        assert self.sent == []
+        assert len(self.errors) == 3
+
+    def test_deepsmoke_config(self):
+        from Feeds import DeepSmokeFeed
+
+        feed = DeepSmokeFeed(
+            "ws://localhost/", excluded_sites=(), report_score=0.5, error_score=0.1)
+        assert feed.url == "ws://localhost/"
+        assert not feed.parse(_deepsmoke(score=0.6, site="ru.stackoverflow.com")).error
+        assert feed.parse(_deepsmoke(score=0.2)).error
+        assert feed.parse(_deepsmoke(score=0.05)) is None
+
+    def test_shared_engine(self):
+        from Feeds import DeepSmokeFeed, HalflifeFeed
+
+        for feed in (HalflifeFeed(), DeepSmokeFeed()):
+            self.dispatcher.add(feed)
+        assert [listener.websocket_link for listener in self.dispatcher.listeners] == [
+            HalflifeFeed.url, DeepSmokeFeed.url]
+        self.dispatcher.on_message_handler(self.dispatcher.feeds[1], None, _deepsmoke())
+        self.dispatcher.on_message_handler(self.dispatcher.feeds[0], None, "2/3")
+        assert len(self.sent) == 4
+
+
+def test_registry():
+    from Feeds import FEEDS, DeepSmokeFeed, Feed, HalflifeFeed, register
+
+    assert FEEDS["halflife"] is HalflifeFeed
+    assert FEEDS["deepsmoke"] is DeepSmokeFeed
+
+    @register
+    class TestFeed(Feed):
+        name = "test"
+        url = "ws://localhost/"
+
+    try:
+        assert FEEDS["test"] is TestFeed
+        assert TestFeed().parse("post").text == "post"
+    finally:
+        del FEEDS["test"]
+
+
+def test_configure():
+    from Feeds import DeepSmokeFeed, HalflifeFeed, configure
+
+    halflife, deepsmoke = configure("halflife=ws://localhost:8888/, deepsmoke")
+    assert isinstance(halflife, HalflifeFeed)
+    assert halflife.url == "ws://localhost:8888/"
+    assert deepsmoke.url == DeepSmokeFeed.url
+    with pytest.raises(ValueError):
+        configure("halflife,smokey")
@@ -0,0 +1,140 @@
+import sys
+import time
+from unittest import mock
+
+import pytest
+
+
+@pytest.mark.parametrize(
+    "pattern, risky",
+    [
+        (r"[23]/3", False),
+        (r"(9|10)/10", False),
+        (r"foo .* bar", False),
+        (r"(a|b)+", False),
+        (r"(?:ab|cd){2}", True),
+        (r"(?:ab){2}c?", False),
+        (r"(pat incomplete", False),
+        (r"(a+)+$", True),
+        (r"(a*)*", True),
+        (r"(a|aa)*b", True),
+        (r"(?:ab|cd)+", True),
+        (r"(?=(\w+\s?)*$)", True),
+        (r"(x)?(?(1)(a+)+|b)", True),
+        (r"(x)?(?(1)a)", False),
+        (r"(x)\1", True),
+        (r".*a.*b.*c", True),
+        (r"(.*a){12}x", True),
+        (r"(\w+\s?){1,40}$", True),
+        (r"(a?)", False),
+        # adjacent repeats that can trade characters, bounded or not
+        (r"a*a*b", True),
+        (r"(a*)(a*)b", True),
+        (r"a{0,1000}a{0,1000}b", True),
+        (r"\d{1,999}\d{1,999}\d{1,999}x", True),
+        (r"[\s\S]{1,500}[\s\S]{1,500}[\s\S]{1,500}!", True),
+        (r".*x.*y", False),
+        (r"\bfoo\s+bar\b", False),
+        # atomic groups and possessive repeats
+        *[
+            pytest.param(pattern, True, marks=pytest.mark.skipif(
+                sys.version_info < (3, 11), reason="new in Python 3.11"))
+            for pattern in [r"(?>(a+)+$)", r"(?:(a+)+$)*+", r"(?:x|(a+)+$)++"]
+        ],
+    ],
+)
+def test_is_risky(pattern, risky):
+    from Guard import is_risky
+
+    assert is_risky(pattern) == risky
+
+
+class TestRegexGuard:
+    @pytest.fixture(autouse=True)
+    def setup_guard(self):
+        from Guard import RegexGuard
+
+        self.guard = RegexGuard(budget=0.2)
+        self.quarantined = []
+        self.guard.subscribe(lambda *args: self.quarantined.append(args))
+        yield
+        self.guard.close()
+
+    def test_in_process(self):
+        search = self.guard.compile(r"[23]/3")
+        assert search("score 2/3")
+        assert not search("score 1/3")
+        assert self.quarantined == []
+
+    def test_in_process_overrun(self):
+        search = self.guard.compile(r"[23]/3")
+        with mock.patch("Guard.perf_counter", side_effect=[0.0, 0.5]), \
+                mock.patch.object(self.guard._sandbox, "search", return_value=None):
+            assert search("score 2/3")
+        assert self.quarantined == [
+            ("[23]/3", "it ran for over 500 ms, the limit is 200 ms")
+        ]
+        # quarantined patterns no longer run
+        assert not search("score 2/3")
+
+    def test_in_process_single_overrun(self, caplog):
+        search = self.guard.compile(r"[23]/3")
+        # a pause, rather than a slow pattern: it is fast when checked again
+        with mock.patch("Guard.perf_counter", side_effect=[0.0, 0.5]):
+            assert search("score 2/3")
+        assert self.quarantined == []
+        assert "not when checked again" in caplog.text
+        assert search("score 2/3")
+
+    def test_sandboxed(self):
+        search = self.guard.compile(r"(a|b)\1")
+        assert search("xaay")
+        assert not search("xaby")
+        assert self.quarantined == []
+
+    def test_sandbox_overrun(self):
+        search = self.guard.compile(r"(a+)+$")
+        start = time.monotonic()
+        assert not search("a" * 64 + "!")
+        assert time.monotonic() - start < 5
+        assert self.quarantined == [
+            ("(a+)+$", "it ran for over 200 ms, the limit is 200 ms")
+        ]
+
+        # the sandbox is restarted for the next pattern
+        assert self.guard.compile(r"(\w+\s?)*$")("foo bar")
+        # and the quarantined pattern no longer runs
+        assert not search("aaa")
+
+    def test_sandbox_single_overrun(self):
+        search = self.guard.compile(r"(a|b)\1")
+        answers = iter([None, True])
+        with mock.patch.object(
+                self.guard._sandbox, "search", side_effect=lambda *args: next(answers)):
+            # answered by the second run
+            assert search("xaay")
+        assert self.quarantined == []
+        assert search("xaay")
+
+    def test_invalid(self):
+        import re
+
+        with pytest.raises(re.error):
+            self.guard.compile(r"(pat incomplete")
+
+    def test_failing_callback(self, caplog):
+        self.guard.subscribe(mock.Mock(side_effect=ValueError("mocked")))
+        self.guard.quarantine("foo", 1)
+        self.guard.quarantine("foo", 1)
+        assert len(self.quarantined) == 1
+        assert caplog.records[-1].msg.startswith("Quarantine callback")
+
+
+def test_serve():
+    from io import BytesIO
+    from Guard import _serve
+
+    requests = BytesIO(b'["(a|b)\\\\1", "xaay"]\n["(a|b)\\\\1", "xaby"]\n["c", "c"]\n')
+    responses = BytesIO()
+    _serve(requests, responses, cache_size=1)
+    assert responses.getvalue() == b"ready\n1\n0\n1\n"
@@ -0,0 +1,110 @@
+import os
+import signal
+import sys
+import threading
+from types import SimpleNamespace
+from unittest import mock
+
+import pytest
+
+
+@pytest.fixture
+def restore_signals():
+    handlers = {signum: signal.getsignal(signum) for signum in (signal.SIGTERM, signal.SIGINT)}
+    yield
+    for signum, handler in handlers.items():
+        signal.signal(signum, handler)
+
+
+class TestLifecycle:
+    def test_shutdown_order(self):
+        from Lifecycle import Lifecycle
+
+        stopped = []
+        lifecycle = Lifecycle()
+        lifecycle.on_shutdown(stopped.append, "persistence")
+        lifecycle.on_shutdown(stopped.append, "sender")
+        lifecycle.on_shutdown(stopped.append, "listener")
+        lifecycle.request_stop()
+        lifecycle.run()
+
+        assert stopped == ["listener", "sender", "persistence"]
+        assert not lifecycle.reboot
+
+    def test_failing_step(self, caplog):
+        from Lifecycle import Lifecycle
+
+        stopped = []
+        lifecycle = Lifecycle()
+        lifecycle.on_shutdown(stopped.append, "persistence")
+        lifecycle.on_shutdown(mock.Mock(side_effect=RuntimeError("mocked")))
+        lifecycle.shutdown()
+
+        # the remaining steps still run
+        assert stopped == ["persistence"]
+        assert "mocked" in caplog.text
+
+    def test_wait(self):
+        from Lifecycle import Lifecycle
+
+        lifecycle = Lifecycle()
+        assert not lifecycle.wait(0.01)
+        threading.Timer(0.05, lifecycle.request_stop).start()
+        assert lifecycle.wait(5)
+        assert lifecycle.stopping
+
+    @pytest.mark.parametrize("signum", [signal.SIGTERM, signal.SIGINT])
+    def test_signal(self, signum, restore_signals):
+        from Lifecycle import Lifecycle
+
+        lifecycle = Lifecycle()
+        lifecycle.handle_signals()
+        threading.Timer(0.05, os.kill, (os.getpid(), signum)).start()
+        assert lifecycle.wait(5)
+        assert not lifecycle.reboot
+
+    def test_attach(self):
+        from Lifecycle import Lifecycle
+
+        stop = mock.Mock()
+        bot = SimpleNamespace(stop=stop, reboot=mock.Mock())
+        lifecycle = Lifecycle()
+        lifecycle.attach(bot)
+
+        # called by BotpySE from its stop reason check thread
+        bot.stop()
+        assert lifecycle.stopping
+        stop.assert_not_called()
+        lifecycle.shutdown()
+        stop.assert_called_once_with()
+
+    def test_reboot(self):
+        from Lifecycle import Lifecycle
+
+        stopped = []
+        bot = SimpleNamespace(stop=lambda: stopped.append("bot"), reboot=None)
+        lifecycle = Lifecycle()
+        lifecycle.on_shutdown(stopped.append, "persistence")
+        lifecycle.attach(bot)
+        bot.reboot()
+
+        with mock.patch("os.execl") as execl:
+            lifecycle.run()
+        assert stopped == ["bot", "persistence"]
+        execl.assert_called_once_with(sys.executable, sys.executable, *sys.argv)
+
+
+def test_startup_timer():
+    from Lifecycle import StartupTimer
+
+    now = iter([10.0, 10.5, 12.0, 12.25])
+    timer = StartupTimer(clock=lambda: next(now))
+    timer.mark("imports")
+    timer.mark("login")
+    timer.add("load state", 1.0)
+    timer.mark("feeds")
+
+    assert timer.phases == [("imports", 0.5), ("login", 1.5), ("feeds", 0.25)]
+    assert timer.report() == (
+        "Started in 2.25s: imports 0.50s, login 1.50s, feeds 0.25s; "
+        "in the background: load state 1.00s")
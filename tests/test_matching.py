@@ -0,0 +1,82 @@
+import pytest
+
+
+class TestMatchEngine:
+    @pytest.fixture(autouse=True)
+    def setup_stores(self, tmp_path):
+        from Notifications import Notifications
+        from Tagging import TagManager
+
+        self.notifications = Notifications([17, 42], tmp_path / "notifications.json")
+        self.tags = TagManager(str(tmp_path / "tags.json"))
+
+    def add_tag(self, name, regex):
+        from Tagging import Tag
+
+        self.tags.add(Tag(name, regex, 13, "Graham Chapman"))
+
+    def test_match(self):
+        from Matching import MatchEngine
+
+        self.add_tag("threshold", r"[23]/3")
+        self.notifications.add(17, r"2/3", 13, "Graham Chapman")
+        self.notifications.add(42, r"spam", 23, "Michael Palin")
+        self.notifications.add(42, r"2/3", 23, "Michael Palin")
+
+        result = MatchEngine(self.tags, self.notifications).match("2/3 post", [17, 42])
+        assert result.message == "[tag:threshold]2/3 post"
+        assert result.tags == ["[tag:threshold]"]
+        assert result.users == {"17": {"13"}, "42": {"23"}}
+        assert result.message_for(17) == "[tag:threshold]2/3 post @GrahamChapman"
+        assert result.message_for("42") == "[tag:threshold]2/3 post @MichaelPalin"
+        assert result.message_for(99) == "[tag:threshold]2/3 post"
+
+    def test_notifications_see_tags(self):
+        from Matching import MatchEngine
+
+        self.add_tag("threshold", r"[23]/3")
+        self.notifications.add(17, r"tag:threshold", 13, "Graham Chapman")
+
+        engine = MatchEngine(self.tags, self.notifications)
+        assert engine.match("3/3", [17]).users == {"17": {"13"}}
+        assert engine.match("1/3", [17]).users == {}
+
+    def test_rooms(self):
+        from Matching import MatchEngine
+
+        self.notifications.add(17, r"foo", 13, "Graham Chapman")
+        self.notifications.add(42, r"foo", 23, "Michael Palin")
+
+        engine = MatchEngine(notifications=self.notifications)
+        assert engine.match("foo", [42]).users == {"42": {"23"}}
+        assert engine.match("foo").users == {}
+
+    def test_store_changes(self):
+        from Matching import MatchEngine
+
+        engine = MatchEngine(self.tags, self.notifications)
+        assert engine.match("foo bar", [17]).message_for(17) == "foo bar"
+
+        self.add_tag("foo", "foo")
+        self.notifications.add(17, r"bar", 13, "Graham Chapman")
+        assert engine.match("foo bar", [17]).message_for(17) == (
+            "[tag:foo]foo bar @GrahamChapman")
+
+        self.tags.remove("foo")
+        self.notifications.remove_matching(17, "bar", 13)
+        assert engine.match("foo bar", [17]).message_for(17) == "foo bar"
+
+    def test_no_tags(self):
+        from Matching import MatchEngine
+
+        self.add_tag("threshold", r"[23]/3")
+        self.notifications.add(17, r"2/3", 13, "Graham Chapman")
+        result = MatchEngine(self.tags, self.notifications).match("2/3", [17], tag=False)
+        assert (result.message, result.tags) == ("2/3", [])
+        assert result.message_for(17) == "2/3 @GrahamChapman"
+
+    def test_no_stores(self):
+        from Matching import MatchEngine
+
+        result = MatchEngine().match("post", [17])
+        assert (result.message, result.tags, result.users) == ("post", [], {})
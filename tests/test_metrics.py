@@ -0,0 +1,139 @@
+import urllib.error
+import urllib.request
+from types import SimpleNamespace
+
+import pytest
+
+
+@pytest.fixture
+def registry():
+    from Metrics import Registry
+
+    return Registry()
+
+
+class TestMetrics:
+    def test_counter(self, registry):
+        from Metrics import Counter
+
+        messages = Counter("messages_total", "Messages", ["feed"], registry=registry)
+        messages.labels("halflife").inc()
+        messages.labels("halflife").inc(2)
+        messages.labels('say "hi"\n').inc()
+        errors = Counter("errors_total", "Errors", registry=registry)
+
+        assert registry.render() == (
+            "# HELP messages_total Messages\n"
+            "# TYPE messages_total counter\n"
+            'messages_total{feed="halflife"} 3.0\n'
+            'messages_total{feed="say \\"hi\\"\\n"} 1.0\n'
+            "# HELP errors_total Errors\n"
+            "# TYPE errors_total counter\n"
+        )
+        errors.inc()
+        assert registry.render().endswith("errors_total 1.0\n")
+
+    def test_gauge(self, registry):
+        from Metrics import Gauge
+
+        length = Gauge("queue_length", "Queue length", ["room"], registry=registry)
+        length.labels(17).set(4)
+        length.labels(17).dec()
+        assert 'queue_length{room="17"} 3.0' in registry.render()
+
+    def test_function(self, registry):
+        from Metrics import Counter, Gauge
+
+        lookups = Counter("lookups_total", "Lookups", ["result"], registry=registry)
+        size = Gauge("size", "Size", registry=registry)
+        stats = {"hit": 1, "size": 2}
+        lookups.set_function(lambda: stats["hit"], "hit")
+        size.set_function(lambda: stats["size"])
+        assert 'lookups_total{result="hit"} 1.0' in registry.render()
+
+        # read again on every render
+        stats.update(hit=5, size=3)
+        rendered = registry.render()
+        assert 'lookups_total{result="hit"} 5.0' in rendered
+        assert "size 3.0" in rendered
+        with pytest.raises(ValueError):
+            lookups.set_function(lambda: 0)
+
+    def test_histogram(self, registry):
+        from Metrics import Histogram
+
+        seconds = Histogram("seconds", "Seconds", buckets=(0.1, 1), registry=registry)
+        for value in (0.05, 0.1, 0.5, 2):
+            seconds.observe(value)
+
+        assert registry.render().splitlines()[2:] == [
+            'seconds_bucket{le="0.1"} 2',
+            'seconds_bucket{le="1.0"} 3',
+            'seconds_bucket{le="+Inf"} 4',
+            "seconds_sum 2.65",
+            "seconds_count 4",
+        ]
+
+    def test_histogram_time(self, registry):
+        from Metrics import Histogram
+
+        seconds = Histogram("seconds", "Seconds", ["stage"], registry=registry)
+        with seconds.labels("tag").time():
+            pass
+        child = seconds.labels("tag")
+        assert child.count == 1
+        assert 0 <= child.sum < 1
+
+    def test_labels(self, registry):
+        from Metrics import Counter
+
+        messages = Counter("messages_total", "Messages", ["feed"], registry=registry)
+        assert messages.labels("halflife") is messages.labels("halflife")
+        with pytest.raises(ValueError):
+            messages.labels()
+        with pytest.raises(ValueError):
+            Counter("messages_total", "Messages", registry=registry)
+
+    def test_server(self, registry):
+        from Metrics import Counter, MetricsServer
+
+        Counter("messages_total", "Messages", registry=registry).inc()
+        server = MetricsServer(registry=registry)
+        server.start()
+        try:
+            with urllib.request.urlopen(server.url, timeout=5) as response:
+                assert response.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+                assert response.read().decode() == registry.render()
+            with pytest.raises(urllib.error.HTTPError) as error:
+                urllib.request.urlopen(server.url.replace("/metrics", "/other"), timeout=5)
+            assert error.value.code == 404
+        finally:
+            server.stop()
+
+
+def test_pipeline_metrics():
+    from Matching import MatchResult
+    from Metrics import CHAT_POSTS, FEED_TO_CHAT_SECONDS, PINGS, SEND_QUEUE_LENGTH, STAGE_SECONDS
+    from Sender import RoomSender, send_result
+
+    posted = []
+    sender = RoomSender(
+        SimpleNamespace(id=1701), lambda room, text: posted.append(text),
+        interval=0, min_interval=0)
+    latency = FEED_TO_CHAT_SECONDS.labels(1701)
+    enqueue = STAGE_SECONDS.labels("enqueue")
+    before = (latency.count, enqueue.count, CHAT_POSTS.labels(1701).value)
+
+    result = MatchResult("post", [], {"1701": {13}}, {13: "@GrahamChapman"})
+    send_result(result, [sender], received=0.0)
+    assert SEND_QUEUE_LENGTH.labels(1701).value == 1
+    assert PINGS.labels(1701).value >= 1
+    sender.start()
+    sender.stop()
+
+    assert posted == ["post @GrahamChapman"]
+    assert SEND_QUEUE_LENGTH.labels(1701).value == 0
+    assert (latency.count, enqueue.count, CHAT_POSTS.labels(1701).value) == (
+        before[0] + 1, before[1] + 1, before[2] + 1)
+    # measured from when the feed message was received
+    assert latency.sum >= 1
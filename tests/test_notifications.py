@@ -36,6 +36,8 @@ class _NotificationsTestsBase:
 
     @property
     def saved_notifications(self):
+        # fold any journalled changes into the notifications file first
+        self.notifications.compact()
         try:
             return json.loads(self.filepath.read_text())[0]
         except FileNotFoundError:
@@ -43,11 +45,19 @@ class _NotificationsTestsBase:
 
     @property
     def saved_users(self):
+        self.notifications.compact()
         try:
             return json.loads(self.filepath.read_text())[1]
         except FileNotFoundError:
             return None
 
+    @property
+    def journal(self):
+        journal_path = self.filepath.with_name(self.filepath.name + ".journal")
+        entries = [json.loads(line) for line in journal_path.read_text().splitlines()]
+        # leave out the document header
+        return [entry for entry in entries if entry[0] != "document"]
+
 
 class TestNotifications(_NotificationsTestsBase):
     def test_list_empty(self):
@@ -96,6 +106,30 @@ class TestNotifications(_NotificationsTestsBase):
         assert list(notifications.list(user=9999)) == []
         assert list(notifications.list(room=42, user=9999)) == []
 
+    def test_list_is_snapshot(self):
+        notifications = self.notifications
+        notifications.add(17, r"foo .* bar", 13, "Graham Chapman")
+        notifications.add(17, r"spam", 13, "Graham Chapman")
+
+        entries = notifications.list(room=17)
+        assert next(entries) == ("17", "foo .* bar", "13", "Graham Chapman")
+        # changes made while iterating are not visible to the iterator
+        notifications.remove_matching(17, r"spam", 13)
+        notifications.add(17, r"eggs", 23, "Terry Gilliam")
+        assert list(entries) == [("17", "spam", "13", "Graham Chapman")]
+
+    def test_version(self):
+        notifications = self.notifications
+        version = notifications.version
+        notifications.add(17, r"foo .* bar", 13, "Graham Chapman")
+        assert notifications.version == version + 1
+        # no change, no new version
+        notifications.add(17, r"foo .* bar", 13, "Graham Chapman")
+        notifications.remove_matching(17, r"spam", 13)
+        assert notifications.version == version + 1
+        notifications.remove_matching(17, r"foo", 13)
+        assert notifications.version == version + 2
+
     def test_add(self):
         notifications = self.notifications
         notifications.add(17, r"foo .* bar", 13, "Graham Chapman")
@@ -217,6 +251,167 @@ class TestNotifications(_NotificationsTestsBase):
 
         assert self.saved_notifications == {"17": {"pattern": ["23"]}, "42": {}}
 
+    def test_journal(self):
+        notifications = self.notifications
+        notifications.add(17, r"foo .* bar", 13, "Graham Chapman")
+        notifications.add(42, r"spam", 23, "Terry Gilliam")
+        notifications.remove_matching(17, r"foo", 13)
+
+        # changes are appended to the journal, the document isn't rewritten
+        assert not self.filepath.exists()
+        assert self.journal == [
+            ["add", "17", "foo .* bar", "13", "Graham Chapman"],
+            ["add", "42", "spam", "23", "Terry Gilliam"],
+            ["remove", "17", "foo .* bar", "13"],
+        ]
+
+        # a restart replays the journal and compacts
+        self.create_notifications()
+        assert list(self.notifications.list()) == [
+            ("42", "spam", "23", "Terry Gilliam")
+        ]
+        assert self.journal == []
+        # still the [notifications, users] document older versions load
+        notifications, users = json.loads(self.filepath.read_text())
+        assert notifications == {"17": {}, "42": {"spam": ["23"]}}
+        assert users == {"13": "Graham Chapman", "23": "Terry Gilliam"}
+
+    def test_journal_compact_every(self):
+        from Notifications import Notifications
+
+        notifications = Notifications([17], self.filepath, compact_every=3)
+        notifications.add(17, r"foo", 13, "Graham Chapman")
+        notifications.add(17, r"bar", 13, "Graham Chapman")
+        assert len(self.journal) == 2
+        assert not self.filepath.exists()
+
+        notifications.add(17, r"baz", 13, "Graham Chapman")
+        assert self.journal == []
+        assert json.loads(self.filepath.read_text())[0] == {
+            "17": {"foo": ["13"], "bar": ["13"], "baz": ["13"]}
+        }
+
+    def test_journal_replay_after_compaction(self):
+        # a crash after writing the document but before removing the journal
+        # entries that were set aside for compaction
+        notifications = self.notifications
+        notifications.add(17, r"foo", 13, "Graham Chapman")
+        notifications.add(17, r"bar", 13, "Graham Chapman")
+        notifications.remove_matching(17, r"foo", 13)
+        journal = self.journal
+        notifications.compact()
+        self.filepath.with_name(self.filepath.name + ".journal.compacting").write_text(
+            "".join(json.dumps(entry) + "\n" for entry in journal)
+        )
+        notifications.add(42, r"spam", 23, "Terry Gilliam")
+
+        self.create_notifications()
+        assert not self.filepath.with_name(
+            self.filepath.name + ".journal.compacting"
+        ).exists()
+        assert self.saved_notifications == {
+            "17": {"bar": ["13"]},
+            "42": {"spam": ["23"]},
+        }
+
+    def test_journal_failed_compaction(self):
+        notifications = self.notifications
+        notifications.add(17, r"foo", 13, "Graham Chapman")
+        with mock.patch("Notifications.atomic_write", side_effect=OSError("disk full")):
+            with pytest.raises(OSError):
+                notifications.compact()
+        assert self.journal == []
+
+        # the next compaction keeps the entries that were set aside
+        notifications.add(17, r"bar", 13, "Graham Chapman")
+        with mock.patch("Notifications.atomic_write", side_effect=OSError("disk full")):
+            with pytest.raises(OSError):
+                notifications.compact()
+        compacting = self.filepath.with_name(self.filepath.name + ".journal.compacting")
+        assert [json.loads(line)[0] for line in compacting.read_text().splitlines()] == [
+            "document", "add", "document", "add"
+        ]
+        # written against a document that never made it to disk
+        notifications.add(17, r"baz", 13, "Graham Chapman")
+
+        self.create_notifications()
+        assert self.saved_notifications == {
+            "17": {"foo": ["13"], "bar": ["13"], "baz": ["13"]},
+            "42": {},
+        }
+
+    def test_journal_background_compaction(self):
+        from Notifications import Notifications
+
+        persistence = mock.Mock()
+        notifications = Notifications(
+            [17], self.filepath, compact_every=2, persistence=persistence
+        )
+        notifications.add(17, r"foo", 13, "Graham Chapman")
+        persistence.schedule.assert_not_called()
+        notifications.add(17, r"bar", 13, "Graham Chapman")
+        persistence.schedule.assert_called_once_with(
+            self.filepath, notifications.compact
+        )
+        # compaction is left to the persistence service
+        assert len(self.journal) == 2
+        assert not self.filepath.exists()
+
+    def test_journal_stale(self):
+        import hashlib
+
+        journal_path = self.filepath.with_name(self.filepath.name + ".journal")
+        notifications = self.notifications
+        notifications.add(17, r"foo", 13, "Graham Chapman")
+        old_journal = journal_path.read_text()
+        notifications.compact()
+        notifications.remove_matching(17, r"foo", 13)
+        notifications.compact()
+        # the journal header identifies the document it applies to
+        document = hashlib.sha256(self.filepath.read_bytes()).hexdigest()
+        assert journal_path.read_text() == json.dumps(["document", document]) + "\n"
+
+        # a standby with a newer document, but a journal from before that
+        journal_path.write_text(old_journal)
+        self.create_notifications()
+        assert list(self.notifications.list()) == []
+        assert self.logs.records[-1].msg == (
+            f"Ignoring 1 entries in {journal_path} from before the last compaction"
+        )
+
+    def test_journal_legacy(self):
+        # a journal from before the document header was introduced
+        self.filepath.write_text(json.dumps([{"17": {"foo": ["13"]}}, {"13": "Graham Chapman"}]))
+        self.filepath.with_name(self.filepath.name + ".journal").write_text(
+            '["add", "17", "bar", "13", "Graham Chapman"]\n'
+        )
+        self.create_notifications()
+        assert self.saved_notifications == {"17": {"foo": ["13"], "bar": ["13"]}, "42": {}}
+
+    def test_journal_corrupt_entries(self):
+        journal_path = self.filepath.with_name(self.filepath.name + ".journal")
+        journal_path.write_text(
+            '["add", "17", "foo", "13", "Graham Chapman"]\n'
+            '["frobnicate", "17"]\n'
+            '["remove", "42", "missing", "13"]\n'
+            '["add", "42", "ba'
+        )
+        self.create_notifications()
+
+        assert self.saved_notifications == {"17": {"foo": ["13"]}, "42": {}}
+        assert self.logs.record_tuples == [
+            (
+                "Notifications",
+                logging.WARNING,
+                "Ignoring unknown journal operation 'frobnicate'",
+            ),
+            (
+                "Notifications",
+                logging.WARNING,
+                f"Ignoring corrupt journal entry {journal_path}:4",
+            ),
+        ]
+
     def test_filter_empty(self):
         notifications = self.notifications
 
@@ -241,6 +436,114 @@ class TestNotifications(_NotificationsTestsBase):
         assert msg.startswith(post)
         assert sorted(msg[len(post) :].split()) == ["@EricIdle", "@MichaelPalin"]
 
+    def test_filter_post_many(self):
+        notifications = self.notifications
+        notifications.add(17, r"[Ll]\w+ ipsum", 13, "Graham Chapman")
+        notifications.add(17, r".*", 83, "Terry Gilliam")
+        notifications.add(42, r".*", 31, "Eric Idle")
+        notifications.add(42, r"[Ll]\w+ ipsum", 13, "Graham Chapman")
+        notifications.add(42, r"Knights of .*", 97, "John Cleese")
+
+        post = "Lorum ipsum dolor"
+        msg17, msg42, msg999 = notifications.filter_post_many([17, 42, 999], post)
+        assert msg17.startswith(post)
+        assert sorted(msg17[len(post) :].split()) == ["@GrahamChapman", "@TerryGilliam"]
+        assert msg42.startswith(post)
+        assert sorted(msg42[len(post) :].split()) == ["@EricIdle", "@GrahamChapman"]
+        assert msg999 == post
+
+        notifications.remove_matching(17, r".*", 83)
+        notifications.remove_matching(42, r".*", 31)
+        assert notifications.filter_post_many([17, 42], "Knights of Ni") == [
+            "Knights of Ni",
+            "Knights of Ni @JohnCleese",
+        ]
+        assert notifications.filter_post_many([17, 42], "Spam") == ["Spam", "Spam"]
+
+    def test_filter_post_many_shared_patterns(self):
+        notifications = self.notifications
+        notifications.add(17, r"spam", 13, "Graham Chapman")
+        notifications.add(42, r"spam", 23, "Terry Gilliam")
+
+        search = mock.Mock(return_value=True)
+        with mock.patch("Notifications._compile_search", return_value=search):
+            from Notifications import Notifications
+
+            notifications = Notifications([17, 42], self.filepath)
+
+        assert notifications.filter_post_many([17, 42], "spam") == [
+            "spam @GrahamChapman",
+            "spam @TerryGilliam",
+        ]
+        # the shared pattern is compiled and evaluated only once
+        search.assert_called_once_with("spam")
+        assert notifications.filter_post_many([42], "spam") == ["spam @TerryGilliam"]
+
+    def test_filter_post_invalid_stored_pattern(self):
+        # a broken pattern in the saved file must not break the room
+        with self.filepath.open("w", encoding="utf8") as f:
+            json.dump(
+                [
+                    {"17": {"(broken": ["13"], "ipsum": ["23"]}},
+                    {"13": "Graham Chapman", "23": "Terry Gilliam"},
+                ],
+                f,
+            )
+        self.create_notifications()
+
+        post = "Lorum ipsum dolor"
+        assert self.notifications.filter_post(17, post) == f"{post} @TerryGilliam"
+        assert self.logs.record_tuples == [
+            (
+                "Notifications",
+                logging.WARNING,
+                "Ignoring invalid notification pattern '(broken': "
+                "missing ), unterminated subpattern at position 0",
+            )
+        ]
+
+    def test_quarantine(self):
+        notifications = self.notifications
+        notifications.add(17, r"foo .* bar", 13, "Graham Chapman")
+        notifications.add(17, r"foo .* bar", 23, "Terry Gilliam")
+        notifications.add(17, r"spam", 23, "Terry Gilliam")
+        notifications.add(42, r"foo .* bar", 97, "John Cleese")
+
+        assert notifications.quarantine(r"foo .* bar", "it was too slow") == [
+            (
+                "17",
+                "@GrahamChapman @TerryGilliam your notification pattern "
+                "`foo .* bar` has been disabled: it was too slow",
+            ),
+            (
+                "42",
+                "@JohnCleese your notification pattern "
+                "`foo .* bar` has been disabled: it was too slow",
+            ),
+        ]
+        assert notifications.quarantine(r"eggs", "it was too slow") == []
+        assert self.saved_notifications == {"17": {"spam": ["23"]}, "42": {}}
+        assert notifications.filter_post(17, "foo and bar") == "foo and bar"
+
+    def test_filter_post_guarded(self):
+        from Guard import RegexGuard
+        from Notifications import Notifications
+
+        guard = RegexGuard(budget=0.2)
+        quarantined = []
+        guard.subscribe(lambda pattern, reason: quarantined.append(pattern))
+        try:
+            notifications = Notifications([17], self.filepath, guard=guard)
+            notifications.add(17, r"(\w+\s?)*!$", 13, "Graham Chapman")
+            notifications.add(17, r"Lorum", 23, "Terry Gilliam")
+
+            # the "!" gets the slow pattern past the literal prefilter
+            post = "Lorum! ipsum dolor sit amet consectetur adipiscing elit sed"
+            assert notifications.filter_post(17, post) == f"{post} @TerryGilliam"
+            assert quarantined == [r"(\w+\s?)*!$"]
+        finally:
+            guard.close()
+
 
 # extract just the word groups at the start
 _clean_usage = re.compile(r'^(?:\w+[ ])*\w+').search
@@ -300,6 +603,52 @@ class TestCommands(_CommandsTestsBase):
 
         assert self.dispatch("all notifications").post == output.post
 
+    def test_notifications_search(self):
+        notifications = self.notifications
+        notifications.add(17, r"foo .* bar", 13, "Graham Chapman")
+        notifications.add(17, r"Monty Python", 23, "Terry Gilliam")
+        notifications.add(17, r"foo", 23, "Terry Gilliam")
+
+        def listed(command):
+            return [line.split("|")[2].strip()
+                    for line in self.dispatch(command).post[0].splitlines()[2:]]
+
+        assert listed("notifications by terry") == ["Monty Python", "foo"]
+        assert listed("notifications foo") == ["foo .* bar", "foo"]
+        assert listed("all notifications by terry FOO") == ["foo"]
+        assert listed("notifications by eric") == []
+
+    def test_notifications_pages(self):
+        for n in range(50):
+            self.notifications.add(17, f"pattern {n}", 13, "Graham Chapman")
+
+        first = self.dispatch("notifications").post[0]
+        pages = int(first.splitlines()[-1].rpartition(" ")[2])
+        assert pages > 1
+        assert len(first) <= 500
+        assert self.dispatch("notifications page 1").post == [first]
+
+        last = self.dispatch(f"notifications page {pages}").post[0]
+        assert last.splitlines()[-2].split("|")[2].strip() == "pattern 49"
+        assert self.dispatch(f"notifications page {pages + 1}").post == [
+            f"There are only {pages} pages"
+        ]
+        assert self.dispatch("notifications page 0").reply == [
+            "'0' is not a page number"
+        ]
+
+    def test_notifications_cached(self):
+        self.notifications.add(17, r"foo", 13, "Graham Chapman")
+        output = self.dispatch("notifications")
+        with mock.patch("tabulate.tabulate") as tabulate:
+            assert self.dispatch("notifications").post == output.post
+        tabulate.assert_not_called()
+
+        # changes are listed right away
+        self.notifications.add(17, r"bar", 13, "Graham Chapman")
+        last = self.dispatch("notifications").post[0].splitlines()[-1]
+        assert last.split("|")[2].strip() == "bar"
+
     def test_my_notifications_empty(self):
         response = (
             "    | Graham Chapman   |\n"
@@ -336,6 +685,15 @@ class TestCommands(_CommandsTestsBase):
             "missing ), unterminated subpattern at position 0"
         ]
 
+    def test_notify_quarantined(self):
+        self.notifications.guard = mock.Mock(quarantined={"(a+)+$"})
+        output = self.dispatch("notify (a+)+$")
+        assert output.reply == [
+            "Could not add notification `(a+)+$`: "
+            "the pattern is quarantined for running too slowly"
+        ]
+        assert list(self.notifications.list()) == []
+
     def test_notify_existing(self):
         pat = ".*"
         self.notifications.add(17, pat, 13, "Graham Chapman")
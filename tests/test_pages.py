@@ -0,0 +1,136 @@
+import pytest
+
+
+def _cells(page, column):
+    """The cells of a column on a page, continuation lines included"""
+    return [line.split("|")[column].strip() for line in page.splitlines()[2:]
+            if line.strip().startswith("|")]
+
+
+class TestPaginate:
+    def test_single_page(self):
+        from Pages import paginate
+
+        assert paginate([["Graham Chapman", "foo"]], ["User", "Regex"]) == [
+            "    | User           | Regex   |\n"
+            "    |----------------+---------|\n"
+            "    | Graham Chapman | foo     |"
+        ]
+
+    def test_empty(self):
+        from Pages import paginate
+
+        assert paginate([], ["User", "Regex"]) == [
+            "    | User   | Regex   |\n    |--------+---------|"
+        ]
+
+    def test_numbers(self):
+        from Pages import paginate
+
+        # patterns that look like numbers are listed as they are
+        [page] = paginate([["Graham Chapman", "1.50"]], ["User", "Regex"])
+        assert _cells(page, 2) == ["1.50"]
+
+    def test_pages(self):
+        from Pages import paginate
+
+        rows = [["Graham Chapman", f"pattern {n}"] for n in range(100)]
+        pages = paginate(rows, ["User", "Regex"], limit=500)
+
+        assert len(pages) > 1
+        seen = []
+        for number, page in enumerate(pages, 1):
+            assert len(page) <= 500
+            lines = page.splitlines()
+            # every page repeats the header
+            assert lines[0].split() == ["|", "User", "|", "Regex", "|"]
+            assert lines[-1] == f"    page {number} of {len(pages)}"
+            seen += _cells(page, 2)
+        assert seen == [regex for _, regex in rows]
+
+    def test_long_rows(self):
+        from Pages import paginate
+
+        long_regex = "".join(f"(?:word{n} other{n})? " for n in range(15))
+        rows = [["Graham Chapman", long_regex], ["Terry Gilliam", "y"]]
+        pages = paginate(rows, ["User", "Regex"], limit=500)
+
+        assert all(len(page) <= 500 for page in pages)
+        # wrapped onto continuation lines, nothing is lost
+        cells = [cell for page in pages for cell in _cells(page, 2)]
+        assert "".join(cells[:-1]) == long_regex.strip()
+        assert cells[-1] == "y"
+        users = [cell for page in pages for cell in _cells(page, 1)]
+        assert users[0] == "Graham Chapman" and set(users[1:-1]) == {""}
+
+    def test_row_longer_than_a_page(self):
+        from Pages import paginate
+
+        rows = [["Graham Chapman", "x" * 2000]]
+        pages = paginate(rows, ["User", "Regex"], limit=500)
+
+        assert len(pages) > 1
+        assert all(len(page) <= 500 for page in pages)
+        assert "".join(cell for page in pages for cell in _cells(page, 2)) == "x" * 2000
+
+
+class TestPageCache:
+    def test_cached_per_version(self):
+        from Pages import PageCache
+
+        rendered = []
+
+        def render(pages):
+            return lambda: rendered.append(pages) or pages
+
+        cache = PageCache()
+        assert cache.get(1, "room", render(["a"])) == ["a"]
+        assert cache.get(1, "room", render(["b"])) == ["a"]
+        assert cache.get(1, "other", render(["c"])) == ["c"]
+        # a new version drops everything rendered before
+        assert cache.get(2, "room", render(["d"])) == ["d"]
+        assert cache.get(2, "other", render(["e"])) == ["e"]
+
+        assert rendered == [["a"], ["c"], ["d"], ["e"]]
+        assert (cache.hits, cache.misses) == (1, 4)
+
+    def test_maxsize(self):
+        from Pages import PageCache
+
+        cache = PageCache(maxsize=2)
+        for key in "abc":
+            cache.get(1, key, lambda: [key])
+        assert cache.get(1, "a", lambda: ["new"]) == ["new"]
+        assert cache.get(1, "c", lambda: ["new"]) == ["c"]
+
+
+@pytest.mark.parametrize(
+    "arguments, users, expected",
+    [
+        ([], True, (None, None, 1)),
+        (["page", "3"], True, (None, None, 3)),
+        (["By", "Graham", "Foo", "bar", "page", "2"], True, ("graham", "foo bar", 2)),
+        (["by", "graham"], False, (None, "by graham", 1)),
+        (["page"], True, (None, "page", 1)),
+    ],
+)
+def test_parse_listing_arguments(arguments, users, expected):
+    from Pages import parse_listing_arguments
+
+    assert parse_listing_arguments(arguments, users=users) == expected
+
+
+@pytest.mark.parametrize("number", ["0", "two"])
+def test_parse_invalid_page(number):
+    from Pages import parse_listing_arguments
+
+    with pytest.raises(ValueError):
+        parse_listing_arguments(["page", number])
+
+
+def test_select_page():
+    from Pages import select_page
+
+    assert select_page(["a", "b"], 2) == "b"
+    assert select_page(["a", "b"], 3) == "There are only 2 pages"
+    assert select_page(["a"], 2) == "There is only 1 page"
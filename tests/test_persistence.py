@@ -0,0 +1,79 @@
+import os
+import threading
+from unittest import mock
+
+import pytest
+
+
+class TestAtomicWrite:
+    def test_write(self, tmp_path):
+        from Persistence import atomic_write
+
+        path = tmp_path / "state.json"
+        atomic_write(path, "first")
+        atomic_write(path, "second")
+        assert path.read_text() == "second"
+        assert os.listdir(tmp_path) == ["state.json"]
+
+    def test_failed_write_keeps_original(self, tmp_path):
+        from Persistence import atomic_write
+
+        path = tmp_path / "state.json"
+        path.write_text("original")
+        with mock.patch("os.replace", side_effect=OSError("mocked")):
+            with pytest.raises(OSError):
+                atomic_write(path, "replacement")
+
+        assert path.read_text() == "original"
+        assert os.listdir(tmp_path) == ["state.json"]
+
+
+class TestPersistence:
+    def test_coalesced(self):
+        from Persistence import Persistence
+
+        persistence = Persistence()
+        first, second, other = mock.Mock(), mock.Mock(), mock.Mock()
+        persistence.schedule("state", first)
+        persistence.schedule("state", second)
+        persistence.schedule("other", other)
+        persistence.flush()
+        persistence.flush()
+
+        first.assert_not_called()
+        second.assert_called_once_with()
+        other.assert_called_once_with()
+
+    def test_failed_write_retried(self, caplog):
+        from Persistence import Persistence
+
+        persistence = Persistence()
+        write = mock.Mock(side_effect=[OSError("mocked"), None])
+        persistence.schedule("state", write)
+        persistence.flush()
+        assert caplog.records[0].msg == "Failed to write state, will retry"
+
+        persistence.flush()
+        assert write.call_count == 2
+
+    def test_background_flush(self):
+        from Persistence import Persistence
+
+        persistence = Persistence(interval=0.01)
+        written = threading.Event()
+        persistence.start()
+        try:
+            persistence.schedule("state", written.set)
+            assert written.wait(5)
+        finally:
+            persistence.stop()
+
+    def test_stop_flushes(self):
+        from Persistence import Persistence
+
+        persistence = Persistence(interval=3600)
+        persistence.start()
+        write = mock.Mock()
+        persistence.schedule("state", write)
+        persistence.stop()
+        write.assert_called_once_with()
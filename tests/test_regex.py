@@ -0,0 +1,92 @@
+import re
+
+import pytest
+
+
+@pytest.mark.parametrize(
+    "pattern, literal",
+    [
+        (r"foo", "foo"),
+        (r"Foo\d+bar baz", "bar baz"),
+        (r"[23]/3", "/3"),
+        (r"(?i)Spam\s+eggs", "pam"),
+        (r"(?i:a)bCD", "bcd"),
+        (r"(?:hello)+ x", "hello"),
+        (r"(?:hello)* world", " world"),
+        (r"foo|barbaz", ""),
+        (r"x?", ""),
+        (r".*", ""),
+        (r"(unclosed", ""),
+        ("a" * 40, "a" * 32),
+    ],
+)
+def test_required_literal(pattern, literal):
+    from regex import required_literal
+
+    assert required_literal(pattern) == literal
+
+
+def test_literal_scanner():
+    from regex import LiteralScanner
+
+    scanner = LiteralScanner(["ab", "abc", "bc", "xyz"])
+    assert scanner.scan("zabcd") == {"ab", "abc", "bc"}
+    assert scanner.scan("xyz") == {"xyz"}
+    assert scanner.scan("nothing") == set()
+    assert LiteralScanner([]).scan("anything") == set()
+
+
+class TestPrefilter:
+    def test_candidates(self):
+        from regex import Prefilter
+
+        prefilter = Prefilter([r"foo", r".*", r"bar\d", r"Foo", r"spam"])
+        assert prefilter.candidates("xx FOO bar1") == [0, 1, 2, 3]
+        assert prefilter.candidates("nothing") == [1]
+
+    @pytest.mark.parametrize(
+        "pattern",
+        [
+            r"(?i)kiss",
+            r"(?i)été",
+            r"Straße",
+            r"(?i)ab|cd",
+            r"(?-i:Ab)c",
+        ],
+    )
+    @pytest.mark.parametrize(
+        "text",
+        ["KISS", "kıſſ", "ÉTÉ", "STRASSE", "Straße", "CD", "Abc"],
+    )
+    def test_never_skips_a_match(self, pattern, text):
+        from regex import Prefilter
+
+        if re.search(pattern, text):
+            assert Prefilter([pattern]).candidates(text) == [0]
+
+
+def test_pattern_cache():
+    from regex import cache_info, compile, compile_normalized
+
+    before = cache_info()
+    pattern = compile("<code>cache &amp; test</code>")
+    assert pattern.pattern == "cache & test"
+    # the same normalized pattern, compiled once
+    assert compile("cache &amp; test") is pattern
+    assert compile_normalized("cache & test") is pattern
+    assert compile_normalized("cache & test", re.I) is not pattern
+
+    info = cache_info()
+    assert info.misses == before.misses + 2
+    assert info.hits == before.hits + 2
+
+    # and on the metrics endpoint
+    from Metrics import REGISTRY
+
+    rendered = REGISTRY.render()
+    assert f'pulse_pattern_cache_lookups_total{{result="hit"}} {info.hits}.0' in rendered
+    assert f'pulse_pattern_cache_lookups_total{{result="miss"}} {info.misses}.0' in rendered
+    assert f"pulse_pattern_cache_size {info.currsize}.0" in rendered
+
+    with pytest.raises(re.error):
+        compile_normalized("(cache test")
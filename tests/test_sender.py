@@ -0,0 +1,200 @@
+import threading
+from types import SimpleNamespace
+from unittest import mock
+
+import pytest
+
+
+def _room(room_id):
+    return SimpleNamespace(id=room_id)
+
+
+def _sender(room_id, post, **kwargs):
+    from Sender import RoomSender
+
+    kwargs = {"coalesce": False, "interval": 0, "min_interval": 0, **kwargs}
+    return RoomSender(_room(room_id), post, **kwargs)
+
+
+class TestRoomSender:
+    def test_send(self):
+        posted = []
+        sender = _sender(17, lambda room, text: posted.append((room.id, text)))
+        sender.start()
+        for n in range(5):
+            sender.send_message(f"message {n}")
+        sender.stop()
+
+        assert posted == [(17, f"message {n}") for n in range(5)]
+        assert len(sender) == 0
+
+    def test_bounded(self, caplog):
+        posted = []
+        sender = _sender(17, lambda room, text: posted.append(text), maxsize=3)
+        for n in range(5):
+            sender.send_message(f"message {n}")
+        assert len(sender) == 3
+        assert sender.dropped == 2
+        assert caplog.records[0].msg == "Send queue for room 17 is full, dropped a message"
+
+        sender.start()
+        sender.stop()
+        assert posted == ["message 2", "message 3", "message 4"]
+
+    def test_length_check(self):
+        from Sender import RoomSender
+
+        sender = RoomSender(_room(17), mock.Mock())
+        sender.send_message("x" * 501)
+        assert len(sender) == 0
+        sender.send_message("x" * 501, length_check=False)
+        assert len(sender) == 1
+
+    def test_slow_room(self):
+        blocked, posted = threading.Event(), threading.Event()
+
+        def slow_post(room, text):
+            assert blocked.wait(5)
+
+        slow = _sender(17, slow_post)
+        fast = _sender(42, lambda room, text: posted.set())
+        slow.start()
+        fast.start()
+        try:
+            slow.send_message("slow")
+            fast.send_message("fast")
+            # delivered while the other room's post is still in progress
+            assert posted.wait(5)
+        finally:
+            blocked.set()
+            slow.stop()
+            fast.stop()
+
+    def test_post_failure(self, caplog):
+        post = mock.Mock(side_effect=[RuntimeError("mocked"), None])
+        sender = _sender(17, post)
+        sender.start()
+        sender.send_message("first")
+        sender.send_message("second")
+        sender.stop()
+
+        assert post.call_count == 2
+        assert caplog.records[0].msg == "Failed to send message to room 17"
+        assert (sender.posts, sender.lines) == (1, 1)
+
+    def test_transient_failure(self):
+        from Sender import Transient
+
+        sleeps = []
+        post = mock.Mock(side_effect=[Transient("reset"), Transient("502"), None])
+        sender = _sender(17, post, retry_delay=0.5, sleep=sleeps.append)
+        sender.send_message("first")
+        sender.start()
+        sender.stop()
+
+        assert post.call_args_list == [mock.call(sender.room, "first")] * 3
+        # backing off between the attempts
+        assert sleeps == [0.5, 1.0]
+        assert (sender.posts, sender.lines) == (1, 1)
+
+    def test_transient_gives_up(self, caplog):
+        from Sender import Transient
+
+        post = mock.Mock(side_effect=[Transient("down")] * 3 + [None])
+        sender = _sender(17, post, retries=2, sleep=lambda delay: None)
+        sender.send_message("first")
+        sender.send_message("second")
+        sender.start()
+        sender.stop()
+
+        assert post.call_args_list == [
+            mock.call(sender.room, text) for text in ("first",) * 3 + ("second",)]
+        assert caplog.records[-1].msg == "Failed to send message to room 17"
+        assert (sender.posts, sender.lines) == (1, 1)
+
+    def test_coalesce(self):
+        posted = []
+        sender = _sender(17, lambda room, text: posted.append(text), coalesce=True)
+        lines = [f"{n:03d}" + "x" * 97 for n in range(12)]
+        for line in lines:
+            sender.send_message(line)
+        sender.start()
+        sender.stop()
+
+        # at most four 100 character lines fit in a message
+        assert posted == [
+            "\n".join(lines[:4]), "\n".join(lines[4:8]), "\n".join(lines[8:])]
+        assert (sender.posts, sender.lines) == (3, 12)
+
+    def test_throttled(self):
+        from Sender import Throttled
+
+        sleeps = []
+        post = mock.Mock(side_effect=[None, Throttled(3), Throttled(2), None])
+        sender = _sender(
+            17, post, interval=1.0, min_interval=0.5, max_interval=3.0,
+            sleep=sleeps.append)
+        sender.send_message("first")
+        sender.send_message("second")
+        sender.start()
+        sender.stop()
+
+        assert post.call_args_list == [
+            mock.call(sender.room, text) for text in ("first", "second", "second", "second")]
+        # paced after the first post, then waiting as told while backing off
+        assert sleeps[1:] == [3, 2]
+        assert 0.8 < sleeps[0] <= 0.9
+        assert sender.throttled == 2
+        assert sender.interval == 2.7
+
+
+class TestPostMessage:
+    def room(self, **kwargs):
+        room = SimpleNamespace(id=17, _client=mock.Mock())
+        room._client._br.send_message = mock.Mock(**kwargs)
+        return room
+
+    def test_post(self):
+        from Sender import post_message
+
+        room = self.room(return_value=mock.Mock(text='{"id": 1}'))
+        post_message(room, "text")
+        room._client._br.send_message.assert_called_once_with(17, "text")
+
+    def test_throttled(self):
+        import requests
+        from Sender import Throttled, post_message
+
+        response = mock.Mock(
+            status_code=409, text="You can perform this action again in 4 seconds.")
+        room = self.room(side_effect=requests.HTTPError(response=response))
+        with pytest.raises(Throttled) as throttled:
+            post_message(room, "text")
+        assert throttled.value.wait == 4
+
+    def test_error(self):
+        import requests
+        from Sender import post_message
+
+        response = mock.Mock(status_code=403, text="nope")
+        room = self.room(side_effect=requests.HTTPError(response=response))
+        with pytest.raises(requests.HTTPError):
+            post_message(room, "text")
+
+    @pytest.mark.parametrize("status", [500, 502, 503])
+    def test_server_error(self, status):
+        import requests
+        from Sender import Transient, post_message
+
+        response = mock.Mock(status_code=status, text="oops")
+        room = self.room(side_effect=requests.HTTPError(response=response))
+        with pytest.raises(Transient):
+            post_message(room, "text")
+
+    def test_network_error(self):
+        import requests
+        from Sender import Transient, post_message
+
+        room = self.room(side_effect=requests.ConnectionError("reset by peer"))
+        with pytest.raises(Transient):
+            post_message(room, "text")
@@ -0,0 +1,217 @@
+import json
+import threading
+
+import pytest
+
+
+class TestTagManager:
+    @pytest.fixture(autouse=True)
+    def setup_tags(self, tmp_path):
+        from Tagging import TagManager
+
+        self.filepath = tmp_path / "tags.json"
+        self.tags = TagManager(str(self.filepath))
+
+    def add(self, name, regex, user_id=13, user_name="Graham Chapman"):
+        from Tagging import Tag
+
+        return self.tags.add(Tag(name, regex, user_id, user_name))
+
+    def test_filter_post(self):
+        self.add("threshold", r"[23]/3")
+        self.add("spam", r"(?i)spam")
+        self.add("never", r"^$")
+
+        assert self.tags.filter_post("2/3 SPAM") == "[tag:threshold] [tag:spam]2/3 SPAM"
+        assert self.tags.filter_post("1/3") == "1/3"
+
+    def test_list_tags_command(self):
+        from unittest import mock
+
+        from Tagging import CommandListTags
+
+        self.add("threshold", r"[23]/3")
+        self.add("spam", r"(?i)spam", 23, "Terry Gilliam")
+        for n in range(30):
+            self.add(f"bulk{n}", f"bulk pattern {n}")
+
+        def listtags(*arguments):
+            posted = []
+            message = mock.Mock()
+            message.room.send_message.side_effect = lambda t, **k: posted.append(t)
+            command_manager = mock.Mock(tags=self.tags)
+            CommandListTags(command_manager, message, list(arguments)).run()
+            return posted[0]
+
+        first = listtags()
+        assert len(first) <= 500
+        assert first.splitlines()[-1].startswith("    page 1 of ")
+        assert listtags("by", "terry").splitlines()[2:] == [
+            "    | spam   | (?i)spam | Terry Gilliam |"
+        ]
+        assert [line.split("|")[1].strip()
+                for line in listtags("[23]").splitlines()[2:]] == ["threshold"]
+
+        # cached until the tags change
+        assert listtags() is first
+        self.tags.remove("threshold")
+        assert "threshold" not in listtags()
+
+    def test_tag(self):
+        tag = self.add("encoded", "<code>a&amp;b</code>")
+        assert tag.regex == "a&b"
+        assert tag.pattern.search("a&b")
+        assert tag.format == "[tag:encoded]"
+
+    def test_remove(self):
+        first = self.add("dupe", "foo")
+        second = self.add("dupe", "bar")
+
+        assert self.tags.remove("dupe")
+        assert self.tags.tags == (second,)
+        assert self.tags.remove("dupe")
+        assert not self.tags.remove("dupe")
+        assert first not in self.tags.tags
+
+    def test_remove_matching(self):
+        self.add("one", "foo")
+        keep = self.add("two", "bar")
+        self.add("three", "food")
+
+        removed = self.tags.remove_matching("^foo")
+        assert [tag.name for tag in removed] == ["one", "three"]
+        assert self.tags.tags == (keep,)
+        assert self.tags.remove_matching("nothing") == []
+
+    def test_snapshot(self):
+        self.add("one", "foo")
+        version, tags = self.tags.version, self.tags.tags
+
+        self.add("two", "bar")
+        assert tags == self.tags.tags[:1]
+        assert self.tags.version == version + 1
+        assert list(self.tags.list()) == list(self.tags.tags)
+
+    def test_saved(self):
+        from Tagging import TagManager
+
+        self.add("one", "foo", 23, "Michael Palin")
+        self.add("two", "bar")
+        self.tags.remove("two")
+
+        reloaded = TagManager(str(self.filepath))
+        [tag] = reloaded.tags
+        assert (tag.name, tag.regex, tag.user_id, tag.user_name) == (
+            "one", "foo", 23, "Michael Palin")
+        assert reloaded.filter_post("foo") == "[tag:one]foo"
+
+    def test_legacy_file(self):
+        from Tagging import TagManager
+
+        self.filepath.write_text(json.dumps([{
+            "py/object": "Tagging.Tag",
+            "name": "threshold",
+            "regex": "[23]/3",
+            "user_id": 13,
+            "user_name": "Graham Chapman",
+            "format": "[tag:threshold]",
+        }]))
+        tags = TagManager(str(self.filepath))
+        assert tags.filter_post("2/3") == "[tag:threshold]2/3"
+        # converted to the versioned format straight away
+        assert json.loads(self.filepath.read_text()) == {
+            "version": 1,
+            "tags": [["threshold", "[23]/3", 13, "Graham Chapman"]],
+        }
+
+    def test_saved_format(self):
+        self.add("encoded", "<code>a&amp;amp;b</code>", 23, "Michael Palin")
+        assert json.loads(self.filepath.read_text()) == {
+            "version": 1,
+            "tags": [["encoded", "a&amp;b", 23, "Michael Palin"]],
+        }
+
+    def test_unsupported_version(self):
+        from Tagging import TagManager
+
+        self.filepath.write_text(json.dumps({"version": 2, "tags": []}))
+        with pytest.raises(ValueError):
+            TagManager(str(self.filepath))
+
+    def test_lazy_compile(self):
+        from Tagging import TagManager
+
+        self.add("one", "foo")
+        self.add("two", "<code>bar&amp;amp;</code>")
+        tags = TagManager(str(self.filepath))
+        one, two = tags.tags
+        assert one._pattern is None and two._pattern is None
+
+        # saved patterns are already normalized, and stay as they are
+        assert tags.filter_post("food") == "[tag:one]food"
+        assert tags.filter_post("bar&amp;") == "[tag:two]bar&amp;"
+        assert two.pattern.pattern == "bar&amp;"
+
+    def test_quarantine(self):
+        self.add("slow", "foo", 13, "Graham Chapman")
+        keep = self.add("fast", "bar")
+
+        assert self.tags.quarantine("foo", "too slow") == [
+            "@GrahamChapman [tag:slow] for regex `foo` has been disabled: too slow"
+        ]
+        assert self.tags.tags == (keep,)
+        assert self.tags.quarantine("foo", "too slow") == []
+
+        # users are pinged the same way as for notifications
+        self.add("odd", "baz", 23, "Terry (TG) Gilliam")
+        assert self.tags.quarantine("baz", "too slow") == [
+            "@TerryTGGilliam [tag:odd] for regex `baz` has been disabled: too slow"
+        ]
+
+    def test_guarded(self):
+        from Guard import RegexGuard
+        from Tagging import Tag, TagManager
+
+        guard = RegexGuard()
+        try:
+            tags = TagManager(str(self.filepath), guard=guard)
+            tags.add(Tag("one", "foo", 13, "Graham Chapman"))
+            guard.quarantined.add("foo")
+            assert tags.filter_post("foo") == "foo"
+        finally:
+            guard.close()
+
+    def test_threading(self):
+        from Persistence import Persistence
+        from Tagging import TagManager
+
+        # only schedule the writes, this is about the in-memory state
+        self.tags = TagManager(str(self.filepath), Persistence(interval=3600))
+        stop = threading.Event()
+        errors = []
+
+        def reader():
+            while not stop.is_set():
+                try:
+                    self.tags.filter_post("foo bar baz")
+                except Exception as exc:  # pragma: no cover
+                    errors.append(exc)
+
+        def writer(n):
+            for i in range(50):
+                self.add(f"tag{n}", f"foo{i}|bar")
+                self.tags.remove(f"tag{n}")
+
+        readers = [threading.Thread(target=reader) for _ in range(2)]
+        writers = [threading.Thread(target=writer, args=(n,)) for n in range(4)]
+        for thread in readers + writers:
+            thread.start()
+        for thread in writers:
+            thread.join()
+        stop.set()
+        for thread in readers:
+            thread.join()
+
+        assert errors == []
+        assert self.tags.tags == ()
+        assert self.tags._by_name == {}
@@ -0,0 +1,63 @@
+import subprocess
+
+import pytest
+
+from Version import ROOT, _git_hash
+
+
+class TestVersion:
+    def test_version_file(self, tmp_path, monkeypatch):
+        from Version import current_hash
+
+        version_file = tmp_path / "version.txt"
+        version_file.write_text("0123456789abcdef\n")
+        # doesn't need git
+        monkeypatch.setattr(subprocess, "run", None)
+        assert current_hash(str(version_file)) == "012345"
+
+    def test_cached(self, tmp_path, monkeypatch):
+        from Version import current_hash, forget
+
+        version_file = tmp_path / "version.txt"
+        asked = []
+
+        def git_hash(root):
+            asked.append(root)
+            return f"{len(asked)}123456789abcdef"
+
+        monkeypatch.setattr("Version._git_hash", git_hash)
+        # git is asked once per process, or again after an update
+        assert current_hash(str(version_file), root="a") == "112345"
+        assert current_hash(str(version_file), root="a") == "112345"
+        assert current_hash(str(version_file), root="b") == "212345"
+        assert asked == ["a", "b"]
+        forget(str(version_file))
+        assert current_hash(str(version_file), root="a") == "312345"
+        forget(str(version_file))
+
+    @pytest.mark.skipif(_git_hash(ROOT) is None, reason="not a git checkout")
+    def test_git(self, tmp_path):
+        from Version import current_hash, forget
+
+        version_file = tmp_path / "version.txt"
+        forget(str(version_file))
+        assert current_hash(str(version_file)) == _git_hash(ROOT)[:6]
+        # nothing is written, the version file is for builds only
+        assert not version_file.exists()
+        forget(str(version_file))
+
+    def test_no_git(self, tmp_path, caplog):
+        from Version import current_hash, forget
+
+        version_file = tmp_path / "version.txt"
+        assert current_hash(str(version_file), root=str(tmp_path)) == ""
+        assert "Could not determine the version" in caplog.text
+        forget(str(version_file))
+
+    def test_forget(self, tmp_path):
+        from Version import forget
+
+        version_file = tmp_path / "version.txt"
+        version_file.write_text("0123456789abcdef\n")
+        forget(str(version_file))
+        assert not version_file.exists()
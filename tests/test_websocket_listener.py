@@ -0,0 +1,208 @@
+import asyncio
+import queue
+import threading
+import time
+
+import pytest
+
+
+class _FeedServer:
+    """Local websocket server sending each new connection some messages"""
+
+    def __init__(self, messages, close=False):
+        self.messages = messages
+        # drop the connection after sending the messages
+        self.close = close
+        self.connections = 0
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+
+    async def _handler(self, ws):
+        self.connections += 1
+        for message in self.messages:
+            await ws.send(message)
+        if self.close:
+            await ws.close()
+        await ws.wait_closed()
+
+    async def _serve(self):
+        import websockets
+
+        self._server = await websockets.serve(self._handler, "127.0.0.1", 0)
+        return self._server.sockets[0].getsockname()[1]
+
+    def start(self):
+        self._thread.start()
+        port = asyncio.run_coroutine_threadsafe(self._serve(), self._loop).result()
+        self.url = f"ws://127.0.0.1:{port}/"
+
+    def stop(self):
+        async def close():
+            self._server.close()
+            await self._server.wait_closed()
+
+        asyncio.run_coroutine_threadsafe(close(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+
+@pytest.fixture
+def feed_server():
+    server = _FeedServer(["first", "second"])
+    server.start()
+    yield server
+    server.stop()
+
+
+def test_listener(feed_server):
+    from WebsocketListener import WebsocketListener
+
+    received = queue.Queue()
+    listener = WebsocketListener(
+        feed_server.url, lambda ws, message: received.put(message))
+    listener.start()
+    try:
+        assert received.get(timeout=5) == "first"
+        assert received.get(timeout=5) == "second"
+        assert not listener.closed
+    finally:
+        listener.stop(timeout=5)
+    assert listener.closed
+
+
+def test_shared_loop(feed_server):
+    from WebsocketListener import WebsocketListener
+
+    received = queue.Queue()
+
+    async def on_message(ws, message):
+        await asyncio.sleep(0)
+        received.put((threading.current_thread().name, message))
+
+    listeners = [WebsocketListener(feed_server.url, on_message) for _ in range(3)]
+    for listener in listeners:
+        listener.start()
+    try:
+        messages = [received.get(timeout=5) for _ in range(6)]
+    finally:
+        for listener in listeners:
+            listener.stop(timeout=5)
+
+    assert {thread for thread, _ in messages} == {"websockets"}
+    assert sorted(message for _, message in messages) == ["first"] * 3 + ["second"] * 3
+
+
+def test_callback_error(feed_server, caplog):
+    from WebsocketListener import WebsocketListener
+
+    received = queue.Queue()
+
+    def on_message(ws, message):
+        if message == "first":
+            raise ValueError("mocked")
+        received.put(message)
+
+    listener = WebsocketListener(feed_server.url, on_message)
+    listener.start()
+    try:
+        # the feed carries on after a failing callback
+        assert received.get(timeout=5) == "second"
+    finally:
+        listener.stop(timeout=5)
+    assert "mocked" in caplog.text
+
+
+def test_connection_refused(caplog):
+    from WebsocketListener import WebsocketListener
+
+    listener = WebsocketListener("ws://127.0.0.1:9/", lambda ws, message: None)
+    listener.start()
+    for _ in range(500):
+        if listener.closed:
+            break
+        time.sleep(0.01)
+    listener.stop(timeout=5)
+    assert "A websocket error occurred on websocket 'ws://127.0.0.1:9/'" in caplog.text
+
+
+def test_reconnect():
+    from Metrics import FEED_DOWNTIME
+    from WebsocketListener import WebsocketListener
+
+    server = _FeedServer(["message"], close=True)
+    server.start()
+    received = queue.Queue()
+    listener = WebsocketListener(
+        server.url, lambda ws, message: received.put(message),
+        min_backoff=0.01, max_backoff=0.02)
+    listener.start()
+    try:
+        for _ in range(3):
+            assert received.get(timeout=5) == "message"
+    finally:
+        listener.stop(timeout=5)
+        server.stop()
+
+    assert server.connections >= 3
+    assert listener.reconnects >= 2
+    assert listener.downtime > 0
+    assert FEED_DOWNTIME.labels(server.url).value == pytest.approx(listener.downtime)
+
+
+@pytest.mark.parametrize("error", [asyncio.TimeoutError(), RuntimeError("mocked")])
+def test_connect_error(feed_server, error, caplog):
+    from unittest import mock
+
+    import websockets
+    from WebsocketListener import WebsocketListener
+
+    received = queue.Queue()
+    listener = WebsocketListener(
+        feed_server.url, lambda ws, message: received.put(message),
+        min_backoff=0.01, max_backoff=0.02)
+    connect, errors = websockets.connect, [error, error]
+
+    def failing_connect(*args, **kwargs):
+        if errors:
+            raise errors.pop()
+        return connect(*args, **kwargs)
+
+    with mock.patch("websockets.connect", side_effect=failing_connect) as patched:
+        listener.start()
+        try:
+            # the listener keeps on trying, whatever went wrong
+            assert received.get(timeout=5) == "first"
+        finally:
+            listener.stop(timeout=5)
+    assert patched.call_count == 3
+    assert f"websocket '{feed_server.url}'" in caplog.text
+
+
+def test_quiet_reconnect(caplog):
+    from WebsocketListener import WebsocketListener
+
+    server = _FeedServer(["message"])
+    server.start()
+    received = queue.Queue()
+    listener = WebsocketListener(
+        server.url, lambda ws, message: received.put(message),
+        quiet_timeout=0.1, min_backoff=0.01, max_backoff=0.02)
+    listener.start()
+    try:
+        # the server goes quiet after one message per connection
+        for _ in range(2):
+            assert received.get(timeout=5) == "message"
+    finally:
+        listener.stop(timeout=5)
+        server.stop()
+
+    assert listener.reconnects >= 1
+    assert f"No messages on websocket '{server.url}' for 0.1 seconds" in caplog.text
+
+
+def test_backoff():
+    from WebsocketListener import WebsocketListener
+
+    listener = WebsocketListener("ws://example.com/", None, min_backoff=1, max_backoff=60)
+    for attempt, limit in [(0, 1), (1, 2), (3, 8), (6, 60), (20, 60)]:
+        assert limit / 2 <= listener._backoff(attempt) <= limit